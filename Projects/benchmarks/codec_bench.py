@@ -0,0 +1,157 @@
+"""
+Task/result encoding benchmark: JSON stored several times vs distributed.codec stored once.
+
+For a subtask of a distributed batch (one image) and for a legacy multi-image
+task, reports the bytes written to Redis per task and the encode/decode time
+of its payloads with:
+
+  - json       previous format: task data as JSON in the hash; the result as
+               JSON in the hash, again inside the image_results entry and
+               again inside the job results entry
+  - codec      versioned payloads (distributed.codec) written once, in the
+               hash; the result feed and the job results list only hold ids
+               (msgpack when installed, zlib above TASK_COMPRESS_THRESHOLD)
+  - codec-json the same without msgpack (what runs if it is not installed)
+
+Usage:
+    python benchmarks/codec_bench.py
+    python benchmarks/codec_bench.py --images 50 --repeat 2000
+
+No Redis needed: the payloads are built and sized in process, exactly as the
+queue writes them.
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from distributed import codec  # noqa: E402
+
+FILTERS = ['resize', 'blur', 'sharpen']
+
+
+def image_result(index: int, worker_id: str = 'worker-2') -> dict:
+    """Result of one image as built by DistributedImageWorker._run_task."""
+    path = f'static/images/photo_{index:04d}.jpg'
+    return {
+        'image_path': path,
+        'filters_applied': FILTERS,
+        'filter_results': {
+            'filter_results': [
+                {
+                    'filter': name,
+                    'success': True,
+                    'processing_time': 0.0123 + stage / 1000,
+                    'original_size': [3840, 2160],
+                    'new_size': [800, 600],
+                    'output_path': f'static/processed/photo_{index:04d}_{"-".join(FILTERS)}.jpg' if stage == 2 else None
+                }
+                for stage, name in enumerate(FILTERS)
+            ],
+            'filters_applied': FILTERS,
+            'output_path': f'static/processed/photo_{index:04d}_{"-".join(FILTERS)}.jpg',
+            'fused': True
+        },
+        'cache_hit': False,
+        'worker_id': worker_id,
+        'processing_time': 0.4172
+    }
+
+
+def task_payloads(images: int):
+    """(task data, result) of a task processing `images` images."""
+    data = {
+        'filters': FILTERS,
+        'filter_params': {'resize': {'width': 800, 'height': 600}, 'blur': {'radius': 2}},
+        'distributed': True,
+        'images': [f'static/images/photo_{index:04d}.jpg' for index in range(images)]
+    }
+    results = [image_result(index) for index in range(images)]
+    result = {
+        'worker_id': 'worker-2',
+        'worker_type': 'docker',
+        'results': results,
+        'total_processing_time': 0.4172 * images,
+        'images_processed': images,
+        'images_successful': images,
+        'images_failed': 0,
+        'filters_applied': FILTERS
+    }
+    return data, result
+
+
+def stored_bytes_json(task_id: str, data: dict, result: dict, subtask: bool) -> int:
+    """Bytes of the payloads the previous format wrote for one task."""
+    total = len(json.dumps(data).encode())                      # hash 'data'
+    total += len(json.dumps(result).encode())                   # hash 'result'
+    total += len(json.dumps({'task_id': task_id, 'result': result,
+                             'completed_at': time.time()}).encode())   # image_results entry
+    if subtask:
+        total += len(json.dumps({'task_id': task_id, 'status': 'completed',
+                                 'result': result}).encode())          # job results entry
+    return total
+
+
+def stored_bytes_codec(task_id: str, data: dict, result: dict, subtask: bool, use_msgpack: bool) -> int:
+    """Bytes of the payloads the codec format writes for one task."""
+    total = len(codec.encode(data, use_msgpack)) + len(codec.encode(result, use_msgpack))
+    total += len(task_id)                                       # image_results entry
+    if subtask:
+        total += len(task_id)                                   # job results entry
+    return total
+
+
+def timed(function, repeat: int) -> float:
+    """Microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def measure(name: str, images: int, subtask: bool, repeat: int):
+    task_id = str(uuid.uuid4())
+    data, result = task_payloads(images)
+
+    rows = []
+    json_bytes = stored_bytes_json(task_id, data, result, subtask)
+    encoded = json.dumps(result)
+    rows.append(('json', json_bytes,
+                 timed(lambda: (json.dumps(data), json.dumps(result), json.dumps(result), json.dumps(result)), repeat),
+                 timed(lambda: json.loads(encoded), repeat)))
+
+    variants = [('codec', True), ('codec-json', False)] if codec.msgpack is not None else [('codec-json', False)]
+    for label, use_msgpack in variants:
+        payload = codec.encode(result, use_msgpack)
+        rows.append((label, stored_bytes_codec(task_id, data, result, subtask, use_msgpack),
+                     timed(lambda: (codec.encode(data, use_msgpack), codec.encode(result, use_msgpack)), repeat),
+                     timed(lambda: codec.decode(payload), repeat)))
+
+    print(f"\n{name}")
+    print(f"{'format':<12} {'bytes/task':>11} {'vs json':>8} {'encode µs':>10} {'decode µs':>10}")
+    for label, size, encode_us, decode_us in rows:
+        print(f"{label:<12} {size:>11,} {size / json_bytes:>7.0%} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=20, help='images in the multi-image task')
+    parser.add_argument('--repeat', type=int, default=5000)
+    args = parser.parse_args()
+
+    backend = 'msgpack' if codec.msgpack is not None else 'JSON (msgpack not installed)'
+    print(f"📦 Payload encoding benchmark - codec v{codec.FORMAT_VERSION}, {backend}, "
+          f"zlib above {codec.COMPRESS_THRESHOLD} bytes")
+    print("   encode = every payload the format writes per task, decode = reading the result once")
+
+    measure("Subtask of a distributed batch (1 image)", 1, True, args.repeat)
+    measure(f"Task with {args.images} images", args.images, False, max(1, args.repeat // args.images))
+
+
+if __name__ == "__main__":
+    main()
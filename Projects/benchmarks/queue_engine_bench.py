@@ -0,0 +1,118 @@
+"""
+Queue engine benchmark: list engine vs Redis Streams engine (TASK_QUEUE_ENGINE).
+
+For each engine, enqueues --tasks tasks (enqueue_many) and drains them with
+--workers threads doing get_tasks -> complete_task, like DistributedImageWorker
+with no processing (--batch tasks per claim). Reports:
+
+  - enqueue   tasks/s written
+  - drain     tasks/s claimed and acked by all the workers together
+  - p50/p99   latency of a claim (get_tasks round trip, in ms)
+
+Usage:
+    python benchmarks/queue_engine_bench.py                      # Redis on localhost:6379, db 15
+    python benchmarks/queue_engine_bench.py --workers 8 --tasks 20000 --host redis
+    python benchmarks/queue_engine_bench.py --rtt-ms 0.5         # + simulated network latency
+    python benchmarks/queue_engine_bench.py --rtt-ms 0.5 --batch 8   # batched claims
+
+Needs a Redis server >= 7.0 (both engines block on BLMPOP). The selected db
+is FLUSHED before each run: never point it at a db with real data.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+import redis
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from distributed.backend import create_task_queue  # noqa: E402
+from redis_queue_bench import TASK_DATA, add_latency  # noqa: E402
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def drain(queue, worker_id: str, batch: int, latencies: list, finished: dict):
+    """Claim and ack tasks until the queue stays empty for a second."""
+    while True:
+        start = time.perf_counter()
+        tasks = queue.get_tasks(worker_id, batch, timeout=1)
+        if not tasks:
+            return
+        latencies.append(time.perf_counter() - start)
+        for task in tasks:
+            queue.complete_task(task['id'], {'success': True, 'processed': 1}, worker_id)
+        finished[worker_id] = time.perf_counter()
+
+
+def run(engine: str, client, tasks: int, workers: int, batch: int = 1) -> dict:
+    """Enqueue then drain `tasks` tasks with `workers` threads; return the measurements."""
+    client.flushdb()
+    queue = create_task_queue(redis_client=client, engine=engine)
+    queue.single_flight = False  # every task is TASK_DATA: measure delivery, not dedupe
+
+    start = time.perf_counter()
+    queue.enqueue_many([TASK_DATA] * tasks)
+    enqueue_rate = tasks / (time.perf_counter() - start)
+
+    latencies, finished = [[] for _ in range(workers)], {}
+    threads = [threading.Thread(target=drain, args=(create_task_queue(redis_client=client, engine=engine),
+                                                    f'bench-worker-{index}', batch, latencies[index], finished))
+               for index in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Up to the last ack: the final empty claim of each worker only waits out its timeout
+    elapsed = max(finished.values(), default=start) - start
+    latencies = [latency for worker in latencies for latency in worker]
+
+    completed = queue.get_queue_stats()['status_breakdown']['completed']
+    client.flushdb()
+    return {
+        'enqueue': enqueue_rate,
+        'drain': completed / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50) * 1000 if latencies else 0.0,
+        'p99': percentile(latencies, 0.99) * 1000 if latencies else 0.0,
+        'completed': completed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=1, help='tasks per claim (get_tasks)')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help='simulated latency per round trip')
+    args = parser.parse_args()
+
+    client = redis.Redis(host=args.host, port=args.port, db=args.db, decode_responses=True,
+                         max_connections=args.workers + 4)
+    if args.rtt_ms:
+        add_latency(client, args.rtt_ms / 1000)
+    client.ping()
+    target = f'redis://{args.host}:{args.port}/{args.db}'
+    if args.rtt_ms:
+        target += f" (+{args.rtt_ms}ms simulated RTT)"
+    print(f"📊 Queue engine benchmark - {args.tasks} tasks, {args.workers} workers "
+          f"(batch {args.batch}) against {target}\n")
+
+    print(f"{'engine':<8} {'enqueue/s':>10} {'drain/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'completed':>10}")
+    for engine in ('list', 'streams'):
+        result = run(engine, client, args.tasks, args.workers, args.batch)
+        print(f"{engine:<8} {result['enqueue']:>10,.0f} {result['drain']:>10,.0f} "
+              f"{result['p50']:>8.2f} {result['p99']:>8.2f} {result['completed']:>10,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Redis queue benchmark: legacy round trips vs pipelined/Lua transitions.
+
+Measures ops/sec for enqueue, claim (get_task) and complete with the
+original implementation (2-3 round trips per transition) and the current
+DistributedTaskQueue (one atomic round trip per transition).
+
+Usage:
+    python benchmarks/redis_queue_bench.py                 # Redis on localhost:6379, db 15
+    python benchmarks/redis_queue_bench.py --fake          # in-process fakeredis
+    python benchmarks/redis_queue_bench.py --fake --rtt-ms 0.5   # + simulated network latency
+    python benchmarks/redis_queue_bench.py --tasks 5000 --host redis
+
+The selected db is FLUSHED before each run: never point it at a db with real data.
+fakeredis has no network latency, so it understates the gain of saving round
+trips; --rtt-ms adds a fixed delay per round trip to model a networked Redis.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import redis
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from distributed.redis_queue import DistributedTaskQueue  # noqa: E402
+
+
+class LegacyTaskQueue(DistributedTaskQueue):
+    """Original implementation: separate, non-atomic commands per transition."""
+
+    @staticmethod
+    def _to_hash(task):
+        return {k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) for k, v in task.items()}
+
+    def enqueue_task(self, task_data):
+        task_id = str(time.time_ns())
+        task = {
+            'id': task_id,
+            'data': task_data,
+            'status': 'pending',
+            'created_at': time.time(),
+            'worker_id': None,
+            'started_at': None,
+            'completed_at': None
+        }
+        self.redis_client.lpush(self.task_queue, json.dumps(task))
+        self.redis_client.hset(f'task:{task_id}', mapping=self._to_hash(task))
+        return task_id
+
+    def get_task(self, worker_id, timeout=5, capabilities=None):
+        result = self.redis_client.brpop(self.task_queue, timeout=timeout)
+        if not result:
+            return None
+        task = json.loads(result[1])
+        task['status'] = 'processing'
+        task['worker_id'] = worker_id
+        task['started_at'] = time.time()
+        self.redis_client.hset(f"task:{task['id']}", mapping=self._to_hash(task))
+        return task
+
+    def complete_task(self, task_id, result):
+        task_key = f'task:{task_id}'
+        if self.redis_client.hgetall(task_key):
+            self.redis_client.hset(task_key, mapping={
+                'status': 'completed',
+                'completed_at': str(time.time()),
+                'result': json.dumps(result)
+            })
+            self.redis_client.lpush(self.result_queue, json.dumps({
+                'task_id': task_id,
+                'result': result,
+                'completed_at': time.time()
+            }))
+
+
+ROUND_TRIPS = {
+    'LegacyTaskQueue': {'enqueue': 2, 'claim': 2, 'complete': 3},
+    'DistributedTaskQueue': {'enqueue': 1, 'claim': 1, 'complete': 1},
+}
+
+TASK_DATA = {
+    'filters': ['resize', 'blur'],
+    'filter_params': {'resize': {'width': 800, 'height': 600}},
+    'images': ['static/images/sample_4k.jpg'],
+    'distributed': True
+}
+
+
+def make_client(args):
+    if args.fake:
+        import fakeredis
+        client = fakeredis.FakeRedis(decode_responses=True)
+    else:
+        client = redis.Redis(host=args.host, port=args.port, db=args.db, decode_responses=True)
+
+    if args.rtt_ms:
+        add_latency(client, args.rtt_ms / 1000)
+    return client
+
+
+def add_latency(client, rtt: float):
+    """Sleep `rtt` seconds every time a request is written to the socket (one per round trip)."""
+    base = client.connection_pool.connection_class
+
+    class LatencyConnection(base):
+        def send_packed_command(self, *args, **kwargs):
+            time.sleep(rtt)
+            return super().send_packed_command(*args, **kwargs)
+
+    client.connection_pool.connection_class = LatencyConnection
+    client.connection_pool.disconnect()
+
+
+def run(queue_cls, client, tasks: int):
+    """Run enqueue -> claim -> complete for `tasks` tasks; return ops/sec per phase."""
+    client.flushdb()
+    queue = queue_cls(redis_client=client)
+    queue.single_flight = False  # every task is TASK_DATA: measure transitions, not dedupe
+    rates = {}
+
+    start = time.perf_counter()
+    for _ in range(tasks):
+        queue.enqueue_task(TASK_DATA)
+    rates['enqueue'] = tasks / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    claimed = [queue.get_task('bench-worker', timeout=1) for _ in range(tasks)]
+    rates['claim'] = tasks / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for task in claimed:
+        queue.complete_task(task['id'], {'success': True, 'processed': 1})
+    rates['complete'] = tasks / (time.perf_counter() - start)
+
+    client.flushdb()
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--fake', action='store_true', help='use fakeredis instead of a Redis server')
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help='simulated latency per round trip')
+    args = parser.parse_args()
+
+    client = make_client(args)
+    client.ping()
+    target = 'fakeredis' if args.fake else f'redis://{args.host}:{args.port}/{args.db}'
+    if args.rtt_ms:
+        target += f" (+{args.rtt_ms}ms simulated RTT)"
+    print(f"📊 Redis queue benchmark - {args.tasks} tasks against {target}\n")
+
+    results = {cls.__name__: run(cls, client, args.tasks) for cls in (LegacyTaskQueue, DistributedTaskQueue)}
+
+    print(f"{'phase':<10} {'legacy ops/s':>14} {'RTT':>4} {'current ops/s':>14} {'RTT':>4} {'speedup':>8}")
+    for phase in ('enqueue', 'claim', 'complete'):
+        legacy = results['LegacyTaskQueue'][phase]
+        current = results['DistributedTaskQueue'][phase]
+        print(f"{phase:<10} {legacy:>14,.0f} {ROUND_TRIPS['LegacyTaskQueue'][phase]:>4} "
+              f"{current:>14,.0f} {ROUND_TRIPS['DistributedTaskQueue'][phase]:>4} {current / legacy:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,26 @@
 🌐 Distributed Processing Module
 
 This module contains components for distributed image processing:
-- Redis-based task queue
+- Task queue backends: Redis lists, Redis Streams or in-process (single node)
 - Worker registry with health monitoring
 - Distributed worker implementation
 """
 
 __version__ = "1.0.0"
 
+from .connection import get_redis
+from .backend import TaskQueueBackend, create_task_queue, create_worker_registry
 from .redis_queue import DistributedTaskQueue
+from .streams_queue import StreamsTaskQueue
 from .worker_registry import WorkerRegistry, HeartbeatManager
 
 __all__ = [
+    'get_redis',
+    'TaskQueueBackend',
+    'create_task_queue',
+    'create_worker_registry',
     'DistributedTaskQueue',
+    'StreamsTaskQueue',
     'WorkerRegistry', 
     'HeartbeatManager'
 ]
\ No newline at end of file
@@ -0,0 +1,225 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Task queue backends: the task/status API the API views and
+# DistributedImageWorker use, whatever carries the tasks.
+#
+#   list     DistributedTaskQueue (distributed/redis_queue.py): Redis lists + Lua
+#   streams  StreamsTaskQueue (distributed/streams_queue.py): Redis Streams consumer groups
+#   local    QueueManager (workers/queue_manager.py): multiprocessing queues between
+#            the API process and LOCAL_WORKERS worker processes it starts itself
+#            (workers/local_cluster.py), for single-node deployments and tests
+#
+# Every backend keeps the same task semantics: pending -> processing ->
+# completed/failed, jobs fanned out into one subtask per image with
+# total/done/failed counters, retries past the visibility timeout and
+# results read back with get_task_status / get_job_results / watch_tasks.
+
+QUEUE_ENGINES = ('list', 'streams', 'local')
+
+
+class TaskQueueBackend(ABC):
+    """
+    Task queue interface shared by the queue engines.
+
+    Backends also expose `visibility_timeout` (seconds before an unacked
+    task is retried) and `result_ttl` (seconds finished tasks are kept,
+    0 = keep), which the worker's maintenance loop reads.
+    """
+
+    # Tasks can be dispatched to a worker's own queue (see distributed.scheduler)
+    supports_dispatch = False
+
+    @abstractmethod
+    def ping(self) -> bool:
+        """Check that the backend is reachable."""
+
+    def enqueue_task(self, task_data: Dict, priority=2) -> str:
+        """
+        Enqueue a new image processing task.
+
+        Args:
+            task_data: Dictionary containing task information
+            priority: 1/'high', 2/'normal' or 3/'low'
+
+        Returns:
+            task_id: Unique identifier for the task
+        """
+        return self.enqueue_many([task_data], priority)[0]
+
+    @abstractmethod
+    def enqueue_many(self, tasks: List[Dict], priority=2) -> List[str]:
+        """Enqueue many tasks in one go; returns their ids in the order of `tasks`."""
+
+    def enqueue_job(self, task_data: Dict, images: List[str], priority=2) -> str:
+        """
+        Fan a batch out into one subtask per image under a parent job.
+
+        Workers pull the subtasks independently. The parent keeps
+        total/done/failed counters, so get_task_status(job_id) reports
+        progress without reading the subtasks; per-image results are
+        collected by get_job_results().
+
+        Args:
+            task_data: Task information shared by every image (filters, params)
+            images: Image paths, one subtask each
+            priority: Lane of every subtask (1/'high', 2/'normal' or 3/'low')
+
+        Returns:
+            job_id: Identifier of the parent job
+        """
+        return self.enqueue_jobs([{'task_data': task_data, 'images': images, 'priority': priority}])[0]
+
+    @abstractmethod
+    def enqueue_jobs(self, jobs: List[Dict]) -> List[str]:
+        """
+        Enqueue many jobs (see enqueue_job).
+
+        Args:
+            jobs: Dictionaries with 'task_data', 'images', optional 'priority'
+                  and optional 'workers' (one target worker id per image, only
+                  used by backends with supports_dispatch)
+
+        Returns:
+            Job ids, in the order of `jobs`
+        """
+
+    @abstractmethod
+    def get_task(self, worker_id: str, timeout: int = 5, capabilities: List[str] = None) -> Optional[Dict]:
+        """Claim the next task for a worker (blocking up to `timeout` seconds), or None."""
+
+    def get_tasks(self, worker_id: str, max_n: int, timeout: int = 5,
+                  capabilities: List[str] = None) -> List[Dict]:
+        """
+        Claim up to `max_n` tasks, blocking (up to `timeout` seconds) only for the first.
+
+        Backends with a cheaper batched claim override this.
+        """
+        tasks = []
+        while len(tasks) < max_n:
+            task = self.get_task(worker_id, timeout if not tasks else 0, capabilities)
+            if task is None:
+                break
+            tasks.append(task)
+        return tasks
+
+    @abstractmethod
+    def complete_task(self, task_id: str, result: Dict, worker_id: str = None):
+        """Mark a task as completed and store its result (acks the task)."""
+
+    @abstractmethod
+    def fail_task(self, task_id: str, error: str, worker_id: str = None):
+        """Mark a task as failed (acks the task)."""
+
+    def touch_task(self, task_id: str) -> bool:
+        """Extend the visibility deadline of an in-flight task."""
+        return True
+
+    def touch_tasks(self, task_ids: List[str]) -> int:
+        """Extend the visibility deadline of many in-flight tasks; returns how many were extended."""
+        return sum(1 for task_id in task_ids if self.touch_task(task_id))
+
+    @abstractmethod
+    def get_task_status(self, task_id: str) -> Optional[Dict]:
+        """Task (or job) fields with 'data' and 'result' decoded, or None if not found."""
+
+    @abstractmethod
+    def get_job_results(self, job_id: str) -> List[Dict]:
+        """Results of the finished subtasks of a job, in completion order."""
+
+    @abstractmethod
+    def watch_tasks(self, task_ids: List[str], timeout: float) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Yield (task_id, status) as each task finishes.
+
+        Tasks already finished (and unknown ids, with status None) are
+        yielded first. Stops when every task has been yielded or after
+        `timeout` seconds; tasks still running then are not yielded.
+        """
+
+    def wait_for_task(self, task_id: str, timeout: float) -> Optional[Dict]:
+        """
+        Block until a task (or job) finishes or `timeout` seconds pass.
+
+        Returns:
+            Task status dictionary (finished or not) or None if not found
+        """
+        for _, task_data in self.watch_tasks([task_id], timeout):
+            return task_data
+        return self.get_task_status(task_id)
+
+    @abstractmethod
+    def get_queue_stats(self) -> Dict:
+        """
+        Queue statistics: queue_length, lanes (queued tasks per priority
+        lane), queues (by route), dispatched, in_flight, total_tasks and
+        status_breakdown.
+        """
+
+    def requeue_expired_tasks(self, limit: int = 100) -> Dict[str, int]:
+        """Re-enqueue in-flight tasks whose visibility timeout expired."""
+        return {'requeued': 0, 'failed': 0}
+
+    def requeue_worker_tasks(self, worker_id: str) -> Dict[str, int]:
+        """Re-enqueue every task a worker claimed and did not ack."""
+        return {'requeued': 0, 'failed': 0}
+
+    def release_tasks(self, worker_id: str, task_ids: List[str]) -> int:
+        """Put tasks a worker claimed but never started back in their queues, without counting a retry."""
+        return 0
+
+    def release_dispatched_tasks(self, worker_id: str) -> int:
+        """Move the tasks dispatched to a worker back to the shared queues."""
+        return 0
+
+    def release_orphaned_dispatch(self, active_worker_ids: List[str]) -> int:
+        """Release the dispatch queues of every worker not in `active_worker_ids`."""
+        return 0
+
+    def get_dispatched_lengths(self) -> Dict[str, int]:
+        """Tasks waiting in each worker's dispatch queue, by worker id."""
+        return {}
+
+    def clear_completed_tasks(self, older_than_seconds: int = 3600, batch_size: int = 500) -> int:
+        """Remove finished tasks older than `older_than_seconds`; returns how many."""
+        return 0
+
+
+def queue_engine(engine: str = None) -> str:
+    """Configured queue engine (env TASK_QUEUE_ENGINE, default list)."""
+    engine = engine or os.getenv('TASK_QUEUE_ENGINE', 'list')
+    if engine not in QUEUE_ENGINES:
+        raise ValueError(f"Unknown task queue engine {engine!r}: use one of {QUEUE_ENGINES}")
+    return engine
+
+
+def create_task_queue(redis_host='localhost', redis_port=6379, redis_db=0, redis_client=None,
+                      engine: str = None) -> TaskQueueBackend:
+    """
+    Task queue of the configured engine.
+
+    Args:
+        engine: 'list', 'streams' or 'local' (default: env TASK_QUEUE_ENGINE, list).
+                'local' returns the queue of this process's local cluster,
+                starting it on first use; the Redis arguments are ignored.
+    """
+    engine = queue_engine(engine)
+    if engine == 'local':
+        from workers.local_cluster import get_local_cluster
+        return get_local_cluster().queue
+    if engine == 'streams':
+        from .streams_queue import StreamsTaskQueue
+        return StreamsTaskQueue(redis_host, redis_port, redis_db, redis_client)
+    from .redis_queue import DistributedTaskQueue
+    return DistributedTaskQueue(redis_host, redis_port, redis_db, redis_client)
+
+
+def create_worker_registry(redis_host='localhost', redis_port=6379, redis_db=0, redis_client=None,
+                           engine: str = None):
+    """Worker registry matching the queue engine (the local cluster's for 'local')."""
+    if queue_engine(engine) == 'local':
+        from workers.local_cluster import get_local_cluster
+        return get_local_cluster().registry
+    from .worker_registry import WorkerRegistry
+    return WorkerRegistry(redis_host, redis_port, redis_db, redis_client)
@@ -0,0 +1,63 @@
+import json
+import os
+import zlib
+from typing import Any, Union
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON is used when msgpack is not installed
+    msgpack = None
+
+# Versioned payload encoding for task data and results stored in Redis.
+#
+# A payload is a 2-byte header followed by the body:
+#   byte 0: format version (FORMAT_VERSION)
+#   byte 1: flags - FLAG_MSGPACK (body is msgpack, else compact UTF-8 JSON)
+#                   FLAG_ZLIB    (body is zlib-compressed)
+# Bodies larger than COMPRESS_THRESHOLD bytes are compressed when that makes
+# them smaller. Values written before this format existed are plain JSON
+# text, whose first byte is never FORMAT_VERSION, and still decode.
+
+FORMAT_VERSION = 1
+FLAG_MSGPACK = 0x01
+FLAG_ZLIB = 0x02
+
+COMPRESS_THRESHOLD = int(os.getenv('TASK_COMPRESS_THRESHOLD', 1024))  # bytes
+COMPRESS_LEVEL = 1  # fastest: results are written once per task, on the worker's hot path
+
+
+def encode(value: Any, use_msgpack: bool = True) -> bytes:
+    """Encode a JSON-compatible value as a versioned payload."""
+    flags = 0
+    if use_msgpack and msgpack is not None:
+        body = msgpack.packb(value, use_bin_type=True)
+        flags |= FLAG_MSGPACK
+    else:
+        body = json.dumps(value, separators=(',', ':')).encode()
+
+    if len(body) > COMPRESS_THRESHOLD:
+        compressed = zlib.compress(body, COMPRESS_LEVEL)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+
+    return bytes((FORMAT_VERSION, flags)) + body
+
+
+def decode(payload: Union[bytes, str, None]) -> Any:
+    """Decode a payload written by encode() or a legacy JSON string."""
+    if payload is None or payload == b'' or payload == '':
+        return None
+    if isinstance(payload, str):
+        return json.loads(payload)
+    if payload[0] != FORMAT_VERSION:
+        return json.loads(payload)
+
+    flags, body = payload[1], payload[2:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("Payload is msgpack-encoded but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
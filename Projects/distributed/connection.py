@@ -0,0 +1,144 @@
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import redis
+
+# One connection pool per (host, port, db) and process, created on first use.
+# API views build a DistributedTaskQueue / WorkerRegistry per request; with a
+# shared pool they reuse open sockets instead of connecting on every request.
+#
+# Fork safety: pools are dropped in a forked child (gunicorn workers,
+# multiprocessing), so parent and child never share a socket.
+#
+# Pub/sub watchers (task_status?wait, task_events) hold a connection for as
+# long as they wait, so they get their own smaller pool: a burst of
+# long-polls can never starve the request pool, and a full watcher pool
+# fails at once with WatcherLimitError instead of blocking.
+
+MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))  # seconds
+MAX_WATCHERS = int(os.getenv('REDIS_MAX_WATCHERS', 20))  # concurrent pub/sub waiters per process and server
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Bounded pool that blocks up to `timeout` seconds when every connection is
+    in use, and counts how often a caller had to wait.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.waits = 0
+
+    def get_connection(self, *args, **kwargs):
+        if self.pool.empty():
+            self.waits += 1
+        return super().get_connection(*args, **kwargs)
+
+    def stats(self) -> Dict:
+        """Connections created, idle and in use, and waits for a free one."""
+        created = len(self._connections)
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        return {
+            'max_connections': self.max_connections,
+            'created': created,
+            'in_use': created - idle,
+            'idle': idle,
+            'waits': self.waits
+        }
+
+
+class WatcherLimitError(redis.ConnectionError):
+    """Every watcher connection is in use (REDIS_MAX_WATCHERS)."""
+
+
+class WatcherConnectionPool(InstrumentedConnectionPool):
+    """Pool of the pub/sub watchers: never waits for a free connection."""
+
+    def get_connection(self, *args, **kwargs):
+        try:
+            return super().get_connection(*args, **kwargs)
+        except redis.ConnectionError as e:
+            if self.pool.empty():
+                raise WatcherLimitError(f"All {self.max_connections} watcher connections are in use") from e
+            raise
+
+
+_pools: Dict[Tuple[str, int, int], InstrumentedConnectionPool] = {}
+_watch_pools: Dict[Tuple[str, int, int], WatcherConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _pools_lock
+    _pools.clear()
+    _watch_pools.clear()
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_or_create(pools: Dict, pool_class, host: str, port: int, db: int, max_connections: int,
+                   timeout: float) -> InstrumentedConnectionPool:
+    host = host or os.getenv('REDIS_HOST', 'localhost')
+    port = int(port or os.getenv('REDIS_PORT', 6379))
+    key = (host, port, int(db))
+    pool = pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = pools.get(key)
+            if pool is None:
+                pool = pool_class(
+                    host=host,
+                    port=port,
+                    db=db,
+                    decode_responses=True,
+                    max_connections=max_connections,
+                    timeout=timeout,
+                    health_check_interval=HEALTH_CHECK_INTERVAL,
+                    socket_keepalive=True
+                )
+                pools[key] = pool
+    return pool
+
+
+def get_pool(host: str = None, port: int = None, db: int = 0) -> InstrumentedConnectionPool:
+    """Process-wide pool for a Redis server (REDIS_HOST / REDIS_PORT by default)."""
+    return _get_or_create(_pools, InstrumentedConnectionPool, host, port, db, MAX_CONNECTIONS, POOL_TIMEOUT)
+
+
+def get_watch_pool(host: str = None, port: int = None, db: int = 0) -> WatcherConnectionPool:
+    """Process-wide pool of the pub/sub watchers of a Redis server (see get_watch_redis)."""
+    return _get_or_create(_watch_pools, WatcherConnectionPool, host, port, db, MAX_WATCHERS, 0)
+
+
+def get_redis(host: str = None, port: int = None, db: int = 0) -> redis.Redis:
+    """
+    Redis client backed by the shared pool.
+
+    Clients are cheap: they hold no socket, each command borrows a
+    connection from the pool and gives it back.
+    """
+    return redis.Redis(connection_pool=get_pool(host, port, db))
+
+
+def get_watch_redis(host: str = None, port: int = None, db: int = 0) -> redis.Redis:
+    """
+    Redis client for long-lived pub/sub subscriptions, backed by the watcher
+    pool: opening one raises WatcherLimitError when REDIS_MAX_WATCHERS
+    subscriptions are already open in this process.
+    """
+    return redis.Redis(connection_pool=get_watch_pool(host, port, db))
+
+
+def pool_stats() -> List[Dict]:
+    """Stats of every pool created in this process (`kind`: requests or watchers)."""
+    return [
+        {'host': host, 'port': port, 'db': db, 'kind': kind, **pool.stats()}
+        for kind, pools in (('requests', _pools), ('watchers', _watch_pools))
+        for (host, port, db), pool in list(pools.items())
+    ]
@@ -1,127 +1,962 @@
-import redis
+import os
 import json
 import uuid
 import time
+import hashlib
 from typing import Dict, List, Optional
 
-class DistributedTaskQueue:
+from redis.client import NEVER_DECODE
+from redis.exceptions import NoScriptError
+
+from . import codec
+from .backend import TaskQueueBackend, create_task_queue
+from .connection import get_redis, get_watch_redis
+
+# Lua scripts: each task state transition is one atomic round trip.
+# Redis runs a script without interleaving other commands, so no client can
+# observe a task popped from the queue but not yet marked as processing.
+#
+# Reliable queue: the queue list only holds task ids (the task lives in its
+# hash). Claiming moves the id into a per-worker processing list and adds it
+# to the in-flight zset scored by its visibility deadline. Ack (complete/fail)
+# removes it from both; a reaper re-enqueues tasks whose deadline expired.
+#
+# Jobs: a batch is fanned out into one subtask per image under a parent job
+# hash (kind=job). Finishing a subtask bumps the parent's done/failed counters
+# and appends its id to the job results list in the same script, so job
+# progress is read from the parent without touching the subtasks.
+#
+# Payloads: task data and results are stored once, in the task hash, encoded
+# by distributed.codec (versioned msgpack/JSON, zlib above a threshold). The
+# result feed and the job results lists only hold task ids.
+#
+# Routing: tasks are queued by the set of filters they need, one list per
+# set (image_tasks:route:blur+resize). A worker claims only from the routes
+# its capabilities cover. Each route has a <route>:ready list with at most one
+# token per queued id: blocked workers BLMPOP the tokens of their routes
+# (Redis has no multi-key blocking wait that leaves the ids in place) and
+# then claim normally, so ids never leave Redis outside a script.
+#
+# Priority lanes: every route has a list per lane (high, normal, low). Each
+# claim starts at a lane picked by smooth weighted round robin and falls back
+# to the others by priority, so high priority is served first under load and
+# low priority still gets its share.
+#
+# Dispatch: with scheduled dispatch the API assigns tasks to workers chosen
+# by distributed.scheduler and pushes their ids to the worker's own queue
+# (image_tasks:worker:<id>), which it claims before the shared routes. The
+# task hash keeps its route lane in `queue`, so a requeue sends it back to
+# the shared pool, and the tasks waiting for a dead worker are released there.
+#
+# Notifications: the script that finishes a task (or a job) publishes its
+# final status on image_tasks:events:<id>, so clients wait for completion
+# with SUBSCRIBE instead of polling the task hash.
+#
+# Single-flight: each task hash keeps the fingerprint of its task data and
+# image_tasks:flight:<fingerprint> points at the task computing it. A new task
+# identical to one still pending or processing is not queued: it is bound to
+# that leader (image_tasks:followers:<leader>) and finished with the leader's
+# result or error by the same script that finishes the leader.
+
+TASK_EVENTS_PREFIX = 'image_tasks:events:'
+FLIGHT_PREFIX = 'image_tasks:flight:'
+FOLLOWERS_PREFIX = 'image_tasks:followers:'
+FINISHED_STATUSES = ('completed', 'failed')
+
+UPDATE_PARENT_FUNCTION = """
+-- Tell subscribers that a task (or job) reached its final status
+local function notify(task_id, status)
+    redis.call('PUBLISH', '""" + TASK_EVENTS_PREFIX + """' .. task_id, status)
+end
+
+-- Account a finished subtask in its parent job (no-op for standalone tasks)
+local function update_parent(task_key, task_id, field, now, ttl, task_prefix, finished_key, results_prefix)
+    local parent_id = redis.call('HGET', task_key, 'parent_id')
+    if not parent_id then
+        return
+    end
+    local parent_key = task_prefix .. parent_id
+    if redis.call('EXISTS', parent_key) == 0 then
+        return
+    end
+    local results_key = results_prefix .. parent_id
+    redis.call('RPUSH', results_key, task_id)
+    redis.call('HINCRBY', parent_key, field, 1)
+    local job = redis.call('HMGET', parent_key, 'total', 'done', 'failed')
+    local done, failed = tonumber(job[2]), tonumber(job[3])
+    if done + failed < tonumber(job[1]) then
+        return
+    end
+    local status = done > 0 and 'completed' or 'failed'
+    redis.call('HSET', parent_key, 'status', status, 'completed_at', now)
+    redis.call('ZADD', finished_key, now, parent_id)
+    if tonumber(ttl) > 0 then
+        redis.call('EXPIRE', parent_key, ttl)
+        redis.call('EXPIRE', results_key, ttl)
+    end
+    notify(parent_id, status)
+end
+
+-- Finish the duplicates bound to a finished task with its outcome and close its flight
+local function settle_followers(task_key, task_id, status, now, ttl, task_prefix, stats_key, finished_key,
+                                results_prefix)
+    local fingerprint = redis.call('HGET', task_key, 'fingerprint')
+    if not fingerprint then
+        return
+    end
+    local flight_key = '""" + FLIGHT_PREFIX + """' .. fingerprint
+    if redis.call('GET', flight_key) == task_id then
+        redis.call('DEL', flight_key)
+    end
+    local followers_key = '""" + FOLLOWERS_PREFIX + """' .. task_id
+    local field = status == 'completed' and 'result' or 'error'
+    local outcome = redis.call('HGET', task_key, field) or ''
+    for _, follower_id in ipairs(redis.call('LRANGE', followers_key, 0, -1)) do
+        local follower_key = task_prefix .. follower_id
+        if redis.call('HGET', follower_key, 'status') == 'pending' then
+            redis.call('HSET', follower_key, 'status', status, 'completed_at', now, field, outcome)
+            update_parent(follower_key, follower_id, status == 'completed' and 'done' or 'failed',
+                          now, ttl, task_prefix, finished_key, results_prefix)
+            redis.call('HINCRBY', stats_key, 'pending', -1)
+            redis.call('HINCRBY', stats_key, status, 1)
+            redis.call('ZADD', finished_key, now, follower_id)
+            if tonumber(ttl) > 0 then
+                redis.call('EXPIRE', follower_key, ttl)
+            end
+            notify(follower_id, status)
+        end
+    end
+    redis.call('DEL', followers_key)
+end
+"""
+
+CLAIM_TASK_SCRIPT = """
+-- KEYS[1] = worker processing list, KEYS[2] = in-flight zset, KEYS[3] = stats hash,
+-- KEYS[4..n] = task queues in claim order
+-- ARGV[1] = task hash prefix, ARGV[2] = worker id, ARGV[3] = started_at,
+-- ARGV[4] = visibility deadline, ARGV[5] = max tasks to claim
+-- Returns id, data, retries of each claimed task, flattened
+local max_claimed = 3 * tonumber(ARGV[5])
+local claimed = {}
+local stale = 0
+for i = 4, #KEYS do
+    while #claimed < max_claimed and stale < 10 do
+        local task_id = redis.call('LMOVE', KEYS[i], KEYS[1], 'RIGHT', 'LEFT')
+        if not task_id then
+            break
+        end
+        -- Never leave more wake-up tokens than queued ids
+        local remaining = redis.call('LLEN', KEYS[i])
+        if remaining == 0 then
+            redis.call('DEL', KEYS[i] .. ':ready')
+        else
+            redis.call('LTRIM', KEYS[i] .. ':ready', 0, remaining - 1)
+        end
+        local task_key = ARGV[1] .. task_id
+        if redis.call('HGET', task_key, 'status') == 'pending' then
+            redis.call('HSET', task_key, 'status', 'processing', 'worker_id', ARGV[2], 'started_at', ARGV[3])
+            redis.call('ZADD', KEYS[2], ARGV[4], task_id)
+            redis.call('HINCRBY', KEYS[3], 'pending', -1)
+            redis.call('HINCRBY', KEYS[3], 'processing', 1)
+            local parent_id = redis.call('HGET', task_key, 'parent_id')
+            if parent_id and redis.call('HGET', ARGV[1] .. parent_id, 'status') == 'pending' then
+                redis.call('HSET', ARGV[1] .. parent_id, 'status', 'processing', 'started_at', ARGV[3])
+            end
+            claimed[#claimed + 1] = task_id
+            claimed[#claimed + 1] = redis.call('HGET', task_key, 'data')
+            claimed[#claimed + 1] = redis.call('HGET', task_key, 'retries')
+        else
+            -- Stale id: task finished after being re-enqueued, or its hash is gone
+            redis.call('LREM', KEYS[1], 1, task_id)
+            stale = stale + 1
+        end
+    end
+end
+return claimed
+"""
+
+# Shared ack prologue: drop the task from the in-flight zset and from the
+# processing lists of its owner and of the acking worker (they differ if the
+# task was re-enqueued and claimed again while the first worker was slow).
+# finish() moves the status counters, indexes the task by finish time and
+# sets the TTL of its hash, then publishes the final status.
+ACK_PROLOGUE = UPDATE_PARENT_FUNCTION + """
+-- KEYS[1] = task hash, KEYS[2] = in-flight zset, KEYS[3] = stats hash, KEYS[4] = finished zset
+-- ARGV[1] = task id, ARGV[2] = processing list prefix, ARGV[3] = acking worker id,
+-- ARGV[4] = finished_at, ARGV[5] = TTL of finished task hashes (0 = keep),
+-- ARGV[6] = task hash prefix, ARGV[7] = job results prefix
+local status = redis.call('HGET', KEYS[1], 'status')
+if not status then
+    return 0
+end
+local owner = redis.call('HGET', KEYS[1], 'worker_id')
+redis.call('ZREM', KEYS[2], ARGV[1])
+if owner then
+    redis.call('LREM', ARGV[2] .. owner, 1, ARGV[1])
+end
+if ARGV[3] ~= '' and ARGV[3] ~= owner then
+    redis.call('LREM', ARGV[2] .. ARGV[3], 1, ARGV[1])
+end
+if status == 'completed' or status == 'failed' then
+    return 0
+end
+local function finish(new_status)
+    update_parent(KEYS[1], ARGV[1], new_status == 'completed' and 'done' or 'failed',
+                  ARGV[4], ARGV[5], ARGV[6], KEYS[4], ARGV[7])
+    settle_followers(KEYS[1], ARGV[1], new_status, ARGV[4], ARGV[5], ARGV[6], KEYS[3], KEYS[4], ARGV[7])
+    redis.call('HINCRBY', KEYS[3], status, -1)
+    redis.call('HINCRBY', KEYS[3], new_status, 1)
+    redis.call('ZADD', KEYS[4], ARGV[4], ARGV[1])
+    if tonumber(ARGV[5]) > 0 then
+        redis.call('EXPIRE', KEYS[1], ARGV[5])
+    end
+    notify(ARGV[1], new_status)
+end
+"""
+
+COMPLETE_TASK_SCRIPT = ACK_PROLOGUE + """
+-- KEYS[5] = result feed (ids of completed tasks, newest first)
+-- ARGV[8] = encoded result, ARGV[9] = max length of the result feed
+redis.call('HSET', KEYS[1], 'status', 'completed', 'completed_at', ARGV[4], 'result', ARGV[8])
+redis.call('LPUSH', KEYS[5], ARGV[1])
+redis.call('LTRIM', KEYS[5], 0, tonumber(ARGV[9]) - 1)
+finish('completed')
+return 1
+"""
+
+FAIL_TASK_SCRIPT = ACK_PROLOGUE + """
+-- ARGV[8] = error message
+redis.call('HSET', KEYS[1], 'status', 'failed', 'completed_at', ARGV[4], 'error', ARGV[8])
+finish('failed')
+return 1
+"""
+
+REQUEUE_FUNCTION = UPDATE_PARENT_FUNCTION + """
+-- KEYS[1] = in-flight zset, KEYS[2] = unrouted task queue, KEYS[3] = stats hash, KEYS[4] = finished zset
+-- ARGV[1] = now, ARGV[2] = task hash prefix, ARGV[3] = processing list prefix,
+-- ARGV[4] = max retries, ARGV[5] = TTL of finished task hashes (0 = keep),
+-- ARGV[6] = job results prefix
+-- A task released by its worker before starting (count_retry false) keeps its retries
+local function requeue(task_id, expected_owner, count_retry)
+    local task_key = ARGV[2] .. task_id
+    local owner = redis.call('HGET', task_key, 'worker_id')
+    if expected_owner and owner ~= expected_owner then
+        return 0
+    end
+    redis.call('ZREM', KEYS[1], task_id)
+    if owner then
+        redis.call('LREM', ARGV[3] .. owner, 1, task_id)
+    end
+    if redis.call('HGET', task_key, 'status') ~= 'processing' then
+        return 0
+    end
+    redis.call('HINCRBY', KEYS[3], 'processing', -1)
+    local retries = count_retry and redis.call('HINCRBY', task_key, 'retries', 1) or 0
+    if retries > tonumber(ARGV[4]) then
+        local error = 'Task lost by its worker ' .. retries .. ' times (visibility timeout expired)'
+        redis.call('HSET', task_key, 'status', 'failed', 'completed_at', ARGV[1], 'error', error)
+        update_parent(task_key, task_id, 'failed', ARGV[1], ARGV[5], ARGV[2], KEYS[4], ARGV[6])
+        settle_followers(task_key, task_id, 'failed', ARGV[1], ARGV[5], ARGV[2], KEYS[3], KEYS[4], ARGV[6])
+        redis.call('HINCRBY', KEYS[3], 'failed', 1)
+        redis.call('ZADD', KEYS[4], ARGV[1], task_id)
+        if tonumber(ARGV[5]) > 0 then
+            redis.call('EXPIRE', task_key, ARGV[5])
+        end
+        notify(task_id, 'failed')
+        return 2
+    end
+    redis.call('HSET', task_key, 'status', 'pending', 'worker_id', 'None', 'started_at', 'None')
+    redis.call('HINCRBY', KEYS[3], 'pending', 1)
+    -- Back to its route (KEYS[2] for tasks queued before routing existed).
+    -- Consumers pop from the right: re-enqueued tasks go first
+    local queue = redis.call('HGET', task_key, 'queue') or KEYS[2]
+    redis.call('RPUSH', queue, task_id)
+    redis.call('LPUSH', queue .. ':ready', 1)
+    return 1
+end
+local counts = {0, 0}
+"""
+
+REQUEUE_EXPIRED_SCRIPT = REQUEUE_FUNCTION + """
+-- ARGV[7] = max tasks per call
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[7]))
+for _, task_id in ipairs(expired) do
+    local outcome = requeue(task_id, false, true)
+    if outcome > 0 then
+        counts[outcome] = counts[outcome] + 1
+    end
+end
+return counts
+"""
+
+REQUEUE_WORKER_SCRIPT = REQUEUE_FUNCTION + """
+-- KEYS[5] = worker processing list, ARGV[7] = worker id
+for _, task_id in ipairs(redis.call('LRANGE', KEYS[5], 0, -1)) do
+    local outcome = requeue(task_id, ARGV[7], true)
+    if outcome > 0 then
+        counts[outcome] = counts[outcome] + 1
+    end
+end
+redis.call('DEL', KEYS[5])
+return counts
+"""
+
+RELEASE_TASKS_SCRIPT = REQUEUE_FUNCTION + """
+-- ARGV[7] = worker id, ARGV[8..n] = ids of tasks it claimed and never started
+local released = 0
+for i = 8, #ARGV do
+    if requeue(ARGV[i], ARGV[7], false) == 1 then
+        released = released + 1
+    end
+end
+return released
+"""
+
+RELEASE_DISPATCHED_SCRIPT = """
+-- KEYS[1] = worker dispatch queue, KEYS[2] = set of workers with a dispatch queue,
+-- KEYS[3] = unrouted task queue
+-- ARGV[1] = task hash prefix, ARGV[2] = worker id
+-- Ids were LPUSHed: walking from the newest with RPUSH leaves the oldest next to pop
+local released = 0
+for _, task_id in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+    local task_key = ARGV[1] .. task_id
+    if redis.call('HGET', task_key, 'status') == 'pending' then
+        local queue = redis.call('HGET', task_key, 'queue') or KEYS[3]
+        redis.call('RPUSH', queue, task_id)
+        redis.call('LPUSH', queue .. ':ready', 1)
+        released = released + 1
+    end
+end
+redis.call('DEL', KEYS[1], KEYS[1] .. ':ready')
+redis.call('SREM', KEYS[2], ARGV[2])
+return released
+"""
+
+# Prepended to SINGLE_FLIGHT_SCRIPT: how the engine queues task ids
+# (the streams engine appends stream entries instead)
+PUSH_IDS_FUNCTION = """
+-- Queue `task_id` on the list `queue` (`maxlen` is only used by stream engines)
+local function push_id(queue, task_id, maxlen)
+    redis.call('LPUSH', queue, task_id)
+end
+"""
+
+# Runs in the enqueue transaction, after the task hashes are written
+SINGLE_FLIGHT_SCRIPT = """
+-- KEYS[1] = stats hash, KEYS[2] = dedupe counters hash, KEYS[3] = routes set,
+-- KEYS[4] = set of workers with a dispatch queue, then per target queue: the queue
+-- and its wake-up tokens (KEYS[5], KEYS[6], KEYS[7], KEYS[8]...)
+-- ARGV[1] = task hash prefix, ARGV[2] = flight TTL (seconds), ARGV[3] = stream MAXLEN,
+-- then per target queue: route, dispatch worker id or '', number of ids, the ids
+-- Binds every task identical to one in flight to its leader and queues the others
+-- (one wake-up token each), so a leader is never visible without being queued.
+-- Returns, per task, the leader it was bound to or '' if it leads its own flight
+local bound = {}
+local hits = 0
+local queued = 0
+local arg = 4
+for k = 5, #KEYS, 2 do
+    local route, worker_id, count = ARGV[arg], ARGV[arg + 1], tonumber(ARGV[arg + 2])
+    local pushed = 0
+    for i = arg + 3, arg + 2 + count do
+        local task_id = ARGV[i]
+        local flight_key = '""" + FLIGHT_PREFIX + """' .. redis.call('HGET', ARGV[1] .. task_id, 'fingerprint')
+        local leader = redis.call('GET', flight_key)
+        local status = leader and redis.call('HGET', ARGV[1] .. leader, 'status')
+        if status == 'pending' or status == 'processing' then
+            redis.call('HSET', ARGV[1] .. task_id, 'follows', leader)
+            redis.call('RPUSH', '""" + FOLLOWERS_PREFIX + """' .. leader, task_id)
+            hits = hits + 1
+            bound[#bound + 1] = leader
+        else
+            redis.call('SET', flight_key, task_id, 'EX', ARGV[2])
+            push_id(KEYS[k], task_id, ARGV[3])
+            redis.call('LPUSH', KEYS[k + 1], 1)
+            pushed = pushed + 1
+            bound[#bound + 1] = ''
+        end
+    end
+    if pushed > 0 then
+        redis.call('SADD', KEYS[3], route)
+        if worker_id ~= '' then
+            redis.call('SADD', KEYS[4], worker_id)
+        end
+    end
+    queued = queued + pushed
+    arg = arg + 3 + count
+end
+-- Bound tasks stay pending until their leader finishes
+redis.call('HINCRBY', KEYS[1], 'pending', hits + queued)
+redis.call('HINCRBY', KEYS[1], 'total', hits + queued)
+redis.call('HINCRBY', KEYS[2], 'checked', #bound)
+redis.call('HINCRBY', KEYS[2], 'hits', hits)
+return bound
+"""
+
+SWEEP_FINISHED_SCRIPT = """
+-- KEYS[1] = finished zset
+-- ARGV[1] = cutoff timestamp, ARGV[2] = task hash prefix, ARGV[3] = max tasks per call,
+-- ARGV[4] = job results prefix
+local finished = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, task_id in ipairs(finished) do
+    redis.call('DEL', ARGV[2] .. task_id, ARGV[4] .. task_id)
+    redis.call('ZREM', KEYS[1], task_id)
+end
+return #finished
+"""
+
+# How often a queue re-reads the set of known routes
+ROUTE_REFRESH_INTERVAL = 5.0
+
+# Same numbering as workers/queue_manager.py: 1 = high, 2 = normal, 3 = low
+PRIORITY_LANES = {1: 'high', 2: 'normal', 3: 'low'}
+DEFAULT_LANE_WEIGHTS = 'high:6,normal:3,low:1'
+
+
+def route_key(filters: List[str]) -> str:
+    """Routing key of a task: its sorted filter set ('none' without filters)."""
+    return '+'.join(sorted(set(filters))) or 'none'
+
+
+def task_fingerprint(task_data: Dict) -> str:
+    """Single-flight key of a task: sha256 of its canonical JSON (filter order is kept)."""
+    canonical = json.dumps(task_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def priority_lane(priority) -> str:
+    """Lane name for a priority given as 1/2/3 or 'high'/'normal'/'low'."""
+    if isinstance(priority, str) and priority.isdigit():
+        priority = int(priority)
+    lane = PRIORITY_LANES.get(priority, priority)
+    if lane not in PRIORITY_LANES.values():
+        raise ValueError(f"Invalid priority {priority!r}: use 1-3 or one of {list(PRIORITY_LANES.values())}")
+    return lane
+
+
+def dedupe_stats(checked: int, hits: int) -> Dict:
+    """Single-flight counters: tasks checked, tasks bound to one in flight and the hit rate (%)."""
+    return {'checked': checked, 'hits': hits, 'hit_rate': round(hits / checked * 100, 2) if checked else 0.0}
+
+
+def lane_schedule(weights: Dict[str, int]) -> List[str]:
+    """One cycle of smooth weighted round robin (high:2,low:1 -> high, low, high)."""
+    current = {lane: 0 for lane in weights}
+    schedule = []
+    for _ in range(sum(weights.values())):
+        for lane, weight in weights.items():
+            current[lane] += weight
+        lane = max(current, key=current.get)
+        current[lane] -= sum(weights.values())
+        schedule.append(lane)
+    return schedule
+
+
+class DistributedTaskQueue(TaskQueueBackend):
     """
     Redis-based distributed task queue for image processing tasks.
     Handles task enqueueing, dequeueing, and status tracking.
     """
     
-    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0):
-        self.redis_client = redis.Redis(
-            host=redis_host, 
-            port=redis_port, 
-            db=redis_db, 
-            decode_responses=True
-        )
+    supports_dispatch = True
+    
+    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0, redis_client=None):
+        self.redis_client = redis_client or get_redis(redis_host, redis_port, redis_db)
+        # Subscriptions of watch_tasks hold a connection while they wait: separate bounded pool
+        self.watch_client = redis_client or get_watch_redis(redis_host, redis_port, redis_db)
         self.task_queue = 'image_tasks'
         self.result_queue = 'image_results'
+        self.task_prefix = 'task:'
+        self.result_feed_length = 10000  # ids kept in the result feed (image_results)
+        self.bulk_chunk_size = 1000  # tasks per MULTI/EXEC in enqueue_many / enqueue_jobs
+        self.processing_prefix = f'{self.task_queue}:processing:'
+        self.inflight_key = f'{self.task_queue}:inflight'
+        # Maintained on every transition so stats and cleanup never scan task:*
+        self.stats_key = f'{self.task_queue}:stats'
+        self.finished_key = f'{self.task_queue}:finished'
+        self.job_results_prefix = f'{self.task_queue}:job_results:'
+        self.route_prefix = f'{self.task_queue}:route:'
+        self.routes_key = f'{self.task_queue}:routes'
+        self.dispatch_prefix = f'{self.task_queue}:worker:'
+        self.dispatch_key = f'{self.task_queue}:dispatch'
+        self.dedupe_key = f'{self.task_queue}:dedupe'
+        self._routes = ()
+        self._routes_loaded_at = 0.0
         
-    def enqueue_task(self, task_data: Dict) -> str:
-        """
-        Enqueue a new image processing task.
+        # Weighted dequeue across priority lanes
+        weights = dict(item.split(':') for item in
+                       os.getenv('TASK_LANE_WEIGHTS', DEFAULT_LANE_WEIGHTS).split(','))
+        self.lane_weights = {lane: max(1, int(weights.get(lane, 1))) for lane in PRIORITY_LANES.values()}
+        self._lane_schedule = lane_schedule(self.lane_weights)
+        self._lane_cursor = 0
         
-        Args:
-            task_data: Dictionary containing task information
-            
-        Returns:
-            task_id: Unique identifier for the task
-        """
-        task_id = str(uuid.uuid4())
-        task = {
-            'id': task_id,
+        # Reliable queue settings
+        self.visibility_timeout = float(os.getenv('TASK_VISIBILITY_TIMEOUT', 300))
+        self.max_retries = int(os.getenv('TASK_MAX_RETRIES', 3))
+        # Finished task hashes expire after this many seconds (0 = keep them)
+        self.result_ttl = int(os.getenv('TASK_RESULT_TTL', 86400))
+        
+        # Single-flight: identical in-flight tasks are computed once. A flight
+        # key outlives its leader's retries, then new duplicates start a new one
+        self.single_flight = os.getenv('TASK_SINGLE_FLIGHT', '1') == '1'
+        self.flight_ttl = max(1, int(self.visibility_timeout * (self.max_retries + 1)))
+        
+        # Scripts are sent once and then called by SHA (EVALSHA)
+        self._claim_script = self.redis_client.register_script(CLAIM_TASK_SCRIPT)
+        self._complete_script = self.redis_client.register_script(COMPLETE_TASK_SCRIPT)
+        self._fail_script = self.redis_client.register_script(FAIL_TASK_SCRIPT)
+        self._requeue_expired_script = self.redis_client.register_script(REQUEUE_EXPIRED_SCRIPT)
+        self._requeue_worker_script = self.redis_client.register_script(REQUEUE_WORKER_SCRIPT)
+        self._release_tasks_script = self.redis_client.register_script(RELEASE_TASKS_SCRIPT)
+        self._sweep_script = self.redis_client.register_script(SWEEP_FINISHED_SCRIPT)
+        self._release_dispatched_script = self.redis_client.register_script(RELEASE_DISPATCHED_SCRIPT)
+        self._single_flight_script = self.redis_client.register_script(PUSH_IDS_FUNCTION + SINGLE_FLIGHT_SCRIPT)
+        
+    def ping(self) -> bool:
+        return self.redis_client.ping()
+    
+    @staticmethod
+    def _to_hash(task: Dict) -> Dict:
+        """Flatten a task dict into Redis hash fields (payloads encoded, the rest as strings)."""
+        return {k: codec.encode(v) if isinstance(v, (dict, list)) else str(v) for k, v in task.items()}
+    
+    def _call_binary(self, script, keys: List, args: List):
+        """Run a registered script without decoding its reply (it returns encoded payloads)."""
+        try:
+            return self.redis_client.execute_command(
+                'EVALSHA', script.sha, len(keys), *keys, *args, **{NEVER_DECODE: []})
+        except NoScriptError:
+            self.redis_client.script_load(script.script)
+            return self.redis_client.execute_command(
+                'EVALSHA', script.sha, len(keys), *keys, *args, **{NEVER_DECODE: []})
+        
+    @staticmethod
+    def _new_task(task_data: Dict, **fields) -> Dict:
+        """Build the hash of a new pending task."""
+        return {
+            'id': str(uuid.uuid4()),
             'data': task_data,
             'status': 'pending',
             'created_at': time.time(),
             'worker_id': None,
             'started_at': None,
-            'completed_at': None
+            'completed_at': None,
+            'retries': 0,
+            **fields
         }
+    
+    def _lane_queue(self, route: str, lane: str) -> str:
+        """List of a route's lane (the normal lane keeps the plain route key)."""
+        queue = f'{self.route_prefix}{route}'
+        return queue if lane == 'normal' else f'{queue}:{lane}'
+    
+    def enqueue_many(self, tasks: List[Dict], priority=2) -> List[str]:
+        """
+        Enqueue many tasks with one round trip per bulk_chunk_size tasks.
         
-        # Add to task queue
-        self.redis_client.lpush(self.task_queue, json.dumps(task))
+        Each chunk is one MULTI/EXEC: the task hashes, then one LPUSH per
+        route lane with all of its ids. The hashes are written first so a
+        worker never pops an untracked task. With single-flight, a task
+        identical to one in flight is bound to it instead of queued (its id
+        is still returned, see _execute_staged).
+        
+        Args:
+            tasks: Task data dictionaries
+            priority: Lane of every task (1/'high', 2/'normal' or 3/'low')
+            
+        Returns:
+            Task ids, in the order of `tasks`
+        """
+        lane = priority_lane(priority)
+        task_ids = []
+        for start in range(0, len(tasks), self.bulk_chunk_size):
+            pipe = self.redis_client.pipeline(transaction=True)
+            pushes = {}
+            for task_data in tasks[start:start + self.bulk_chunk_size]:
+                task_ids.append(self._stage_task(pipe, pushes, task_data, lane))
+            self._execute_staged(pipe, pushes)
+        return task_ids
+    
+    def _stage_task(self, pipe, pushes: Dict, task_data: Dict, lane: str,
+                    worker_id: str = None, **fields) -> str:
+        """
+        Write a pending task hash in `pipe` and collect its id in `pushes`, by
+        route lane or, if dispatched to `worker_id`, by that worker's queue.
+        """
+        route = route_key(task_data.get('filters', []))
+        queue = self._lane_queue(route, lane)
+        if self.single_flight:
+            fields['fingerprint'] = task_fingerprint(task_data)
+        task = self._new_task(task_data, queue=queue, priority=lane, **fields)
+        pipe.hset(f"{self.task_prefix}{task['id']}", mapping=self._to_hash(task))
+        target = self.dispatch_queue(worker_id) if worker_id else queue
+        pushes.setdefault((route, target, worker_id), []).append(task['id'])
+        return task['id']
+    
+    def _execute_staged(self, pipe, pushes: Dict):
+        """
+        Run `pipe` with the ids collected by _stage_task queued.
         
-        # Store task metadata for tracking (convert all values to strings)
-        task_str = {k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) for k, v in task.items()}
-        self.redis_client.hset(f'task:{task_id}', mapping=task_str)
+        With single-flight, the staged hashes are written first and
+        SINGLE_FLIGHT_SCRIPT, in the same transaction, binds every task
+        identical to one in flight to its leader and queues the others.
+        """
+        if not self.single_flight or not pushes:
+            self._push_staged(pipe, pushes)
+            pipe.execute()
+            return
+        keys, args = [self.stats_key, self.dedupe_key, self.routes_key, self.dispatch_key], []
+        for (route, queue, worker_id), task_ids in pushes.items():
+            keys += [queue, f'{queue}:ready']
+            args += [route, worker_id or '', len(task_ids), *task_ids]
+        self._single_flight_script(keys=keys, args=[self.task_prefix, self.flight_ttl, self._push_maxlen(), *args],
+                                   client=pipe)
+        pipe.execute()
+    
+    def _push_maxlen(self) -> int:
+        """MAXLEN of the entries SINGLE_FLIGHT_SCRIPT appends (0: the list engine does not trim)."""
+        return 0
+    
+    def _push_staged(self, pipe, pushes: Dict):
+        """Queue the ids collected by _stage_task, one LPUSH per target queue."""
+        for (route, queue, worker_id), task_ids in pushes.items():
+            if worker_id:
+                pipe.sadd(self.dispatch_key, worker_id)
+            self._push_ids(pipe, route, queue, task_ids)
+    
+    def dispatch_queue(self, worker_id: str) -> str:
+        """Queue of the tasks dispatched to one worker."""
+        return f'{self.dispatch_prefix}{worker_id}'
+    
+    def _push_ids(self, pipe, route: str, queue: str, task_ids: List[str]):
+        """Queue task ids on a route lane, with one wake-up token each."""
+        pipe.sadd(self.routes_key, route)
+        pipe.lpush(queue, *task_ids)
+        pipe.lpush(f'{queue}:ready', *[1] * len(task_ids))
+        pipe.hincrby(self.stats_key, 'pending', len(task_ids))
+        pipe.hincrby(self.stats_key, 'total', len(task_ids))
+    
+    def enqueue_jobs(self, jobs: List[Dict]) -> List[str]:
+        """
+        Enqueue many jobs (see enqueue_job) in as few round trips as possible.
+        
+        Jobs are grouped into MULTI/EXEC chunks of about bulk_chunk_size
+        subtasks; a job and its subtasks always go in the same chunk.
+        
+        Args:
+            jobs: Dictionaries with 'task_data', 'images', optional 'priority'
+                  and optional 'workers' (one target worker id per image,
+                  see distributed.scheduler; default: the shared route queue)
+            
+        Returns:
+            Job ids, in the order of `jobs`
+        """
+        staged = []
+        for job in jobs:
+            if not job['images']:
+                raise ValueError("A job needs at least one image")
+            workers = job.get('workers') or [None] * len(job['images'])
+            if len(workers) != len(job['images']):
+                raise ValueError("'workers' needs one worker id per image")
+            staged.append((job['task_data'], job['images'], priority_lane(job.get('priority', 2)), workers))
+        
+        job_ids = []
+        pipe, pushes, chunk = self.redis_client.pipeline(transaction=True), {}, 0
+        for task_data, images, lane, workers in staged:
+            job = self._new_task(task_data, kind='job', priority=lane, total=len(images), done=0, failed=0)
+            pipe.hset(f"{self.task_prefix}{job['id']}", mapping=self._to_hash(job))
+            for image_path, worker_id in zip(images, workers):
+                self._stage_task(pipe, pushes, {**task_data, 'images': [image_path]}, lane,
+                                 worker_id=worker_id, parent_id=job['id'])
+            job_ids.append(job['id'])
+            
+            chunk += len(images)
+            if chunk >= self.bulk_chunk_size:
+                self._execute_staged(pipe, pushes)
+                pipe, pushes, chunk = self.redis_client.pipeline(transaction=True), {}, 0
+        if pushes:
+            self._execute_staged(pipe, pushes)
+        return job_ids
+    
+    def get_job_results(self, job_id: str) -> List[Dict]:
+        """
+        Results of the finished subtasks of a job, in completion order.
+        
+        The job results list holds subtask ids; results are read from the
+        subtask hashes in one pipelined round trip.
+        """
+        task_ids = self.redis_client.lrange(f'{self.job_results_prefix}{job_id}', 0, -1)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.execute_command('HMGET', f'{self.task_prefix}{task_id}', 'status', 'result', 'error',
+                                 **{NEVER_DECODE: []})
         
-        return task_id
+        results = []
+        for task_id, (status, result, error) in zip(task_ids, pipe.execute()):
+            if status is None:
+                results.append({'task_id': task_id, 'status': 'expired'})
+            elif status == b'completed':
+                results.append({'task_id': task_id, 'status': 'completed', 'result': codec.decode(result)})
+            else:
+                results.append({'task_id': task_id, 'status': status.decode(),
+                                'error': (error or b'').decode()})
+        return results
     
-    def get_task(self, worker_id: str, timeout: int = 5) -> Optional[Dict]:
+    def get_task(self, worker_id: str, timeout: int = 5, capabilities: List[str] = None) -> Optional[Dict]:
         """
         Get next available task from queue (blocking operation).
         
+        Only tasks whose filters are all in `capabilities` are claimed; routes
+        needing more filters are tried first, so specialized tasks are not
+        left behind by generic ones. The starting priority lane rotates by
+        TASK_LANE_WEIGHTS (see next_lane_order). Tasks dispatched to this
+        worker are claimed before all of them. The task stays in the worker's processing
+        list and in the in-flight set until it is acked with
+        complete_task/fail_task. If it is not acked within the visibility
+        timeout, requeue_expired_tasks() puts it back.
+        
         Args:
             worker_id: ID of the worker requesting the task
-            timeout: Timeout in seconds for blocking pop
+            timeout: Timeout in seconds for blocking wait
+            capabilities: Filters the worker can apply (None = any task)
             
         Returns:
             Task dictionary or None if timeout
         """
-        result = self.redis_client.brpop(self.task_queue, timeout=timeout)
-        if not result:
-            return None
+        tasks = self.get_tasks(worker_id, 1, timeout, capabilities)
+        return tasks[0] if tasks else None
+    
+    def get_tasks(self, worker_id: str, max_n: int, timeout: int = 5,
+                  capabilities: List[str] = None) -> List[Dict]:
+        """
+        Claim up to `max_n` tasks in one round trip (see get_task).
+        
+        The claim script moves the ids and marks every task as processing
+        in one call, so small tasks do not pay a claim round trip each.
+        Blocks (up to `timeout` seconds) only while nothing is claimable and
+        returns as soon as at least one task was claimed.
+        
+        Returns:
+            Claimed task dictionaries (empty list if timeout)
+        """
+        deadline = time.time() + timeout
+        lanes = self.next_lane_order()
+        queues = self._claim_queues(worker_id, capabilities, lanes)
+        while True:
+            tasks = self._claim(worker_id, queues, max_n)
+            if tasks:
+                return tasks
             
-        task = json.loads(result[1])
-        task_id = task['id']
+            # A route created since the last refresh may hold our task
+            fresh_queues = self._claim_queues(worker_id, capabilities, lanes, refresh=True)
+            if fresh_queues != queues:
+                queues = fresh_queues
+                continue
+            
+            # Nothing claimable: block on the wake-up tokens of our routes,
+            # then claim atomically. Losing the race to another worker just
+            # means waiting again.
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return []
+            ready_keys = [f'{queue}:ready' for queue in queues]
+            if self.redis_client.blmpop(remaining, len(ready_keys), *ready_keys, direction='RIGHT') is None:
+                return []
+    
+    def _claim_queues(self, worker_id: str, capabilities: List[str] = None, lanes: List[str] = None,
+                      refresh: bool = False) -> List[str]:
+        """Queues get_task claims from: the worker's dispatch queue, then its routes."""
+        return [self.dispatch_queue(worker_id), *self.worker_queues(capabilities, refresh=refresh, lanes=lanes)]
+    
+    def next_lane_order(self) -> List[str]:
+        """
+        Lanes in the order the next claim tries them.
         
-        # Mark task as started
-        task['status'] = 'processing'
-        task['worker_id'] = worker_id
-        task['started_at'] = time.time()
+        The first lane follows the weighted schedule; the rest go by priority.
+        With the default weights and every lane backlogged, 6 of 10 claims
+        come from high, 3 from normal and 1 from low.
+        """
+        first = self._lane_schedule[self._lane_cursor % len(self._lane_schedule)]
+        self._lane_cursor += 1
+        return [first] + [lane for lane in PRIORITY_LANES.values() if lane != first]
+    
+    def worker_queues(self, capabilities: List[str] = None, refresh: bool = False,
+                      lanes: List[str] = None) -> List[str]:
+        """
+        Task queues a worker with `capabilities` can serve, in claim order.
         
-        # Update task metadata (convert all values to strings)
-        task_str = {k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) for k, v in task.items()}
-        self.redis_client.hset(f'task:{task_id}', mapping=task_str)
+        Lane by lane (`lanes`, default by priority), most demanding routes
+        first within a lane; the unrouted queue (tasks enqueued before
+        routing existed) last. The set of routes is re-read every
+        ROUTE_REFRESH_INTERVAL seconds, or now if `refresh` is set.
+        """
+        if refresh or time.time() - self._routes_loaded_at > ROUTE_REFRESH_INTERVAL:
+            self._routes = tuple(sorted(self.redis_client.smembers(self.routes_key),
+                                        key=lambda route: (-len(route.split('+')), route)))
+            self._routes_loaded_at = time.time()
         
-        return task
+        allowed = set(capabilities or ())
+        routes = [route for route in self._routes
+                  if capabilities is None or route == 'none' or set(route.split('+')) <= allowed]
+        queues = [self._lane_queue(route, lane)
+                  for lane in lanes or PRIORITY_LANES.values() for route in routes]
+        queues.append(self.task_queue)
+        return queues
+    
+    def _claim(self, worker_id: str, queues: List[str], max_n: int = 1) -> List[Dict]:
+        """Atomically move up to `max_n` task ids into the worker's processing list."""
+        started_at = time.time()
+        claimed = self._call_binary(
+            self._claim_script,
+            keys=[f'{self.processing_prefix}{worker_id}', self.inflight_key, self.stats_key, *queues],
+            args=[self.task_prefix, worker_id, started_at, started_at + self.visibility_timeout, max_n]
+        )
+        return self._claimed_tasks(claimed, worker_id, started_at)
     
-    def complete_task(self, task_id: str, result: Dict):
+    @staticmethod
+    def _claimed_tasks(claimed, worker_id: str, started_at: float) -> List[Dict]:
+        """Task dictionaries from a claim script reply (id, data, retries of each task, flattened)."""
+        return [{
+            'id': task_id.decode(),
+            'data': codec.decode(data) or {},
+            'status': 'processing',
+            'worker_id': worker_id,
+            'started_at': started_at,
+            'retries': int(retries or 0)
+        } for task_id, data, retries in zip(*[iter(claimed or [])] * 3)]
+    
+    def touch_task(self, task_id: str) -> bool:
         """
-        Mark task as completed and store result.
+        Extend the visibility deadline of an in-flight task.
+        
+        Long-running workers call this periodically so their task is not
+        re-enqueued while it is still being processed.
+        """
+        deadline = time.time() + self.visibility_timeout
+        return bool(self.redis_client.zadd(self.inflight_key, {task_id: deadline}, xx=True, ch=True))
+    
+    def touch_tasks(self, task_ids: List[str]) -> int:
+        """Extend the visibility deadline of many in-flight tasks with one ZADD."""
+        if not task_ids:
+            return 0
+        deadline = time.time() + self.visibility_timeout
+        return self.redis_client.zadd(self.inflight_key, dict.fromkeys(task_ids, deadline), xx=True, ch=True)
+    
+    def complete_task(self, task_id: str, result: Dict, worker_id: str = None):
+        """
+        Mark task as completed and store result (acks the task).
         
         Args:
             task_id: Task identifier
             result: Processing result data
+            worker_id: Worker acking the task
         """
-        task_key = f'task:{task_id}'
-        task_data = self.redis_client.hgetall(task_key)
-        
-        if task_data:
-            # Update task status
-            updates = {
-                'status': 'completed',
-                'completed_at': str(time.time()),
-                'result': json.dumps(result)
-            }
-            self.redis_client.hset(task_key, mapping=updates)
-            
-            # Store result for retrieval
-            result_data = {
-                'task_id': task_id,
-                'result': result,
-                'completed_at': time.time()
-            }
-            self.redis_client.lpush(self.result_queue, json.dumps(result_data))
+        # Ack + status update + result feed push in one atomic script (no-op for unknown tasks).
+        # The result is stored once, encoded, in the task hash.
+        self._complete_script(
+            keys=[f'{self.task_prefix}{task_id}', self.inflight_key, self.stats_key,
+                  self.finished_key, self.result_queue],
+            args=[*self._ack_args(task_id, worker_id, time.time()),
+                  codec.encode(result), self.result_feed_length]
+        )
     
-    def fail_task(self, task_id: str, error: str):
+    def fail_task(self, task_id: str, error: str, worker_id: str = None):
         """
-        Mark task as failed.
+        Mark task as failed (acks the task).
         
         Args:
             task_id: Task identifier
             error: Error message
+            worker_id: Worker acking the task
         """
-        task_key = f'task:{task_id}'
-        updates = {
-            'status': 'failed',
-            'completed_at': str(time.time()),
-            'error': error
-        }
-        self.redis_client.hset(task_key, mapping=updates)
+        self._fail_script(
+            keys=[f'{self.task_prefix}{task_id}', self.inflight_key, self.stats_key, self.finished_key],
+            args=[*self._ack_args(task_id, worker_id, time.time()), error]
+        )
+    
+    def _ack_args(self, task_id: str, worker_id: Optional[str], finished_at: float) -> List:
+        """ARGV shared by the complete/fail scripts (see ACK_PROLOGUE)."""
+        return [task_id, self.processing_prefix, worker_id or '', str(finished_at), self.result_ttl,
+                self.task_prefix, self.job_results_prefix]
+    
+    def requeue_expired_tasks(self, limit: int = 100) -> Dict[str, int]:
+        """
+        Re-enqueue in-flight tasks whose visibility timeout expired.
+        
+        Each re-enqueue increments the task's retry count; past max_retries
+        the task is marked as failed instead. Safe to run from every worker.
+        
+        Returns:
+            Dictionary with the number of tasks requeued and failed
+        """
+        requeued, failed = self._requeue_expired_script(
+            keys=[self.inflight_key, self.task_queue, self.stats_key, self.finished_key],
+            args=[time.time(), self.task_prefix, self.processing_prefix, self.max_retries,
+                  self.result_ttl, self.job_results_prefix, limit]
+        )
+        return {'requeued': requeued, 'failed': failed}
+    
+    def requeue_worker_tasks(self, worker_id: str) -> Dict[str, int]:
+        """
+        Re-enqueue every task left in a worker's processing list.
+        
+        Called by a worker on startup: tasks from its previous run (same
+        WORKER_ID) come back immediately instead of after the visibility timeout.
+        """
+        requeued, failed = self._requeue_worker_script(
+            keys=[self.inflight_key, self.task_queue, self.stats_key, self.finished_key,
+                  f'{self.processing_prefix}{worker_id}'],
+            args=[time.time(), self.task_prefix, self.processing_prefix, self.max_retries,
+                  self.result_ttl, self.job_results_prefix, worker_id]
+        )
+        return {'requeued': requeued, 'failed': failed}
+    
+    def release_tasks(self, worker_id: str, task_ids: List[str]) -> int:
+        """
+        Put tasks a worker claimed but never started back on their routes.
+        
+        Called by a worker when it stops, for its prefetched tasks: unlike
+        requeue_worker_tasks no retry is counted, so rolling restarts never
+        fail a task that did not run.
+        
+        Returns:
+            Number of tasks released
+        """
+        if not task_ids:
+            return 0
+        return self._release_tasks_script(
+            keys=[self.inflight_key, self.task_queue, self.stats_key, self.finished_key],
+            args=[time.time(), self.task_prefix, self.processing_prefix, self.max_retries,
+                  self.result_ttl, self.job_results_prefix, worker_id, *task_ids]
+        )
+    
+    def release_dispatched_tasks(self, worker_id: str) -> int:
+        """
+        Move the tasks waiting in a worker's dispatch queue back to their routes.
+        
+        Called by a worker when it stops, and for dead workers by
+        release_orphaned_dispatch().
+        
+        Returns:
+            Number of tasks released
+        """
+        return self._release_dispatched_script(
+            keys=[self.dispatch_queue(worker_id), self.dispatch_key, self.task_queue],
+            args=[self.task_prefix, worker_id]
+        )
+    
+    def release_orphaned_dispatch(self, active_worker_ids: List[str]) -> int:
+        """Release the dispatch queues of every worker not in `active_worker_ids`."""
+        orphaned = self.redis_client.smembers(self.dispatch_key) - set(active_worker_ids)
+        return sum(self.release_dispatched_tasks(worker_id) for worker_id in orphaned)
+    
+    def get_dispatched_lengths(self) -> Dict[str, int]:
+        """Tasks waiting in each worker's dispatch queue, by worker id."""
+        worker_ids = sorted(self.redis_client.smembers(self.dispatch_key))
+        pipe = self.redis_client.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.llen(self.dispatch_queue(worker_id))
+        return dict(zip(worker_ids, pipe.execute()))
     
     def get_task_status(self, task_id: str) -> Optional[Dict]:
         """
@@ -131,69 +966,193 @@ class DistributedTaskQueue:
             task_id: Task identifier
             
         Returns:
-            Task status dictionary or None if not found
+            Task status dictionary ('data' and 'result' decoded) or None if not found
         """
-        task_data = self.redis_client.hgetall(f'task:{task_id}')
-        if not task_data:
+        raw = self.redis_client.execute_command('HGETALL', f'{self.task_prefix}{task_id}', **{NEVER_DECODE: []})
+        if not raw:
             return None
+        
+        # Payload fields are decoded by the codec, everything else is text
+        task_data = {}
+        for field, value in raw.items():
+            field = field.decode()
+            task_data[field] = codec.decode(value) if field in ('data', 'result') else value.decode()
             
-        # Convert numeric fields back to proper types
-        if 'created_at' in task_data and task_data['created_at'] and task_data['created_at'] != 'None':
-            task_data['created_at'] = float(task_data['created_at'])
-        if 'started_at' in task_data and task_data['started_at'] and task_data['started_at'] != 'None':
-            task_data['started_at'] = float(task_data['started_at'])
-        if 'completed_at' in task_data and task_data['completed_at'] and task_data['completed_at'] != 'None':
-            task_data['completed_at'] = float(task_data['completed_at'])
+        # Convert numeric fields back to proper types (unset timestamps are stored as 'None')
+        for field in ('created_at', 'started_at', 'completed_at'):
+            if field in task_data:
+                value = task_data[field]
+                task_data[field] = float(value) if value and value != 'None' else None
+        if task_data.get('kind') == 'job':
+            for counter in ('total', 'done', 'failed'):
+                task_data[counter] = int(task_data.get(counter, 0))
             
         return task_data
     
+    def watch_tasks(self, task_ids: List[str], timeout: float):
+        """
+        Yield (task_id, status) as each task finishes, over one subscription.
+        
+        Tasks already finished (and unknown ids, with status None) are
+        yielded first. Stops when every task has been yielded or after
+        `timeout` seconds; tasks still running then are not yielded.
+        
+        The subscription is opened on the call, not on the first iteration:
+        WatcherLimitError (every watcher connection in use) is raised here.
+        """
+        deadline = time.time() + timeout
+        pubsub = self.watch_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(*(f'{TASK_EVENTS_PREFIX}{task_id}' for task_id in set(task_ids)))
+        except Exception:
+            pubsub.close()
+            raise
+        return self._watch(pubsub, task_ids, deadline)
+    
+    def _watch(self, pubsub, task_ids: List[str], deadline: float):
+        """Body of watch_tasks once subscribed; closes the subscription when done."""
+        pending = set(task_ids)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for task_id in task_ids:
+                pipe.hget(f'{self.task_prefix}{task_id}', 'status')
+            for task_id, status in zip(task_ids, pipe.execute()):
+                if task_id in pending and (status is None or status in FINISHED_STATUSES):
+                    pending.discard(task_id)
+                    yield task_id, self.get_task_status(task_id)
+            
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                message = pubsub.get_message(timeout=remaining)
+                if not message:
+                    continue
+                task_id = message['channel'][len(TASK_EVENTS_PREFIX):]
+                if task_id in pending:
+                    pending.discard(task_id)
+                    yield task_id, self.get_task_status(task_id)
+        finally:
+            pubsub.close()
+    
     def get_queue_stats(self) -> Dict:
         """
         Get queue statistics.
         
+        Reads the counters maintained by the transition scripts and the
+        length of each route lane in a single pipeline instead of scanning
+        every task hash. `lanes` sums the queued tasks per priority lane;
+        `dispatched` counts the tasks waiting in each worker's dispatch queue.
+        
         Returns:
             Dictionary with queue statistics
         """
-        pending_tasks = self.redis_client.llen(self.task_queue)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.smembers(self.routes_key)
+        pipe.smembers(self.dispatch_key)
+        routes, dispatched_workers = (sorted(members) for members in pipe.execute())
         
-        # Count tasks by status
-        task_keys = self.redis_client.keys('task:*')
-        status_counts = {'pending': 0, 'processing': 0, 'completed': 0, 'failed': 0}
+        lanes = list(PRIORITY_LANES.values())
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zcard(self.inflight_key)
+        pipe.hgetall(self.stats_key)
+        pipe.hgetall(self.dedupe_key)
+        pipe.llen(self.task_queue)
+        for worker_id in dispatched_workers:
+            pipe.llen(self.dispatch_queue(worker_id))
+        for route in routes:
+            for lane in lanes:
+                self._queued_length(pipe, self._lane_queue(route, lane))
+        in_flight, counters, dedupe, unrouted, *lengths = pipe.execute()
+        dispatched = dict(zip(dispatched_workers, lengths[:len(dispatched_workers)]))
+        lengths = lengths[len(dispatched_workers):]
         
-        for key in task_keys:
-            task_data = self.redis_client.hgetall(key)
-            status = task_data.get('status', 'unknown')
-            if status in status_counts:
-                status_counts[status] += 1
+        queues = {}
+        lane_lengths = dict.fromkeys(lanes, 0)
+        lane_lengths['normal'] += unrouted
+        for index, route in enumerate(routes):
+            queues[route] = dict(zip(lanes, lengths[index * len(lanes):(index + 1) * len(lanes)]))
+            for lane, length in queues[route].items():
+                lane_lengths[lane] += length
+        
+        status_counts = {status: int(counters.get(status, 0))
+                         for status in ('pending', 'processing', 'completed', 'failed')}
         
         return {
-            'queue_length': pending_tasks,
-            'total_tasks': len(task_keys),
-            'status_breakdown': status_counts
+            'queue_length': unrouted + sum(lengths) + sum(dispatched.values()),
+            'lanes': lane_lengths,
+            'queues': queues,
+            'dispatched': dispatched,
+            'in_flight': in_flight,
+            'total_tasks': int(counters.get('total', 0)),
+            'status_breakdown': status_counts,
+            'dedupe': dedupe_stats(int(dedupe.get('checked', 0)), int(dedupe.get('hits', 0)))
         }
     
-    def clear_completed_tasks(self, older_than_seconds: int = 3600):
+    def _queued_length(self, pipe, queue: str):
+        """Queue in `pipe` the command returning how many tasks wait in a route lane."""
+        pipe.llen(queue)
+    
+    def clear_completed_tasks(self, older_than_seconds: int = 3600, batch_size: int = 500) -> int:
         """
-        Clean up completed tasks older than specified time.
+        Clean up completed and failed tasks older than specified time.
+        
+        Walks the finished-at index oldest first, in batches so Redis is
+        never blocked for long. Also drops index entries whose hash already
+        expired (TASK_RESULT_TTL).
         
         Args:
             older_than_seconds: Age threshold in seconds
+            batch_size: Tasks deleted per round trip
+            
+        Returns:
+            Number of tasks removed
+        """
+        cutoff = time.time() - older_than_seconds
+        removed = 0
+        while True:
+            swept = self._sweep_script(keys=[self.finished_key],
+                                       args=[cutoff, self.task_prefix, batch_size, self.job_results_prefix])
+            removed += swept
+            if swept < batch_size:
+                return removed
+    
+    def rebuild_stats(self) -> Dict:
+        """
+        Recompute the status counters and the finished-at index from the task hashes.
+        
+        Admin/migration helper for queues populated before the counters
+        existed: uses SCAN (non-blocking) and must not run concurrently with
+        workers, since counters updated meanwhile would be overwritten.
+        
+        Returns:
+            The rebuilt queue statistics
         """
-        current_time = time.time()
-        task_keys = self.redis_client.keys('task:*')
+        counts = {'pending': 0, 'processing': 0, 'completed': 0, 'failed': 0}
+        finished = {}
+        for key in self.redis_client.scan_iter(match=f'{self.task_prefix}*', count=1000):
+            status, completed_at, kind = self.redis_client.hmget(key, 'status', 'completed_at', 'kind')
+            if status not in counts:
+                continue
+            if status in ('completed', 'failed') and completed_at not in (None, 'None'):
+                finished[key[len(self.task_prefix):]] = float(completed_at)
+            # Parent jobs are indexed for cleanup but are not queue tasks
+            if kind != 'job':
+                counts[status] += 1
         
-        for key in task_keys:
-            task_data = self.redis_client.hgetall(key)
-            if (task_data.get('status') in ['completed', 'failed'] and 
-                task_data.get('completed_at') and
-                current_time - float(task_data['completed_at']) > older_than_seconds):
-                self.redis_client.delete(key)
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.delete(self.stats_key, self.finished_key)
+        pipe.hset(self.stats_key, mapping={**counts, 'total': sum(counts.values())})
+        if finished:
+            pipe.zadd(self.finished_key, finished)
+        pipe.execute()
+        return self.get_queue_stats()
 
 
 def test_redis_connection():
     """Test Redis connection and basic operations."""
     try:
-        queue = DistributedTaskQueue()
+        queue = create_task_queue()
         
         # Test connection
         queue.redis_client.ping()
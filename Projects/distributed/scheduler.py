@@ -0,0 +1,109 @@
+import os
+import random
+from typing import Dict, List, Optional
+
+# Load-aware worker selection.
+#
+# Each worker publishes with its heartbeat how many tasks it holds (slots_busy
+# + prefetched), its number of slots (concurrency) and an exponentially
+# weighted moving average of the processing time of every filter it ran
+# (filter_ewma). From them the scheduler estimates when a new task would
+# finish on each worker:
+#
+#     ECT = (tasks ahead / concurrency + 1) * sum(EWMA of the task's filters)
+#
+# A worker that just came up has no EWMA yet: it is charged the fleet average
+# for those filters, so it is not mistaken for an infinitely fast worker.
+#
+# Strategies:
+#   p2c        power of two choices: the better of two random capable workers.
+#              Near-optimal balance, and concurrent API processes working from
+#              the same (slightly stale) heartbeats do not all pile onto the
+#              same "best" worker.
+#   least_ect  the capable worker with the least expected completion time.
+
+DEFAULT_FILTER_TIME = 0.5  # seconds, when no worker has run a filter yet
+STRATEGIES = ('p2c', 'least_ect')
+
+
+def worker_load(worker: Dict) -> int:
+    """Tasks a worker holds: running in its slots plus claimed ahead (prefetched)."""
+    return int(worker.get('slots_busy') or 0) + int(worker.get('prefetched') or 0)
+
+
+def can_run(worker: Dict, filters: List[str]) -> bool:
+    capabilities = worker.get('capabilities', [])
+    return 'all' in capabilities or set(filters) <= set(capabilities)
+
+
+class LoadAwareScheduler:
+    """
+    Pick target workers by expected completion time.
+
+    Works on a snapshot of the active workers. Every pick counts as one more
+    task ahead on the chosen worker, so assigning a whole batch spreads it
+    instead of sending it all to the worker that was idle at snapshot time.
+    """
+
+    def __init__(self, workers: List[Dict], strategy: str = None,
+                 queued: Optional[Dict[str, int]] = None, rng: random.Random = None):
+        """
+        Args:
+            workers: Active workers (WorkerRegistry.get_active_workers())
+            strategy: 'p2c' or 'least_ect' (default: env TASK_SCHEDULER, p2c)
+            queued: Tasks already waiting in each worker's own queue, by worker id
+            rng: Random generator for p2c (tests pass a seeded one)
+        """
+        self.strategy = strategy or os.getenv('TASK_SCHEDULER', 'p2c')
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"Unknown scheduler strategy {self.strategy!r}: use one of {STRATEGIES}")
+        self.workers = workers
+        self.rng = rng or random.Random()
+        self._ahead = {worker['id']: worker_load(worker) + (queued or {}).get(worker['id'], 0)
+                       for worker in workers}
+
+        # Fleet average per filter, charged to workers that never ran it
+        samples: Dict[str, List[float]] = {}
+        for worker in workers:
+            for filter_name, seconds in (worker.get('filter_ewma') or {}).items():
+                samples.setdefault(filter_name, []).append(float(seconds))
+        self.fleet_filter_time = {name: sum(values) / len(values) for name, values in samples.items()}
+
+    def filter_time(self, worker: Dict, filter_name: str) -> float:
+        """EWMA of a filter on a worker, else the fleet average, else DEFAULT_FILTER_TIME."""
+        ewma = worker.get('filter_ewma') or {}
+        if filter_name in ewma:
+            return float(ewma[filter_name])
+        return self.fleet_filter_time.get(filter_name, DEFAULT_FILTER_TIME)
+
+    def expected_completion_time(self, worker: Dict, filters: List[str]) -> float:
+        """Seconds until a new task with `filters` would finish on `worker`."""
+        service_time = sum(self.filter_time(worker, name) for name in filters) or DEFAULT_FILTER_TIME
+        slots = max(1, int(worker.get('concurrency') or 1))
+        return (self._ahead.get(worker['id'], 0) / slots + 1) * service_time
+
+    def pick(self, filters: List[str]) -> Optional[Dict]:
+        """
+        Choose a worker for one task and count the task on it.
+
+        Returns:
+            Worker data dictionary, or None if no worker can run `filters`
+        """
+        capable = [worker for worker in self.workers if can_run(worker, filters)]
+        if not capable:
+            return None
+        if self.strategy == 'p2c' and len(capable) > 2:
+            capable = self.rng.sample(capable, 2)
+        chosen = min(capable, key=lambda worker: self.expected_completion_time(worker, filters))
+        self._ahead[chosen['id']] = self._ahead.get(chosen['id'], 0) + 1
+        return chosen
+
+    def assign(self, filters: List[str], count: int) -> List[str]:
+        """Worker ids for `count` tasks with `filters` (empty if no worker can run them)."""
+        assignments = []
+        for _ in range(count):
+            worker = self.pick(filters)
+            if worker is None:
+                return []
+            assignments.append(worker['id'])
+        return assignments
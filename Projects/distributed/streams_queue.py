@@ -0,0 +1,408 @@
+import os
+import time
+from typing import Dict, List
+
+from redis.exceptions import ResponseError
+
+from . import codec
+from .redis_queue import (DistributedTaskQueue, FINISHED_STATUSES, PRIORITY_LANES, SINGLE_FLIGHT_SCRIPT,
+                          UPDATE_PARENT_FUNCTION)
+
+# Redis Streams engine for DistributedTaskQueue (TASK_QUEUE_ENGINE=streams).
+#
+# Same task hashes, counters, jobs, result feed and completion events as the
+# list engine; only delivery changes. Each route lane is a stream
+# (image_tasks:stream:blur+resize[:high|:low]) whose entries hold a task id,
+# appended with XADD MAXLEN ~ TASK_STREAM_MAXLEN. All workers read a route
+# lane through one consumer group, each worker being a consumer: routing
+# already splits tasks by the filters a worker type can run, and a group per
+# worker type would deliver every task to every type.
+#
+# Delivery is the group's pending entries list (PEL) instead of the
+# processing lists and the in-flight zset:
+#   - claiming reads the next entry with XREADGROUP, so the id stays in the
+#     stream, owned by the worker, until the ack (XACK)
+#   - an entry not acked within the visibility timeout is stalled: the next
+#     claim on its stream takes it over with XAUTOCLAIM (retries + 1, failed
+#     past TASK_MAX_RETRIES), so no reaper is needed
+#   - acked entries stay in the stream until MAXLEN trims them, and can be
+#     replayed with XRANGE
+# Wake-up tokens (<stream>:ready) work as in the list engine: one per entry
+# not yet delivered. After reading a stream the claim trims its tokens to the
+# group's lag (XINFO GROUPS, Redis >= 7.0), which also accounts for the token
+# a blocked worker took with BLMPOP. Lag metrics are read from the stream,
+# not from the tokens.
+
+GROUP_LAG_FUNCTION = """
+-- Entries of `stream` not delivered to `group` yet (XINFO GROUPS lag, Redis >= 7.0);
+-- false when Redis cannot tell
+local function group_lag(stream, group)
+    for _, info in ipairs(redis.call('XINFO', 'GROUPS', stream)) do
+        local fields = {}
+        for j = 1, #info, 2 do
+            fields[info[j]] = info[j + 1]
+        end
+        if fields['name'] == group then
+            return fields['lag'] or false
+        end
+    end
+    return false
+end
+"""
+
+STREAM_CLAIM_SCRIPT = UPDATE_PARENT_FUNCTION + GROUP_LAG_FUNCTION + """
+-- KEYS[1] = stats hash, KEYS[2] = finished zset, KEYS[3..n] = task streams in claim order
+-- ARGV[1] = task hash prefix, ARGV[2] = consumer group, ARGV[3] = worker id, ARGV[4] = now,
+-- ARGV[5] = visibility timeout in ms, ARGV[6] = max retries,
+-- ARGV[7] = TTL of finished task hashes (0 = keep), ARGV[8] = job results prefix,
+-- ARGV[9] = max tasks to claim
+-- Returns id, data, retries of each claimed task, flattened
+local max_tasks = tonumber(ARGV[9])
+local max_claimed = 3 * max_tasks
+local claimed = {}
+local function take(stream, entry_id, task_id, stalled)
+    local task_key = ARGV[1] .. task_id
+    local status = redis.call('HGET', task_key, 'status')
+    if status ~= 'pending' and not (stalled and status == 'processing') then
+        -- Finished through another delivery, or its hash is gone
+        redis.call('XACK', stream, ARGV[2], entry_id)
+        return false
+    end
+    if status == 'processing' then
+        local retries = redis.call('HINCRBY', task_key, 'retries', 1)
+        if retries > tonumber(ARGV[6]) then
+            local error = 'Task lost by its worker ' .. retries .. ' times (visibility timeout expired)'
+            redis.call('XACK', stream, ARGV[2], entry_id)
+            redis.call('HSET', task_key, 'status', 'failed', 'completed_at', ARGV[4], 'error', error)
+            update_parent(task_key, task_id, 'failed', ARGV[4], ARGV[7], ARGV[1], KEYS[2], ARGV[8])
+            settle_followers(task_key, task_id, 'failed', ARGV[4], ARGV[7], ARGV[1], KEYS[1], KEYS[2], ARGV[8])
+            redis.call('HINCRBY', KEYS[1], 'processing', -1)
+            redis.call('HINCRBY', KEYS[1], 'failed', 1)
+            redis.call('ZADD', KEYS[2], ARGV[4], task_id)
+            if tonumber(ARGV[7]) > 0 then
+                redis.call('EXPIRE', task_key, ARGV[7])
+            end
+            notify(task_id, 'failed')
+            return false
+        end
+    else
+        redis.call('HINCRBY', KEYS[1], 'pending', -1)
+        redis.call('HINCRBY', KEYS[1], 'processing', 1)
+    end
+    redis.call('HSET', task_key, 'status', 'processing', 'worker_id', ARGV[3], 'started_at', ARGV[4],
+               'stream', stream, 'entry', entry_id)
+    local parent_id = redis.call('HGET', task_key, 'parent_id')
+    if parent_id and redis.call('HGET', ARGV[1] .. parent_id, 'status') == 'pending' then
+        redis.call('HSET', ARGV[1] .. parent_id, 'status', 'processing', 'started_at', ARGV[4])
+    end
+    claimed[#claimed + 1] = task_id
+    claimed[#claimed + 1] = redis.call('HGET', task_key, 'data')
+    claimed[#claimed + 1] = redis.call('HGET', task_key, 'retries')
+    return true
+end
+
+for i = 3, #KEYS do
+    local stream = KEYS[i]
+    if #claimed < max_claimed and redis.call('EXISTS', stream) == 1 then
+        -- Stalled entries first: their tasks have waited the longest
+        for _ = 1, 10 + max_tasks do
+            if #claimed >= max_claimed then
+                break
+            end
+            local stalled = redis.call('XAUTOCLAIM', stream, ARGV[2], ARGV[3], ARGV[5], '0-0', 'COUNT', 1)[2][1]
+            if not stalled then
+                break
+            end
+            if not stalled[2] then
+                -- Trimmed by MAXLEN while pending (Redis 6.2 still returns it)
+                redis.call('XACK', stream, ARGV[2], stalled[1])
+            else
+                take(stream, stalled[1], stalled[2][2], true)
+            end
+        end
+        local read = 0
+        for _ = 1, 10 + max_tasks do
+            if #claimed >= max_claimed then
+                break
+            end
+            local delivered = redis.call('XREADGROUP', 'GROUP', ARGV[2], ARGV[3], 'COUNT', 1, 'STREAMS', stream, '>')
+            local entry = delivered and delivered[1] and delivered[1][2][1]
+            if not entry then
+                break
+            end
+            read = read + 1
+            take(stream, entry[1], entry[2][2], false)
+        end
+        -- Never leave more wake-up tokens than undelivered entries. If the lag
+        -- is unknown the surplus tokens are consumed by idle workers' wake-ups.
+        local lag = read > 0 and group_lag(stream, ARGV[2])
+        if lag == 0 then
+            redis.call('DEL', stream .. ':ready')
+        elseif lag then
+            redis.call('LTRIM', stream .. ':ready', 0, lag - 1)
+        end
+    end
+end
+return claimed
+"""
+
+STREAM_LAG_SCRIPT = GROUP_LAG_FUNCTION + """
+-- KEYS[1] = task stream, ARGV[1] = consumer group
+-- Returns the entries not delivered yet (the wake-up tokens if Redis cannot tell)
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+return group_lag(KEYS[1], ARGV[1]) or redis.call('LLEN', KEYS[1] .. ':ready')
+"""
+
+STREAM_RELEASE_SCRIPT = """
+-- KEYS[1] = stats hash
+-- ARGV[1] = task hash prefix, ARGV[2] = consumer group, ARGV[3] = worker id,
+-- ARGV[4] = visibility timeout in ms, ARGV[5..n] = ids of tasks it claimed and never started
+-- Back to pending before the entry goes stalled, so the claim that takes it
+-- over counts no retry
+local released = 0
+for i = 5, #ARGV do
+    local task_key = ARGV[1] .. ARGV[i]
+    local task = redis.call('HMGET', task_key, 'status', 'worker_id', 'stream', 'entry')
+    if task[1] == 'processing' and task[2] == ARGV[3] and task[3] then
+        redis.call('HSET', task_key, 'status', 'pending', 'worker_id', 'None', 'started_at', 'None')
+        redis.call('HINCRBY', KEYS[1], 'processing', -1)
+        redis.call('HINCRBY', KEYS[1], 'pending', 1)
+        redis.call('XCLAIM', task[3], ARGV[2], ARGV[3], 0, task[4], 'IDLE', ARGV[4], 'JUSTID')
+        redis.call('LPUSH', task[3] .. ':ready', 1)
+        released = released + 1
+    end
+end
+return released
+"""
+
+# Replaces the list engine's push in SINGLE_FLIGHT_SCRIPT
+STREAM_PUSH_IDS_FUNCTION = """
+-- Append `task_id` to the stream `queue`, trimmed to about `maxlen` entries
+local function push_id(queue, task_id, maxlen)
+    redis.call('XADD', queue, 'MAXLEN', '~', maxlen, '*', 'id', task_id)
+end
+"""
+
+# Prepended to the list engine's ack scripts: acknowledge the task's stream
+# entry (ARGV[#ARGV] = consumer group). Only the first ack of a task counts,
+# as in the list engine.
+STREAM_ACK_PRELUDE = """
+local delivery = redis.call('HMGET', KEYS[1], 'status', 'stream', 'entry')
+if delivery[1] == 'processing' and delivery[2] then
+    redis.call('XACK', delivery[2], ARGV[#ARGV], delivery[3])
+end
+"""
+
+
+class StreamsTaskQueue(DistributedTaskQueue):
+    """
+    DistributedTaskQueue delivering tasks through Redis Streams consumer groups.
+
+    Drop-in replacement for the list engine (see create_task_queue): same
+    task, job and status API. Scheduled dispatch (TASK_DISPATCH=scheduled)
+    is not used: the consumer group already hands each entry to exactly one
+    worker, so subtasks always go to the shared route streams.
+    """
+
+    supports_dispatch = False
+
+    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0, redis_client=None):
+        super().__init__(redis_host, redis_port, redis_db, redis_client)
+        self.route_prefix = f'{self.task_queue}:stream:'
+        self.consumer_group = os.getenv('TASK_STREAM_GROUP', 'image_workers')
+        # Approximate cap per stream (acked entries are kept for replay until trimmed).
+        # Keep it well above the deepest backlog: trimmed entries are never delivered.
+        self.stream_maxlen = int(os.getenv('TASK_STREAM_MAXLEN', 100000))
+        self._groups = set()
+
+        self._stream_claim_script = self.redis_client.register_script(STREAM_CLAIM_SCRIPT)
+        self._lag_script = self.redis_client.register_script(STREAM_LAG_SCRIPT)
+        self._stream_release_script = self.redis_client.register_script(STREAM_RELEASE_SCRIPT)
+        self._single_flight_script = self.redis_client.register_script(STREAM_PUSH_IDS_FUNCTION + SINGLE_FLIGHT_SCRIPT)
+        self._complete_script = self.redis_client.register_script(STREAM_ACK_PRELUDE + self._complete_script.script)
+        self._fail_script = self.redis_client.register_script(STREAM_ACK_PRELUDE + self._fail_script.script)
+
+    def _ensure_group(self, stream: str):
+        """Create the consumer group of a stream (from its first entry) once per process."""
+        if stream in self._groups:
+            return
+        try:
+            self.redis_client.xgroup_create(stream, self.consumer_group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._groups.add(stream)
+
+    def _stage_task(self, pipe, pushes: Dict, task_data: Dict, lane: str,
+                    worker_id: str = None, **fields) -> str:
+        """Stage a task on its route stream (`worker_id` is ignored, see the class docstring)."""
+        return super()._stage_task(pipe, pushes, task_data, lane, **fields)
+
+    def _execute_staged(self, pipe, pushes: Dict):
+        """Run the staged enqueue once the consumer group of every target stream exists."""
+        for _, queue, _ in pushes:
+            self._ensure_group(queue)
+        super()._execute_staged(pipe, pushes)
+
+    def _push_maxlen(self) -> int:
+        """Entries appended by SINGLE_FLIGHT_SCRIPT are trimmed like the others (TASK_STREAM_MAXLEN)."""
+        return self.stream_maxlen
+
+    def _push_ids(self, pipe, route: str, queue: str, task_ids: List[str]):
+        """Append task ids to a route lane stream, with one wake-up token each."""
+        self._ensure_group(queue)
+        pipe.sadd(self.routes_key, route)
+        for task_id in task_ids:
+            pipe.xadd(queue, {'id': task_id}, maxlen=self.stream_maxlen, approximate=True)
+        pipe.lpush(f'{queue}:ready', *[1] * len(task_ids))
+        pipe.hincrby(self.stats_key, 'pending', len(task_ids))
+        pipe.hincrby(self.stats_key, 'total', len(task_ids))
+
+    def _claim_queues(self, worker_id: str, capabilities: List[str] = None, lanes: List[str] = None,
+                      refresh: bool = False) -> List[str]:
+        """Route lane streams of the worker (no dispatch queue, no unrouted list)."""
+        return [queue for queue in self.worker_queues(capabilities, refresh=refresh, lanes=lanes)
+                if queue != self.task_queue]
+
+    def _claim(self, worker_id: str, queues: List[str], max_n: int = 1) -> List[Dict]:
+        """Take over stalled entries or read the next ones (up to `max_n`) and mark their tasks as processing."""
+        started_at = time.time()
+        claimed = self._call_binary(
+            self._stream_claim_script,
+            keys=[self.stats_key, self.finished_key, *queues],
+            args=[self.task_prefix, self.consumer_group, worker_id, started_at,
+                  int(self.visibility_timeout * 1000), self.max_retries, self.result_ttl,
+                  self.job_results_prefix, max_n]
+        )
+        return self._claimed_tasks(claimed, worker_id, started_at)
+
+    def complete_task(self, task_id: str, result: Dict, worker_id: str = None):
+        """Mark task as completed, store its result and XACK its stream entry."""
+        self._complete_script(
+            keys=[f'{self.task_prefix}{task_id}', self.inflight_key, self.stats_key,
+                  self.finished_key, self.result_queue],
+            args=[*self._ack_args(task_id, worker_id, time.time()),
+                  codec.encode(result), self.result_feed_length, self.consumer_group]
+        )
+
+    def fail_task(self, task_id: str, error: str, worker_id: str = None):
+        """Mark task as failed and XACK its stream entry."""
+        self._fail_script(
+            keys=[f'{self.task_prefix}{task_id}', self.inflight_key, self.stats_key, self.finished_key],
+            args=[*self._ack_args(task_id, worker_id, time.time()), error, self.consumer_group]
+        )
+
+    def touch_task(self, task_id: str) -> bool:
+        """Reset the idle time of the task's entry so it is not taken over as stalled."""
+        stream, entry, worker_id, status = self.redis_client.hmget(
+            f'{self.task_prefix}{task_id}', 'stream', 'entry', 'worker_id', 'status')
+        if not stream or status in FINISHED_STATUSES:
+            return False
+        return bool(self.redis_client.xclaim(stream, self.consumer_group, worker_id, 0, [entry], justid=True))
+
+    def touch_tasks(self, task_ids: List[str]) -> int:
+        """Reset the idle time of many tasks' entries: one pipelined read, one pipelined XCLAIM."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hmget(f'{self.task_prefix}{task_id}', 'stream', 'entry', 'worker_id', 'status')
+        deliveries = [fields for fields in pipe.execute() if fields[0] and fields[3] not in FINISHED_STATUSES]
+        if not deliveries:
+            return 0
+        pipe = self.redis_client.pipeline(transaction=False)
+        for stream, entry, worker_id, _ in deliveries:
+            pipe.xclaim(stream, self.consumer_group, worker_id, 0, [entry], justid=True)
+        return sum(1 for claimed in pipe.execute() if claimed)
+
+    def requeue_expired_tasks(self, limit: int = 100) -> Dict[str, int]:
+        """
+        Nothing to do: stalled entries are taken over by the next claim on
+        their stream (XAUTOCLAIM), which also applies TASK_MAX_RETRIES.
+        """
+        return {'requeued': 0, 'failed': 0}
+
+    def requeue_worker_tasks(self, worker_id: str) -> Dict[str, int]:
+        """
+        Make the entries a worker still owns from its previous run stalled now.
+
+        They keep their owner but get an idle time past the visibility
+        timeout (XCLAIM IDLE), so the next claim on their stream takes them.
+        """
+        idle = int(self.visibility_timeout * 1000)
+        released = 0
+        for stream in self._claim_queues(worker_id, refresh=True):
+            if not self.redis_client.exists(stream):
+                continue
+            entries = self.redis_client.xpending_range(stream, self.consumer_group, '-', '+', 1000,
+                                                       consumername=worker_id)
+            if entries:
+                released += len(self.redis_client.xclaim(
+                    stream, self.consumer_group, worker_id, 0,
+                    [entry['message_id'] for entry in entries], idle=idle, justid=True))
+        return {'requeued': released, 'failed': 0}
+
+    def release_tasks(self, worker_id: str, task_ids: List[str]) -> int:
+        """
+        Put tasks a worker claimed but never started back in their streams.
+
+        Their entries are made stalled as in requeue_worker_tasks, but the
+        tasks are pending again first, so the next claim takes them over
+        without counting a retry.
+        """
+        if not task_ids:
+            return 0
+        return self._stream_release_script(
+            keys=[self.stats_key],
+            args=[self.task_prefix, self.consumer_group, worker_id,
+                  int(self.visibility_timeout * 1000), *task_ids]
+        )
+
+    def _queued_length(self, pipe, queue: str):
+        """Entries not delivered yet: the consumer group's lag."""
+        self._lag_script(keys=[queue], args=[self.consumer_group], client=pipe)
+
+    def get_stream_stats(self) -> Dict[str, Dict]:
+        """
+        Delivery metrics of each route lane stream, from XINFO GROUPS and XPENDING.
+
+        Returns:
+            By stream: `lag` (entries not delivered yet), `pending` (delivered,
+            not acked), `oldest_pending_s` (idle time of the oldest pending
+            entry), pending entries by consumer and the stream length
+        """
+        streams = [self._lane_queue(route, lane)
+                   for route in sorted(self.redis_client.smembers(self.routes_key))
+                   for lane in PRIORITY_LANES.values()]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for stream in streams:
+            pipe.exists(stream)
+        streams = [stream for stream, exists in zip(streams, pipe.execute()) if exists]
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for stream in streams:
+            pipe.xlen(stream)
+            self._queued_length(pipe, stream)
+            pipe.xpending(stream, self.consumer_group)
+            pipe.xpending_range(stream, self.consumer_group, '-', '+', 1)
+        replies = pipe.execute()
+
+        stats = {}
+        for index, stream in enumerate(streams):
+            length, lag, summary, oldest = replies[index * 4:(index + 1) * 4]
+            stats[stream[len(self.route_prefix):]] = {
+                'length': length,
+                'lag': lag,
+                'pending': summary['pending'],
+                'oldest_pending_s': round(oldest[0]['time_since_delivered'] / 1000, 3) if oldest else 0.0,
+                'consumers': {consumer['name']: consumer['pending'] for consumer in summary['consumers']}
+            }
+        return stats
+
+    def get_queue_stats(self) -> Dict:
+        """Queue statistics of the list engine plus per-stream delivery metrics (`streams`)."""
+        stats = super().get_queue_stats()
+        stats['engine'] = 'streams'
+        stats['streams'] = self.get_stream_stats()
+        stats['in_flight'] = sum(stream['pending'] for stream in stats['streams'].values())
+        return stats
@@ -1,25 +1,66 @@
-import redis
+import os
 import json
 import time
 import threading
 from typing import Dict, List, Optional
 
+from .connection import get_redis
+from .scheduler import LoadAwareScheduler
+
+# Heartbeat: one atomic round trip. Refreshes liveness and applies stats only
+# if the worker hash still exists; 0 tells the caller to re-register.
+HEARTBEAT_SCRIPT = """
+-- KEYS[1] = worker hash, KEYS[2] = heartbeat zset
+-- ARGV[1] = worker id, ARGV[2] = now, ARGV[3] = retention (seconds),
+-- ARGV[4] = gauges JSON (HSET), ARGV[5] = counter increments JSON (HINCRBYFLOAT)
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'last_heartbeat', ARGV[2], 'status', 'active')
+for field, value in pairs(cjson.decode(ARGV[4])) do
+    redis.call('HSET', KEYS[1], field, tostring(value))
+end
+for field, value in pairs(cjson.decode(ARGV[5])) do
+    redis.call('HINCRBYFLOAT', KEYS[1], field, value)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return 1
+"""
+
+COUNTER_FIELDS = ('tasks_completed', 'tasks_failed')
+FLOAT_FIELDS = ('registered_at', 'last_heartbeat', 'total_processing_time')
+# Load gauges sent by DistributedImageWorker with each heartbeat
+GAUGE_FIELDS = ('concurrency', 'prefetch', 'slots_busy', 'prefetched')
+
+
 class WorkerRegistry:
     """
     Redis-based service discovery and health monitoring for distributed workers.
     Handles worker registration, heartbeats, and failure detection.
+    
+    Each worker owns a hash (worker:<id>) whose stats are updated field by
+    field, and liveness is its score in the workers:heartbeats sorted set:
+    finding active workers is one ZRANGEBYSCORE plus one pipelined read,
+    whatever the fleet size. Worker hashes expire worker_retention seconds
+    after the last heartbeat.
     """
     
-    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0):
-        self.redis_client = redis.Redis(
-            host=redis_host, 
-            port=redis_port, 
-            db=redis_db, 
-            decode_responses=True
-        )
-        self.workers_key = 'workers'
-        self.heartbeat_interval = 30  # seconds
-        self.worker_timeout = 90  # seconds (3 missed heartbeats)
+    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0, redis_client=None):
+        self.redis_client = redis_client or get_redis(redis_host, redis_port, redis_db)
+        self.worker_prefix = 'worker:'
+        self.heartbeats_key = 'workers:heartbeats'
+        self.heartbeat_interval = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', 5))  # seconds
+        self.worker_timeout = float(os.getenv('WORKER_TIMEOUT', 15))  # seconds (3 missed heartbeats)
+        self.worker_retention = 300  # seconds a dead worker stays visible for debugging
+        
+        self._heartbeat_script = self.redis_client.register_script(HEARTBEAT_SCRIPT)
+    
+    def ping(self) -> bool:
+        return self.redis_client.ping()
+    
+    def _worker_key(self, worker_id: str) -> str:
+        return f'{self.worker_prefix}{worker_id}'
         
     def register_worker(self, worker_id: str, capabilities: List[str], 
                        host: str = 'localhost', port: int = None) -> bool:
@@ -35,23 +76,29 @@ class WorkerRegistry:
         Returns:
             True if registration successful
         """
+        now = time.time()
         worker_data = {
             'id': worker_id,
             'capabilities': json.dumps(capabilities),
             'host': host,
             'port': port or '',
             'status': 'active',
-            'registered_at': time.time(),
-            'last_heartbeat': time.time(),
+            'registered_at': now,
+            'last_heartbeat': now,
             'tasks_completed': 0,
             'tasks_failed': 0,
             'total_processing_time': 0.0
         }
         
         try:
-            # Convert all values to strings for Redis storage
-            worker_data_str = {k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) for k, v in worker_data.items()}
-            self.redis_client.hset(self.workers_key, worker_id, json.dumps(worker_data))
+            # Fresh hash + liveness entry in one MULTI/EXEC round trip
+            worker_key = self._worker_key(worker_id)
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(worker_key)
+            pipe.hset(worker_key, mapping={k: str(v) for k, v in worker_data.items()})
+            pipe.expire(worker_key, self.worker_retention)
+            pipe.zadd(self.heartbeats_key, {worker_id: now})
+            pipe.execute()
             print(f"✅ Worker {worker_id} registered successfully")
             return True
         except Exception as e:
@@ -69,8 +116,11 @@ class WorkerRegistry:
             True if removal successful
         """
         try:
-            result = self.redis_client.hdel(self.workers_key, worker_id)
-            if result:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(self._worker_key(worker_id))
+            pipe.zrem(self.heartbeats_key, worker_id)
+            deleted, _ = pipe.execute()
+            if deleted:
                 print(f"✅ Worker {worker_id} unregistered")
                 return True
             else:
@@ -80,38 +130,48 @@ class WorkerRegistry:
             print(f"❌ Failed to unregister worker {worker_id}: {e}")
             return False
     
-    def heartbeat(self, worker_id: str, stats: Optional[Dict] = None) -> bool:
+    def heartbeat(self, worker_id: str, stats: Optional[Dict] = None,
+                  increments: Optional[Dict[str, float]] = None) -> bool:
         """
         Update worker heartbeat and optional stats.
         
         Args:
             worker_id: Worker sending heartbeat
-            stats: Optional performance statistics
+            stats: Optional gauges stored as-is (e.g. last_task_at)
+            increments: Optional counter deltas (e.g. tasks_completed=+2)
             
         Returns:
-            True if heartbeat recorded successfully
+            True if heartbeat recorded, False if the worker is not registered
+            (or Redis failed)
         """
         try:
-            worker_data_json = self.redis_client.hget(self.workers_key, worker_id)
-            if not worker_data_json:
-                print(f"⚠️ Worker {worker_id} not found in registry")
-                return False
-            
-            worker_data = json.loads(worker_data_json)
-            worker_data['last_heartbeat'] = time.time()
-            worker_data['status'] = 'active'
-            
-            # Update stats if provided
-            if stats:
-                worker_data.update(stats)
-            
-            self.redis_client.hset(self.workers_key, worker_id, json.dumps(worker_data))
-            return True
-            
+            return bool(self._heartbeat_script(
+                keys=[self._worker_key(worker_id), self.heartbeats_key],
+                args=[worker_id, time.time(), self.worker_retention,
+                      json.dumps({k: v for k, v in (stats or {}).items() if v is not None}),
+                      json.dumps(increments or {})]
+            ))
         except Exception as e:
             print(f"❌ Failed to record heartbeat for {worker_id}: {e}")
             return False
     
+    @staticmethod
+    def _parse_worker(worker_data: Dict) -> Dict:
+        """Convert hash fields back to proper types."""
+        for field in COUNTER_FIELDS:
+            if worker_data.get(field):
+                worker_data[field] = int(float(worker_data[field]))
+        for field in FLOAT_FIELDS:
+            if worker_data.get(field):
+                worker_data[field] = float(worker_data[field])
+        for field in GAUGE_FIELDS:
+            if worker_data.get(field):
+                worker_data[field] = int(worker_data[field])
+        for field in ('capabilities', 'filter_ewma'):
+            if field in worker_data:
+                worker_data[field] = json.loads(worker_data[field])
+        return worker_data
+    
     def get_worker_info(self, worker_id: str) -> Optional[Dict]:
         """
         Get detailed information about a specific worker.
@@ -123,27 +183,10 @@ class WorkerRegistry:
             Worker data dictionary or None if not found
         """
         try:
-            worker_data_json = self.redis_client.hget(self.workers_key, worker_id)
-            if not worker_data_json:
+            worker_data = self.redis_client.hgetall(self._worker_key(worker_id))
+            if not worker_data:
                 return None
-                
-            worker_data = json.loads(worker_data_json)
-            
-            # Convert numeric fields
-            numeric_fields = ['registered_at', 'last_heartbeat', 'tasks_completed', 
-                            'tasks_failed', 'total_processing_time']
-            for field in numeric_fields:
-                if field in worker_data and worker_data[field]:
-                    if field in ['tasks_completed', 'tasks_failed']:
-                        worker_data[field] = int(worker_data[field])
-                    else:
-                        worker_data[field] = float(worker_data[field])
-            
-            # Parse capabilities back to list
-            if 'capabilities' in worker_data:
-                worker_data['capabilities'] = json.loads(worker_data['capabilities'])
-            
-            return worker_data
+            return self._parse_worker(worker_data)
             
         except Exception as e:
             print(f"❌ Failed to get worker info for {worker_id}: {e}")
@@ -160,27 +203,24 @@ class WorkerRegistry:
         active_workers = []
         
         try:
-            all_workers = self.redis_client.hgetall(self.workers_key)
+            heartbeats = self.redis_client.zrangebyscore(
+                self.heartbeats_key, current_time - self.worker_timeout, '+inf', withscores=True
+            )
+            if not heartbeats:
+                return []
             
-            for worker_id, worker_data_json in all_workers.items():
-                worker_data = json.loads(worker_data_json)
-                last_heartbeat = float(worker_data.get('last_heartbeat', 0))
-                
-                # Check if worker is considered active
-                if current_time - last_heartbeat <= self.worker_timeout:
-                    worker_data['id'] = worker_id
-                    worker_data['is_active'] = True
-                    worker_data['time_since_heartbeat'] = current_time - last_heartbeat
-                    
-                    # Parse capabilities
-                    if 'capabilities' in worker_data:
-                        worker_data['capabilities'] = json.loads(worker_data['capabilities'])
-                    
-                    active_workers.append(worker_data)
-                else:
-                    # Mark as inactive but don't remove (for debugging)
-                    worker_data['status'] = 'inactive'
-                    self.redis_client.hset(self.workers_key, worker_id, json.dumps(worker_data))
+            pipe = self.redis_client.pipeline(transaction=False)
+            for worker_id, _ in heartbeats:
+                pipe.hgetall(self._worker_key(worker_id))
+            
+            for (worker_id, last_heartbeat), worker_data in zip(heartbeats, pipe.execute()):
+                if not worker_data:
+                    continue
+                worker_data = self._parse_worker(worker_data)
+                worker_data['id'] = worker_id
+                worker_data['is_active'] = True
+                worker_data['time_since_heartbeat'] = current_time - last_heartbeat
+                active_workers.append(worker_data)
             
             return active_workers
             
@@ -208,27 +248,28 @@ class WorkerRegistry:
         
         return matching_workers
     
-    def get_least_busy_worker(self, capability: str = None) -> Optional[Dict]:
+    def get_active_worker_ids(self) -> List[str]:
+        """Ids of the workers with a recent heartbeat (one ZRANGEBYSCORE)."""
+        return self.redis_client.zrangebyscore(self.heartbeats_key, time.time() - self.worker_timeout, '+inf')
+    
+    def get_least_busy_worker(self, capability: str = None, filters: List[str] = None) -> Optional[Dict]:
         """
-        Get the worker with the least number of completed tasks.
+        Get the worker that would finish a new task first.
+        
+        Ranks by expected completion time from the tasks each worker holds
+        right now and its per-filter processing time EWMA (see
+        distributed.scheduler), not by lifetime tasks_completed, which made a
+        freshly started worker look idle whatever its load.
         
         Args:
             capability: Optional filter to workers with specific capability
+            filters: Optional filter chain of the task (implies the capabilities)
             
         Returns:
             Worker data dictionary of least busy worker
         """
-        if capability:
-            workers = self.get_workers_by_capability(capability)
-        else:
-            workers = self.get_active_workers()
-        
-        if not workers:
-            return None
-        
-        # Sort by tasks_completed (ascending)
-        least_busy = min(workers, key=lambda w: w.get('tasks_completed', 0))
-        return least_busy
+        filters = list(filters or ([capability] if capability else []))
+        return LoadAwareScheduler(self.get_active_workers(), strategy='least_ect').pick(filters)
     
     def cleanup_inactive_workers(self) -> int:
         """
@@ -237,28 +278,29 @@ class WorkerRegistry:
         Returns:
             Number of workers removed
         """
-        current_time = time.time()
-        removed_count = 0
+        cutoff = time.time() - self.worker_retention
         
         try:
-            all_workers = self.redis_client.hgetall(self.workers_key)
+            stale = self.redis_client.zrangebyscore(self.heartbeats_key, '-inf', cutoff)
+            if not stale:
+                return 0
             
-            for worker_id, worker_data_json in all_workers.items():
-                worker_data = json.loads(worker_data_json)
-                last_heartbeat = float(worker_data.get('last_heartbeat', 0))
-                
-                # Remove workers inactive for more than 5 minutes
-                if current_time - last_heartbeat > 300:
-                    self.redis_client.hdel(self.workers_key, worker_id)
-                    removed_count += 1
-                    print(f"🧹 Removed inactive worker: {worker_id}")
-            
-            return removed_count
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(*[self._worker_key(worker_id) for worker_id in stale])
+            pipe.zrem(self.heartbeats_key, *stale)
+            pipe.execute()
+            for worker_id in stale:
+                print(f"🧹 Removed inactive worker: {worker_id}")
+            return len(stale)
             
         except Exception as e:
             print(f"❌ Failed to cleanup inactive workers: {e}")
             return 0
     
+    def count_workers(self) -> int:
+        """Workers known to the registry, active or not (until worker_retention)."""
+        return self.redis_client.zcard(self.heartbeats_key)
+    
     def get_registry_stats(self) -> Dict:
         """
         Get overall registry statistics.
@@ -267,7 +309,7 @@ class WorkerRegistry:
             Dictionary with registry stats
         """
         active_workers = self.get_active_workers()
-        all_workers = self.redis_client.hgetall(self.workers_key)
+        total_workers = self.count_workers()
         
         total_tasks = sum(int(w.get('tasks_completed', 0)) for w in active_workers)
         total_failures = sum(int(w.get('tasks_failed', 0)) for w in active_workers)
@@ -279,7 +321,7 @@ class WorkerRegistry:
             capabilities.update(worker_caps)
         
         return {
-            'total_workers': len(all_workers),
+            'total_workers': total_workers,
             'active_workers': len(active_workers),
             'total_tasks_completed': total_tasks,
             'total_failures': total_failures,
@@ -291,6 +333,9 @@ class WorkerRegistry:
 class HeartbeatManager:
     """
     Manages automatic heartbeat sending for a worker.
+    
+    Counters recorded with record_task() are sent as increments with the
+    next heartbeat, so finishing a task costs no extra round trip.
     """
     
     def __init__(self, registry: WorkerRegistry, worker_id: str):
@@ -298,11 +343,11 @@ class HeartbeatManager:
         self.worker_id = worker_id
         self.running = False
         self.thread = None
-        self.stats = {
-            'tasks_completed': 0,
-            'tasks_failed': 0,
-            'total_processing_time': 0.0
-        }
+        self.stats = {}
+        self.stats_provider = None  # Optional callable returning gauges for each heartbeat
+        self._increments: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
     
     def start(self):
         """Start automatic heartbeat sending."""
@@ -310,6 +355,7 @@ class HeartbeatManager:
             return
         
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
         self.thread.start()
         print(f"❤️ Started heartbeat for worker {self.worker_id}")
@@ -317,40 +363,62 @@ class HeartbeatManager:
     def stop(self):
         """Stop automatic heartbeat sending."""
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join(timeout=5)
         print(f"💔 Stopped heartbeat for worker {self.worker_id}")
     
     def update_stats(self, **kwargs):
-        """Update worker statistics."""
-        self.stats.update(kwargs)
+        """Update worker gauges (stored as-is with the next heartbeat)."""
+        with self._lock:
+            self.stats.update(kwargs)
+    
+    def record_task(self, success: bool, processing_time: float = 0.0):
+        """Count a finished task; sent as HINCRBY deltas with the next heartbeat."""
+        self._add_increments({
+            'tasks_completed' if success else 'tasks_failed': 1,
+            'total_processing_time': processing_time
+        })
+    
+    def _add_increments(self, increments: Dict[str, float]):
+        with self._lock:
+            for field, value in increments.items():
+                self._increments[field] = self._increments.get(field, 0) + value
+    
+    def _take_increments(self) -> Dict[str, float]:
+        with self._lock:
+            increments, self._increments = self._increments, {}
+            return increments
     
     def _heartbeat_loop(self):
         """Internal heartbeat loop with auto-reregistration."""
         while self.running:
+            if self.stats_provider:
+                try:
+                    self.update_stats(**self.stats_provider())
+                except Exception as e:
+                    print(f"⚠️ Could not collect stats for {self.worker_id}: {e}")
+            increments = self._take_increments()
+            with self._lock:
+                stats = dict(self.stats)
             try:
-                # Check if worker is still registered
-                worker_info = self.registry.get_worker_info(self.worker_id)
-                if not worker_info:
+                if not self.registry.heartbeat(self.worker_id, stats, increments):
+                    # Hash gone (expired, flushed) or Redis error: register again
                     print(f"⚠️ Worker {self.worker_id} not found in registry, re-registering...")
-                    # Re-register with stored capabilities  
-                    if hasattr(self, 'capabilities'):
-                        success = self.registry.register_worker(
-                            self.worker_id,
-                            self.capabilities,
-                            host=getattr(self, 'host', 'container')
-                        )
-                        if success:
-                            print(f"✅ Worker {self.worker_id} re-registered successfully")
-                        else:
-                            print(f"❌ Failed to re-register worker {self.worker_id}")
-                
-                # Send heartbeat
-                self.registry.heartbeat(self.worker_id, self.stats)
-                time.sleep(self.registry.heartbeat_interval)
+                    registered = hasattr(self, 'capabilities') and self.registry.register_worker(
+                        self.worker_id,
+                        self.capabilities,
+                        host=getattr(self, 'host', 'container')
+                    )
+                    if registered and self.registry.heartbeat(self.worker_id, stats, increments):
+                        print(f"✅ Worker {self.worker_id} re-registered successfully")
+                    else:
+                        print(f"❌ Failed to re-register worker {self.worker_id}")
+                        self._add_increments(increments)
             except Exception as e:
                 print(f"❌ Heartbeat failed for {self.worker_id}: {e}")
-                time.sleep(5)  # Wait before retry
+                self._add_increments(increments)
+            self._stop_event.wait(self.registry.heartbeat_interval)
 
 
 def test_worker_registry():
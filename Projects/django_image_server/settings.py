@@ -89,6 +89,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 DATA_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100MB
 
+# Tamaño de bloque al servir imágenes en streaming (cada descarga sólo tiene un bloque en memoria)
+IMAGE_STREAM_CHUNK_SIZE = int(os.getenv('IMAGE_STREAM_CHUNK_SIZE', 256 * 1024))  # 256KB
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -0,0 +1,327 @@
+"""
+🚦 Admission Control - Backpressure del API antes de aceptar trabajo
+
+Sin control de admisión process-batch/distributed/ encola aunque haya miles
+de tareas esperando: en un pico la cola crece sin límite y la latencia de
+todos los clientes se dispara. Antes de aceptar trabajo se comprueba:
+
+- Límite por cliente (token bucket): API_RATE_LIMIT peticiones/s con ráfagas
+  de hasta API_RATE_BURST; si se agota se responde 429
+- Profundidad de cada carril de prioridad (distribuido): si las tareas que
+  esperan en el carril más las nuevas superan TASK_MAX_QUEUE_DEPTH, 503
+- Backlog síncrono (multiprocessing/stress test): imágenes admitidas y aún
+  sin terminar en este proceso; por encima de SYNC_MAX_BACKLOG, 503. Una
+  sola petición con más imágenes que SYNC_MAX_BACKLOG nunca se admite (413)
+
+Retry-After se calcula con el ritmo de drenado actual (media móvil de
+tareas terminadas por segundo): el tiempo que tarda en vaciarse el exceso.
+Un carril vacío siempre admite la petición, aunque pida más que el límite:
+así un job distribuido grande nunca queda bloqueado para siempre (se encola
+y los workers lo drenan a su ritmo). Los endpoints síncronos, en cambio,
+ocupan el pool de procesos de la API mientras dura la petición.
+
+Configuración (variables de entorno):
+    TASK_MAX_QUEUE_DEPTH        Tareas esperando por carril (default: 10000, 0 = sin límite)
+    TASK_MAX_QUEUE_DEPTH_HIGH   Límite propio del carril high (idem _NORMAL, _LOW)
+    SYNC_MAX_BACKLOG            Imágenes en curso en endpoints síncronos (default: 2 x IMAGE_POOL_MAX_PENDING)
+    API_RATE_LIMIT              Peticiones por segundo por cliente (default: 0 = sin límite)
+    API_RATE_BURST              Ráfaga máxima por cliente (default: 2 x API_RATE_LIMIT)
+    API_TRUST_FORWARDED_FOR     1: el cliente es la primera IP de X-Forwarded-For (detrás de nginx)
+    ADMISSION_STATS_TTL         Segundos que se reutilizan las estadísticas de la cola (default: 1)
+    ADMISSION_MAX_RETRY_AFTER   Retry-After máximo en segundos (default: 60)
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE_DEPTH = 10000
+DEFAULT_RETRY_AFTER = 5.0  # sin ritmo de drenado medido todavía
+DRAIN_EWMA_ALPHA = 0.3
+MAX_TRACKED_CLIENTS = 10000
+
+LANES = ('high', 'normal', 'low')
+
+
+class AdmissionRejected(Exception):
+    """La petición no se admite ahora: 429 (límite del cliente) o 503 (sistema lleno)"""
+
+    def __init__(self, message: str, status: int, retry_after: float, details: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.details = details or {}
+
+
+def client_id(request) -> str:
+    """🪪 Identidad del cliente para el rate limit: IP remota (o X-Forwarded-For si se confía en el proxy)"""
+    if os.getenv('API_TRUST_FORWARDED_FOR', '0') == '1':
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+class TokenBucket:
+    """🪣 `rate` tokens por segundo, acumulables hasta `burst`"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Consumir un token; devuelve 0 o los segundos hasta que haya uno"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class DrainRate:
+    """
+    📉 Ritmo de drenado: media móvil de tareas terminadas por segundo
+
+    Se alimenta con un contador acumulado (completed + failed); si el
+    contador baja (limpieza de tareas) se toma como nueva referencia.
+    """
+
+    def __init__(self, alpha: float = DRAIN_EWMA_ALPHA):
+        self.alpha = alpha
+        self.rate = 0.0
+        self._last = None  # (instante, contador)
+
+    def observe(self, finished: int, now: float):
+        if self._last is not None and finished >= self._last[1] and now > self._last[0]:
+            sample = (finished - self._last[1]) / (now - self._last[0])
+            self.rate = sample if self.rate == 0 else self.alpha * sample + (1 - self.alpha) * self.rate
+        self._last = (now, finished)
+
+    def retry_after(self, excess: int, limit: float) -> float:
+        """Segundos hasta drenar `excess` tareas al ritmo actual, entre 1 y `limit`"""
+        if self.rate <= 0:
+            return min(DEFAULT_RETRY_AFTER, limit)
+        return max(1.0, min(limit, math.ceil(excess / self.rate)))
+
+
+class AdmissionController:
+    """
+    🚦 Decide si se acepta una petición (compartido por todo el proceso)
+
+    - check_client(request): token bucket del cliente (429)
+    - check_queue(task_queue, incoming): profundidad por carril (503)
+    - admit_sync(count): context manager para los endpoints síncronos (503, 413)
+    """
+
+    def __init__(self):
+        default_depth = int(os.getenv('TASK_MAX_QUEUE_DEPTH', DEFAULT_MAX_QUEUE_DEPTH))
+        self.max_depth = {lane: int(os.getenv(f'TASK_MAX_QUEUE_DEPTH_{lane.upper()}', default_depth))
+                          for lane in LANES}
+        self.rate_limit = float(os.getenv('API_RATE_LIMIT', 0))
+        self.rate_burst = float(os.getenv('API_RATE_BURST', 0)) or max(1.0, 2 * self.rate_limit)
+        self.stats_ttl = float(os.getenv('ADMISSION_STATS_TTL', 1))
+        self.max_retry_after = float(os.getenv('ADMISSION_MAX_RETRY_AFTER', 60))
+        self._sync_limit = int(os.getenv('SYNC_MAX_BACKLOG', 0)) or None
+
+        self._lock = threading.Lock()
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._queue_stats = None
+        self._queue_stats_at = 0.0
+        self._queue_admitted = dict.fromkeys(LANES, 0)  # admitidas desde la última lectura
+        self._queue_drain = DrainRate()
+        self._sync_backlog = 0
+        self._sync_drain = DrainRate()
+
+        # Métricas
+        self.admitted = 0
+        self.rejected = {'rate_limited': 0, 'queue_full': 0, 'sync_backlog': 0, 'request_too_large': 0}
+
+    # ------------------------------------------------------------------
+    # 🪣 Límite por cliente
+    # ------------------------------------------------------------------
+
+    def check_client(self, request):
+        """Consumir un token del cliente o lanzar AdmissionRejected (429)"""
+        if self.rate_limit <= 0:
+            return
+        client = client_id(request)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                self._prune_buckets(now)
+                bucket = self._buckets[client] = TokenBucket(self.rate_limit, self.rate_burst, now)
+            self._buckets.move_to_end(client)
+            wait = bucket.take(now)
+            if wait:
+                self.rejected['rate_limited'] += 1
+        if wait:
+            raise AdmissionRejected(
+                f"Rate limit exceeded for {client}: {self.rate_limit:g} requests/s (burst {self.rate_burst:g})",
+                status=429, retry_after=max(1.0, math.ceil(wait)), details={'reason': 'rate_limited'}
+            )
+
+    def _prune_buckets(self, now: float):
+        """Olvidar clientes inactivos (bucket lleno) cuando se siguen demasiados"""
+        if len(self._buckets) < MAX_TRACKED_CLIENTS:
+            return
+        for client, bucket in list(self._buckets.items()):
+            if len(self._buckets) <= MAX_TRACKED_CLIENTS // 2:
+                break
+            if bucket.is_full(now):
+                del self._buckets[client]
+        while len(self._buckets) >= MAX_TRACKED_CLIENTS:
+            self._buckets.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # 📏 Profundidad de la cola distribuida
+    # ------------------------------------------------------------------
+
+    def _lane_depths(self, task_queue) -> Dict[str, int]:
+        """
+        Tareas esperando por carril
+
+        Las estadísticas se reutilizan stats_ttl segundos; las subtareas
+        admitidas entretanto se suman para no dejar pasar un pico entero.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stats = self._queue_stats if now - self._queue_stats_at < self.stats_ttl else None
+        if stats is None:
+            stats = task_queue.get_queue_stats()
+            finished = sum(stats.get('status_breakdown', {}).get(status, 0) for status in ('completed', 'failed'))
+            with self._lock:
+                self._queue_stats, self._queue_stats_at = stats, now
+                self._queue_admitted = dict.fromkeys(LANES, 0)
+                self._queue_drain.observe(finished, now)
+        # Las colas de dispatch (TASK_DISPATCH=scheduled) se sirven antes que los carriles
+        dispatched = sum(stats.get('dispatched', {}).values())
+        with self._lock:
+            return {lane: stats.get('lanes', {}).get(lane, 0) + dispatched + self._queue_admitted[lane]
+                    for lane in LANES}
+
+    def check_queue(self, task_queue, incoming: Dict[str, int]):
+        """
+        Comprobar que las subtareas nuevas (por carril) caben en la cola
+
+        Raises:
+            AdmissionRejected (503) con Retry-After según el ritmo de drenado
+        """
+        limits = {lane: self.max_depth[lane] for lane in incoming if self.max_depth.get(lane, 0) > 0}
+        depths = self._lane_depths(task_queue) if limits else {}
+        for lane, limit in limits.items():
+            depth = depths[lane]
+            if depth == 0 or depth + incoming[lane] <= limit:
+                continue
+            with self._lock:
+                self.rejected['queue_full'] += 1
+                retry_after = self._queue_drain.retry_after(depth + incoming[lane] - limit, self.max_retry_after)
+            raise AdmissionRejected(
+                f"Queue lane '{lane}' is full: {depth} tasks waiting, limit {limit}",
+                status=503, retry_after=retry_after,
+                details={'reason': 'queue_full', 'lane': lane, 'depth': depth,
+                         'limit': limit, 'incoming': incoming[lane]}
+            )
+        with self._lock:
+            for lane, count in incoming.items():
+                self._queue_admitted[lane] = self._queue_admitted.get(lane, 0) + count
+            self.admitted += 1
+
+    # ------------------------------------------------------------------
+    # 🔄 Backlog de los endpoints síncronos
+    # ------------------------------------------------------------------
+
+    def sync_limit(self) -> int:
+        """Imágenes en curso admitidas en los endpoints síncronos (SYNC_MAX_BACKLOG)"""
+        from .process_pool import get_process_pool
+
+        return self._sync_limit or 2 * get_process_pool().max_pending
+
+    @contextmanager
+    def admit_sync(self, count: int):
+        """
+        Reservar `count` imágenes del backlog síncrono mientras dura el bloque
+
+        El ritmo de drenado es el de tareas completadas por el pool de procesos.
+
+        Raises:
+            AdmissionRejected (413) si la petición sola supera el límite,
+            (503) si el backlog actual no la admite
+        """
+        from .process_pool import get_process_pool
+
+        pool = get_process_pool()
+        limit = self.sync_limit()
+        if count > limit:
+            with self._lock:
+                self.rejected['request_too_large'] += 1
+            raise AdmissionRejected(
+                f"Too many images in one request: {count} > {limit}",
+                status=413, retry_after=0,
+                details={'reason': 'request_too_large', 'limit': limit, 'incoming': count}
+            )
+        now = time.monotonic()
+        with self._lock:
+            self._sync_drain.observe(pool.completed, now)
+            backlog = self._sync_backlog
+            if backlog and backlog + count > limit:
+                self.rejected['sync_backlog'] += 1
+                retry_after = self._sync_drain.retry_after(backlog + count - limit, self.max_retry_after)
+            else:
+                retry_after = None
+                self._sync_backlog += count
+                self.admitted += 1
+        if retry_after is not None:
+            raise AdmissionRejected(
+                f"Too many images in progress: {backlog} admitted, limit {limit}",
+                status=503, retry_after=retry_after,
+                details={'reason': 'sync_backlog', 'backlog': backlog, 'limit': limit, 'incoming': count}
+            )
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sync_backlog -= count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Estadísticas de admisión"""
+        sync_limit = self.sync_limit()
+        with self._lock:
+            return {
+                'max_queue_depth': dict(self.max_depth),
+                'queue_drain_rate': round(self._queue_drain.rate, 2),
+                'sync_backlog': self._sync_backlog,
+                'sync_max_backlog': sync_limit,
+                'sync_drain_rate': round(self._sync_drain.rate, 2),
+                'rate_limit': self.rate_limit,
+                'rate_burst': self.rate_burst,
+                'tracked_clients': len(self._buckets),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected)
+            }
+
+
+_admission: Optional[AdmissionController] = None
+_admission_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """🏭 Controlador compartido por todo el proceso"""
+    global _admission
+    with _admission_lock:
+        if _admission is None:
+            _admission = AdmissionController()
+        return _admission
@@ -1,6 +1,15 @@
+import os
+import threading
+
 from django.apps import AppConfig
 
 
 class ImageApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'image_api' 
\ No newline at end of file
+    name = 'image_api'
+
+    def ready(self):
+        # Arrancar el pool de procesos al iniciar en lugar de en la primera request
+        if os.getenv('IMAGE_POOL_PREWARM', '0') == '1':
+            from .process_pool import get_process_pool
+            threading.Thread(target=get_process_pool().warm_up, name="PoolWarmup", daemon=True).start()
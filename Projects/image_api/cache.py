@@ -0,0 +1,426 @@
+"""
+💾 Result Cache - Caché de resultados direccionada por contenido
+
+La misma (imagen, cadena de filtros, parámetros) siempre produce el mismo
+resultado, así que la clave es el sha256 del archivo fuente + la cadena de
+filtros y sus parámetros en forma canónica. Un hit devuelve el archivo ya
+procesado sin tocar Pillow/OpenCV.
+
+El tamaño en disco está acotado con desalojo LRU: el mtime de cada
+resultado marca su último uso y, al pasar el límite, se borran los más
+antiguos. El directorio puede ser compartido por varios procesos/containers
+(API + workers montan el mismo static/).
+
+Las entradas siguen un único esquema (ENTRY_FIELDS) que escriben tanto
+ImageProcessor (API) como los workers distribuidos, así que una entrada
+escrita por uno es un hit para el otro.
+
+Configuración (variables de entorno):
+    RESULT_CACHE_DIR     Directorio de la caché (default: static/processed/cache)
+    RESULT_CACHE_MAX_MB  Límite en MB, 0 desactiva la caché (default: 512)
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = 'static/processed/cache'
+DEFAULT_MAX_MB = 512
+
+# Al desalojar se baja hasta este porcentaje del límite para no desalojar en cada put
+EVICTION_LOW_WATERMARK = 0.9
+
+# Archivos de staging más viejos que esto se consideran huérfanos
+STALE_STAGING_SECONDS = 3600
+
+# Campos de metadata de toda entrada (además de key, output_path y cached_at)
+ENTRY_FIELDS = ('source_path', 'filters', 'filter_params', 'file_size', 'filter_status', 'filter_results')
+
+# path -> (size, mtime_ns, sha256): evita re-hashear la misma imagen en cada request
+_digest_memo: Dict[str, tuple] = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path) -> str:
+    """
+    🔑 sha256 del contenido de un archivo
+
+    Memorizado por (path, tamaño, mtime): sólo se vuelve a leer si el archivo cambió.
+    """
+    path = str(path)
+    stat = os.stat(path)
+
+    with _digest_lock:
+        memo = _digest_memo.get(path)
+    if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+        return memo[2]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def canonical_chain(filters: List[str], filter_params: Optional[Dict] = None, tiled: bool = False) -> str:
+    """
+    🧾 Representación canónica de (cadena de filtros, parámetros)
+
+    Sólo cuentan los parámetros de filtros presentes en la cadena, y se
+    normalizan igual que en FilterFactory (p.ej. width/height -> size).
+    tiled sólo cuenta si algún filtro da otro resultado por tiles (edges).
+    """
+    from .filters import FilterFactory
+    from .tiling import INEXACT_TILED_FILTERS
+
+    filter_params = filter_params or {}
+    stages = []
+    for filter_name in filters:
+        params = FilterFactory._resolve_params(filter_name, filter_params)
+        stages.append([filter_name, params])
+    if tiled and INEXACT_TILED_FILTERS.intersection(filters):
+        stages.append(['tiled', {}])
+    return json.dumps(stages, sort_keys=True, separators=(',', ':'), default=list)
+
+
+def chain_summary(chain: Dict[str, Any]) -> Dict[str, Any]:
+    """🧾 Resultado de apply_filter_chain sin imágenes PIL (serializable)"""
+    summary = {k: v for k, v in chain.items() if k != 'final_image'}
+    summary['filter_results'] = [{k: v for k, v in result.items() if k != 'image'}
+                                 for result in chain.get('filter_results', [])]
+    return summary
+
+
+def entry_metadata(source_path: str, filters: List[str], filter_params: Optional[Dict],
+                   chain: Dict[str, Any], file_size: int = 0,
+                   filter_status: str = 'real_filters_applied') -> Dict[str, Any]:
+    """
+    📋 Metadata de una entrada nueva con todos los ENTRY_FIELDS
+
+    chain es el resultado (ya sin imágenes) de apply_filter_chain.
+    """
+    return {
+        'source_path': source_path,
+        'filters': list(filters),
+        'filter_params': filter_params or {},
+        'file_size': file_size,
+        'filter_status': filter_status,
+        'filter_results': chain
+    }
+
+
+def _complete_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Rellenar los ENTRY_FIELDS que falten (entradas escritas antes de compartir el esquema)"""
+    entry.setdefault('source_path', None)
+    entry.setdefault('filters', entry.get('filter_results', {}).get('filters_applied', []))
+    entry.setdefault('filter_params', {})
+    entry.setdefault('file_size', 0)
+    entry.setdefault('filter_status', 'cached')
+    entry.setdefault('filter_results', {
+        'filter_results': [],
+        'filters_applied': entry['filters'],
+        'output_path': entry['output_path'],
+        'fused': True
+    })
+    return entry
+
+
+class ResultCache:
+    """
+    💾 Caché en disco de imágenes procesadas, con límite de tamaño LRU
+
+    Uso típico:
+        key = cache.key_for(path, filters, params)
+        entry = cache.get(key)
+        if entry is None:
+            staging = cache.staging_path(key, path)
+            ... generar el resultado en `staging` ...
+            entry = cache.put(key, staging, metadata)
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = Path(cache_dir or os.getenv('RESULT_CACHE_DIR', DEFAULT_CACHE_DIR))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('RESULT_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+
+        self._lock = threading.Lock()
+        self._total_bytes = None  # Se calcula con un scan en el primer put
+
+        # Métricas (la caché se comparte entre los threads de las requests)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # =====================================================================
+    # 🔑 CLAVES Y RUTAS
+    # =====================================================================
+
+    def key_for(self, source_path: str, filters: List[str], filter_params: Dict = None,
+                tiled: bool = False) -> Optional[str]:
+        """Clave de contenido para (imagen, filtros, parámetros, modo tiled); None si la caché está desactivada"""
+        if not self.enabled:
+            return None
+        chain = canonical_chain(filters, filter_params, tiled)
+        return hashlib.sha256(f"{file_digest(source_path)}:{chain}".encode()).hexdigest()
+
+    def _entry_paths(self, key: str, suffix: str):
+        return self.cache_dir / f"{key}{suffix}", self.cache_dir / f"{key}.json"
+
+    def staging_path(self, key: Optional[str], source_path: str) -> Optional[str]:
+        """
+        📁 Ruta temporal donde generar el resultado antes de publicarlo con put()
+
+        Devuelve None si la caché está desactivada (el pipeline usa su ruta por defecto).
+        """
+        if key is None:
+            return None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        suffix = Path(source_path).suffix or '.jpg'
+        return str(self.cache_dir / f"{key}.tmp-{uuid.uuid4().hex[:8]}{suffix}")
+
+    # =====================================================================
+    # 📖 LECTURA / ESCRITURA
+    # =====================================================================
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        📖 Buscar una entrada; None si no existe
+
+        Sólo lee el JSON de metadata y comprueba el archivo: no decodifica la imagen.
+        """
+        if key is None:
+            return None
+
+        meta_path = self.cache_dir / f"{key}.json"
+        try:
+            entry = json.loads(meta_path.read_text())
+            output_path = entry['output_path']
+            # Marcar como usado recientemente (LRU)
+            os.utime(output_path)
+        except (OSError, ValueError, KeyError):
+            with self._stats_lock:
+                self.misses += 1
+            return None
+
+        with self._stats_lock:
+            self.hits += 1
+        return _complete_entry(entry)
+
+    def contains(self, key: Optional[str]) -> bool:
+        """🔎 ¿Hay entrada para key? No cuenta como hit/miss ni la marca como usada"""
+        if key is None:
+            return False
+        try:
+            entry = json.loads((self.cache_dir / f"{key}.json").read_text())
+            return Path(entry['output_path']).exists()
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def put(self, key: Optional[str], staging_path: Optional[str], metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        💾 Publicar un resultado generado en staging_path
+
+        El archivo se mueve atómicamente a su ruta definitiva y las rutas de
+        staging dentro de metadata se reescriben. metadata debería traer los
+        ENTRY_FIELDS (ver entry_metadata). Devuelve la entrada guardada.
+        """
+        if key is None or not staging_path or not Path(staging_path).exists():
+            return metadata
+
+        output_path, meta_path = self._entry_paths(key, Path(staging_path).suffix)
+        os.replace(staging_path, output_path)
+
+        entry = _replace_value(metadata, staging_path, str(output_path))
+        entry.update({
+            'key': key,
+            'output_path': str(output_path),
+            'cached_at': time.time()
+        })
+        _complete_entry(entry)
+
+        # Escritura atómica: un lector nunca ve un JSON a medias
+        tmp_meta = meta_path.with_name(f"{meta_path.name}.tmp-{uuid.uuid4().hex[:8]}")
+        tmp_meta.write_text(json.dumps(entry, default=str))
+        os.replace(tmp_meta, meta_path)
+
+        self._account(output_path.stat().st_size + meta_path.stat().st_size)
+        return entry
+
+    def discard(self, staging_path: Optional[str]):
+        """🗑️ Borrar un resultado en staging que no se va a cachear"""
+        if staging_path:
+            try:
+                os.remove(staging_path)
+            except OSError:
+                pass
+
+    # =====================================================================
+    # 🧹 DESALOJO LRU
+    # =====================================================================
+
+    def _account(self, added_bytes: int):
+        """Sumar bytes nuevos y desalojar si se supera el límite"""
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan_entries())
+            else:
+                self._total_bytes += added_bytes
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_entries(self):
+        """Listar entradas como (key, bytes, último uso) con un único scan del directorio"""
+        entries: Dict[str, list] = {}
+        now = time.time()
+        try:
+            dir_entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            return []
+
+        for dir_entry in dir_entries:
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+
+            if '.tmp-' in dir_entry.name:
+                # Staging huérfano de un proceso que murió a mitad
+                if now - stat.st_mtime > STALE_STAGING_SECONDS:
+                    self.discard(dir_entry.path)
+                continue
+
+            key, _, suffix = dir_entry.name.partition('.')
+            entry = entries.setdefault(key, [key, 0, 0.0])
+            entry[1] += stat.st_size
+            if suffix != 'json':
+                entry[2] = max(entry[2], stat.st_mtime)
+
+        return [tuple(entry) for entry in entries.values()]
+
+    def _evict(self):
+        """Borrar las entradas menos usadas hasta bajar del low watermark"""
+        entries = sorted(self._scan_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICTION_LOW_WATERMARK
+
+        for key, size, _ in entries:
+            if total <= target:
+                break
+            for path in self.cache_dir.glob(f"{key}.*"):
+                if '.tmp-' not in path.name:
+                    self.discard(str(path))
+            total -= size
+            self.evictions += 1
+            logger.info(f"🧹 Cache eviction: {key[:12]} ({size} bytes)")
+
+        self._total_bytes = total
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Estadísticas de la caché"""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'enabled': self.enabled,
+            'cache_dir': str(self.cache_dir),
+            'max_bytes': self.max_bytes,
+            'total_bytes': self._total_bytes,
+            'hits': hits,
+            'misses': misses,
+            'evictions': self.evictions,
+            'hit_rate': (hits / lookups * 100) if lookups else 0.0
+        }
+
+
+def _replace_value(value: Any, old: str, new: str) -> Any:
+    """Copiar una estructura JSON reemplazando el string `old` por `new`"""
+    if isinstance(value, dict):
+        return {k: _replace_value(v, old, new) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_replace_value(v, old, new) for v in value]
+    if value == old:
+        return new
+    return value
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """🏭 Instancia de ResultCache compartida por el proceso"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+
+# =====================================================================
+# 🧪 TESTING
+# =====================================================================
+
+def test_shared_entries(image_path: str = None):
+    """
+    🧪 Una entrada escrita por la API es un hit para un worker, y al revés
+
+    Usa una caché temporal con el mismo esquema de lectura de cada lado:
+    el worker lee filter_results['filter_results'], la API output_path,
+    file_size y filter_status.
+    """
+    import tempfile
+    from . import cache as cache_module  # el módulo que usa ImageProcessor (también con python -m)
+    from .filters import FilterFactory
+    from .processors import ImageProcessor
+
+    image_path = image_path or 'static/images/sample_4k.jpg'
+    previous = cache_module._result_cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_module._result_cache = cache = ResultCache(cache_dir=cache_dir)
+        try:
+            # API -> worker
+            ImageProcessor().process_single_image(image_path, ['resize'])
+            entry = cache.get(cache.key_for(image_path, ['resize']))
+            assert entry is not None, "API entry not found"
+            assert isinstance(entry['filter_results'].get('filter_results'), list), "API entry lacks filter_results"
+
+            # Worker -> API (mismo camino que DistributedImageWorker._process_task)
+            filters = ['resize', 'brightness']
+            key = cache.key_for(image_path, filters)
+            staging_path = cache.staging_path(key, image_path)
+            chain = FilterFactory.apply_filter_chain(image_path, filters, fused=True, output_path=staging_path)
+            cache.put(key, staging_path, entry_metadata(image_path, filters, {}, chain_summary(chain),
+                                                        file_size=Path(image_path).stat().st_size))
+            result = ImageProcessor().process_single_image(image_path, filters)
+            assert result['cache_hit'], "worker entry was not a hit for the API"
+            assert result['processed_path'].startswith(cache_dir), result['processed_path']
+
+            # Entradas sin el esquema común siguen siendo hits completos
+            key = cache.key_for(image_path, ['blur'])
+            staging_path = cache.staging_path(key, image_path)
+            Path(staging_path).write_bytes(Path(image_path).read_bytes())
+            cache.put(key, staging_path, {'filter_results': {'filter_results': []}})
+            assert set(ENTRY_FIELDS) <= set(cache.get(key)), "legacy entry not completed"
+        finally:
+            cache_module._result_cache = previous
+
+    print("✅ Result cache entries are shared between the API and the workers")
+
+if __name__ == "__main__":
+    test_shared_entries()
@@ -0,0 +1,253 @@
+"""
+🗂️ Image Catalog - Índice en memoria de static/images
+
+Antes cada request hacía glob("*.jpg") + stat() de cada archivo. El catálogo
+indexa el directorio una vez (tamaño, dimensiones, formato y sha256) y las
+consultas son lookups en diccionarios/tuplas ya preparadas.
+
+Refresco incremental:
+- Como mucho cada IMAGE_CATALOG_REFRESH segundos se hace un stat() del
+  directorio; si su mtime no cambió no se hace nada más
+- Si cambió (archivo nuevo, borrado o renombrado) se re-escanea, pero sólo se
+  vuelven a abrir/hashear los archivos cuyo (tamaño, mtime) cambió
+- Cada FULL_RESCAN_EVERY comprobaciones se re-escanea igualmente, para
+  detectar archivos sobrescritos en el sitio (no cambian el mtime del directorio)
+
+Configuración (variables de entorno):
+    IMAGE_CATALOG_DIR      Directorio de imágenes por defecto (default: static/images)
+    IMAGE_CATALOG_REFRESH  Segundos entre comprobaciones del directorio (default: 2)
+"""
+
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+from .cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_DIR = 'static/images'
+DEFAULT_REFRESH_INTERVAL = 2.0
+FULL_RESCAN_EVERY = 30
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+@dataclass(frozen=True)
+class ImageEntry:
+    """🖼️ Metadata de una imagen del catálogo"""
+    path: str
+    name: str
+    size: int
+    mtime_ns: int
+    width: Optional[int]
+    height: Optional[int]
+    format: Optional[str]
+    sha256: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ImageCatalog:
+    """
+    🗂️ Catálogo de imágenes con refresco incremental por mtime
+
+    Uso típico:
+        catalog = get_image_catalog()
+        images = catalog.pick(count, min_size=100_000)
+        entry = catalog.get('sample_4k.jpg')
+    """
+
+    def __init__(self, image_dir: str = None, refresh_interval: float = None):
+        self.image_dir = Path(image_dir or os.getenv('IMAGE_CATALOG_DIR', DEFAULT_IMAGE_DIR))
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv('IMAGE_CATALOG_REFRESH', DEFAULT_REFRESH_INTERVAL))
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, ImageEntry] = {}
+        # (min_size, extensiones) -> tupla de paths; se vacía al cambiar el índice
+        self._views: Dict[Tuple[int, Tuple[str, ...]], Tuple[str, ...]] = {}
+        self._dir_mtime_ns = None
+        self._last_check = 0.0
+        self._checks = 0
+
+        # Métricas
+        self.scans = 0
+        self.indexed = 0
+        self.last_scan_time = None
+
+    # =====================================================================
+    # 🔄 REFRESCO
+    # =====================================================================
+
+    def _maybe_refresh(self):
+        """Comprobar el directorio como mucho una vez por refresh_interval"""
+        now = time.monotonic()
+        if self._dir_mtime_ns is not None and now - self._last_check < self.refresh_interval:
+            return
+
+        with self._lock:
+            if self._dir_mtime_ns is not None and now - self._last_check < self.refresh_interval:
+                return
+            self._last_check = now
+            self._checks += 1
+
+            try:
+                dir_mtime_ns = self.image_dir.stat().st_mtime_ns
+            except OSError:
+                dir_mtime_ns = -1
+
+            if dir_mtime_ns != self._dir_mtime_ns or self._checks % FULL_RESCAN_EVERY == 0:
+                self._scan()
+                self._dir_mtime_ns = dir_mtime_ns
+
+    def refresh(self):
+        """🔄 Forzar un re-escaneo (p.ej. después de subir una imagen)"""
+        with self._lock:
+            self._scan()
+            self._last_check = time.monotonic()
+
+    def _scan(self):
+        """Re-escanear el directorio reutilizando las entradas que no cambiaron"""
+        start_time = time.time()
+        entries: Dict[str, ImageEntry] = {}
+        try:
+            dir_entries = list(os.scandir(self.image_dir))
+        except OSError:
+            dir_entries = []
+
+        for dir_entry in dir_entries:
+            if not dir_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+
+            previous = self._entries.get(dir_entry.name)
+            if previous and previous.size == stat.st_size and previous.mtime_ns == stat.st_mtime_ns:
+                entries[dir_entry.name] = previous
+                continue
+
+            entry = self._index_file(Path(dir_entry.path), stat)
+            if entry:
+                entries[dir_entry.name] = entry
+                self.indexed += 1
+
+        changed = entries.keys() != self._entries.keys() or any(
+            entries[name] is not self._entries[name] for name in entries
+        )
+        self._entries = entries
+        if changed:
+            self._views = {}
+            logger.info(f"🗂️ Image catalog: {len(entries)} images in {self.image_dir} "
+                        f"({time.time() - start_time:.3f}s)")
+
+        self.scans += 1
+        self.last_scan_time = time.time()
+
+    def _index_file(self, path: Path, stat: os.stat_result) -> Optional[ImageEntry]:
+        """Leer cabecera (dimensiones/formato, sin decodificar) y hash de un archivo"""
+        width = height = image_format = None
+        if PIL_AVAILABLE:
+            try:
+                with Image.open(path) as img:
+                    width, height = img.size
+                    image_format = img.format
+            except Exception as e:
+                logger.warning(f"⚠️ Catalog: could not read {path.name}: {e}")
+                return None
+
+        try:
+            digest = file_digest(path)
+        except OSError:
+            return None
+
+        return ImageEntry(
+            path=str(path),
+            name=path.name,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            width=width,
+            height=height,
+            format=image_format,
+            sha256=digest
+        )
+
+    # =====================================================================
+    # 🔍 CONSULTAS
+    # =====================================================================
+
+    def get(self, name_or_path: str) -> Optional[ImageEntry]:
+        """Entrada por nombre de archivo o path; None si no está en el catálogo"""
+        self._maybe_refresh()
+        return self._entries.get(Path(name_or_path).name)
+
+    def entries(self) -> List[ImageEntry]:
+        self._maybe_refresh()
+        return list(self._entries.values())
+
+    def paths(self, min_size: int = 0, extensions: Tuple[str, ...] = IMAGE_EXTENSIONS) -> Tuple[str, ...]:
+        """
+        📋 Paths de las imágenes (ordenados por nombre)
+
+        Cada combinación de filtros se calcula una vez por versión del índice.
+        """
+        self._maybe_refresh()
+        # Leer _views antes que _entries (_scan los cambia en orden inverso):
+        # nunca se guarda una vista calculada con un índice viejo
+        views, entries = self._views, self._entries
+        view_key = (min_size, tuple(extensions))
+        view = views.get(view_key)
+        if view is None:
+            view = tuple(
+                entry.path for name, entry in sorted(entries.items())
+                if entry.size > min_size and name.lower().endswith(view_key[1])
+            )
+            views[view_key] = view
+        return view
+
+    def pick(self, count: int, min_size: int = 0, extensions: Tuple[str, ...] = IMAGE_EXTENSIONS) -> List[str]:
+        """🎯 `count` paths alternando entre las imágenes disponibles ([] si no hay ninguna)"""
+        available = self.paths(min_size, extensions)
+        if not available:
+            return []
+        return [available[i % len(available)] for i in range(count)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Estadísticas del catálogo"""
+        return {
+            'image_dir': str(self.image_dir),
+            'images': len(self._entries),
+            'total_bytes': sum(entry.size for entry in self._entries.values()),
+            'scans': self.scans,
+            'indexed': self.indexed,
+            'refresh_interval': self.refresh_interval,
+            'last_scan_time': self.last_scan_time
+        }
+
+
+_catalogs: Dict[str, ImageCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_image_catalog(image_dir: str = None) -> ImageCatalog:
+    """🏭 Catálogo compartido por el proceso (uno por directorio)"""
+    image_dir = str(image_dir or os.getenv('IMAGE_CATALOG_DIR', DEFAULT_IMAGE_DIR))
+    with _catalogs_lock:
+        catalog = _catalogs.get(image_dir)
+        if catalog is None:
+            catalog = _catalogs[image_dir] = ImageCatalog(image_dir)
+        return catalog
@@ -28,6 +28,9 @@ except ImportError:
     OPENCV_AVAILABLE = False
     print("⚠️ OpenCV not installed. Run: pip install opencv-python")
 
+# Tamaño por defecto del filtro resize (también usado por el pipeline fusionado)
+DEFAULT_RESIZE = (800, 600)
+
 class ImageFilters:
     
     @staticmethod
@@ -56,7 +59,7 @@ class ImageFilters:
     """
     
     @staticmethod
-    def resize_filter(image_data: Any, size: Tuple[int, int] = (800, 600)) -> dict:
+    def resize_filter(image_data: Any, size: Tuple[int, int] = DEFAULT_RESIZE) -> dict:
         """
         📏 Redimensionar imagen
         
@@ -277,6 +280,62 @@ class ImageFilters:
     # 🔥 DÍA 2: FILTROS PESADOS PARA MULTIPROCESSING  
     # =====================================================================
     
+    @staticmethod
+    def _load_rgb_array(image_data: Any):
+        """Cargar path o PIL Image como array NumPy RGB (uint8)"""
+        if isinstance(image_data, (str, Path)):
+            img_cv = cv2.imread(str(image_data))
+            if img_cv is None:
+                raise ValueError(f"Could not load image: {image_data}")
+            return cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
+        if hasattr(image_data, 'mode'):  # PIL Image
+            return np.asarray(image_data.convert('RGB'))
+        raise ValueError("Unsupported image format")
+    
+    @staticmethod
+    def _sharpen_array(img_rgb, intensity: int = 3):
+        """
+        Núcleo de heavy_sharpen sobre un array RGB
+        
+        Cada pasada es un kernel 3x3 (radio 1): el resultado de un píxel sólo
+        depende de los vecinos a distancia <= intensity (ver tiling.py).
+        """
+        kernel = np.array([[-1, -1, -1],
+                         [-1,  9, -1], 
+                         [-1, -1, -1]], dtype=np.float32)
+        
+        sharpened = img_rgb.copy()
+        for i in range(intensity):
+            sharpened = cv2.filter2D(sharpened, -1, kernel)
+            # Añadir trabajo extra CPU-intensivo
+            _ = np.sum(sharpened ** 2)  # Operación costosa
+        return sharpened
+    
+    @staticmethod
+    def _edges_array(img_rgb, threshold1: int = 100, threshold2: int = 200):
+        """Núcleo de edge_detection sobre un array RGB; devuelve los bordes en RGB"""
+        # Convertir a escala de grises
+        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+        
+        # Aplicar filtro Gaussiano (suavizado)
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        
+        # Detección de bordes Canny (CPU intensivo)
+        edges = cv2.Canny(blurred, threshold1, threshold2)
+        
+        # Operaciones adicionales CPU-intensivas
+        # Morphological operations para limpiar bordes
+        kernel = np.ones((3, 3), np.uint8)
+        edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+        edges = cv2.morphologyEx(edges, cv2.MORPH_OPEN, kernel)
+        
+        # Añadir trabajo extra CPU-intensivo
+        for i in range(5):
+            _ = np.fft.fft2(edges)  # Transformada de Fourier costosa
+        
+        # Convertir edges a imagen RGB para compatibilidad
+        return cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+    
     @staticmethod
     def heavy_sharpen_filter(image_data: Any, intensity: int = 3) -> dict:
         """
@@ -296,31 +355,11 @@ class ImageFilters:
         try:
             if OPENCV_AVAILABLE and PIL_AVAILABLE:
                 output_path = None
-                # Cargar imagen
-                if isinstance(image_data, (str, Path)):
-                    # Leer con OpenCV
-                    img_cv = cv2.imread(str(image_data))
-                    if img_cv is None:
-                        raise ValueError(f"Could not load image: {image_data}")
-                elif hasattr(image_data, 'mode'):  # PIL Image
-                    # Convertir PIL a OpenCV
-                    img_cv = cv2.cvtColor(np.array(image_data), cv2.COLOR_RGB2BGR)
-                else:
-                    raise ValueError("Unsupported image format")
+                # Cargar imagen como array RGB
+                img_rgb = ImageFilters._load_rgb_array(image_data)
                 
                 # Aplicar sharpening kernel múltiples veces (CPU intensivo)
-                kernel = np.array([[-1, -1, -1],
-                                 [-1,  9, -1], 
-                                 [-1, -1, -1]], dtype=np.float32)
-                
-                sharpened = img_cv.copy()
-                for i in range(intensity):
-                    sharpened = cv2.filter2D(sharpened, -1, kernel)
-                    # Añadir trabajo extra CPU-intensivo
-                    _ = np.sum(sharpened ** 2)  # Operación costosa
-                
-                # Convertir de vuelta a PIL
-                sharpened_pil = Image.fromarray(cv2.cvtColor(sharpened, cv2.COLOR_BGR2RGB))
+                sharpened_pil = Image.fromarray(ImageFilters._sharpen_array(img_rgb, intensity))
                 
                 # 💾 Guardar imagen procesada
                 if isinstance(image_data, (str, Path)):
@@ -387,38 +426,11 @@ class ImageFilters:
         try:
             if OPENCV_AVAILABLE and PIL_AVAILABLE:
                 output_path = None
-                # Cargar imagen
-                if isinstance(image_data, (str, Path)):
-                    img_cv = cv2.imread(str(image_data))
-                    if img_cv is None:
-                        raise ValueError(f"Could not load image: {image_data}")
-                elif hasattr(image_data, 'mode'):  # PIL Image
-                    img_cv = cv2.cvtColor(np.array(image_data), cv2.COLOR_RGB2BGR)
-                else:
-                    raise ValueError("Unsupported image format")
-                
-                # Convertir a escala de grises
-                gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-                
-                # Aplicar filtro Gaussiano (suavizado)
-                blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+                # Cargar imagen como array RGB
+                img_rgb = ImageFilters._load_rgb_array(image_data)
                 
-                # Detección de bordes Canny (CPU intensivo)
-                edges = cv2.Canny(blurred, threshold1, threshold2)
-                
-                # Operaciones adicionales CPU-intensivas
-                # Morphological operations para limpiar bordes
-                kernel = np.ones((3, 3), np.uint8)
-                edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
-                edges = cv2.morphologyEx(edges, cv2.MORPH_OPEN, kernel)
-                
-                # Añadir trabajo extra CPU-intensivo
-                for i in range(5):
-                    _ = np.fft.fft2(edges)  # Transformada de Fourier costosa
-                
-                # Convertir edges a imagen RGB para compatibilidad
-                edges_rgb = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-                edges_pil = Image.fromarray(edges_rgb)
+                # Canny + morfología (CPU intensivo), devuelto como RGB para compatibilidad
+                edges_pil = Image.fromarray(ImageFilters._edges_array(img_rgb, threshold1, threshold2))
                 
                 # 💾 Guardar imagen procesada
                 if isinstance(image_data, (str, Path)):
@@ -495,14 +507,35 @@ class FilterFactory:
         
         return cls.AVAILABLE_FILTERS[filter_name]
     
+    @staticmethod
+    def _resolve_params(filter_name: str, filter_params: dict) -> dict:
+        """Convertir parámetros de la API al formato que espera cada filtro"""
+        params = filter_params.get(filter_name, {})
+        
+        if filter_name == 'resize' and params:
+            # Convertir {width: 800, height: 600} a size=(800, 600)
+            if 'width' in params and 'height' in params:
+                params = {'size': (int(params['width']), int(params['height']))}
+        
+        return params
+    
     @classmethod
-    def apply_filter_chain(cls, image_data: Any, filter_names: list, filter_params: dict = None) -> Any:
+    def apply_filter_chain(cls, image_data: Any, filter_names: list, filter_params: dict = None,
+                           fused: bool = False, save_stages=None, output_path: str = None,
+                           source_path: str = None, tiled: bool = False) -> Any:
         """
         🔗 Aplicar cadena de filtros secuencialmente
         
         DÍA 2: Actualizado para manejar dict return format con guardado de imágenes
         DÍA 3: Añadido soporte para filter_params
+        
+        Con fused=True se usa apply_fused_chain (una decodificación, una codificación).
         """
+        if fused:
+            return cls.apply_fused_chain(image_data, filter_names, filter_params,
+                                         save_stages=save_stages, output_path=output_path,
+                                         source_path=source_path, tiled=tiled)
+        
         result = image_data
         all_results = []
         filter_params = filter_params or {}
@@ -511,13 +544,7 @@ class FilterFactory:
             filter_func = cls.get_filter(filter_name)
             
             # Obtener parámetros específicos para este filtro
-            params = filter_params.get(filter_name, {})
-            
-            # Convertir parámetros según el filtro
-            if filter_name == 'resize' and params:
-                # Convertir {width: 800, height: 600} a size=(800, 600)
-                if 'width' in params and 'height' in params:
-                    params = {'size': (int(params['width']), int(params['height']))}
+            params = cls._resolve_params(filter_name, filter_params)
             
             # Aplicar filtro con parámetros
             if params:
@@ -543,6 +570,97 @@ class FilterFactory:
             "filter_results": all_results,
             "filters_applied": filter_names
         }
+    
+    @classmethod
+    def apply_fused_chain(cls, image_data: Any, filter_names: list, filter_params: dict = None,
+                          save_stages=None, output_path: str = None, source_path: str = None,
+                          tiled: bool = False) -> dict:
+        """
+        ⚡ Pipeline fusionado: decodificar una vez, codificar una vez
+        
+        La cadena normal deja que cada filtro que recibe un path vuelva a abrir
+        el JPEG y guarde su propio intermedio. Aquí la imagen se decodifica una
+        sola vez, el mismo buffer PIL pasa por todas las etapas y sólo se
+        codifica el resultado final.
+        
+        Args:
+            image_data: Path de imagen o PIL Image
+            filter_names: Filtros a aplicar en orden
+            filter_params: Parámetros por filtro (mismo formato que apply_filter_chain)
+            save_stages: Etapas intermedias a guardar (índices o nombres de filtro).
+                         Por defecto no se guarda ningún intermedio.
+            output_path: Ruta del resultado final (por defecto ruta única en static/processed)
+            source_path: Path original cuando image_data ya viene decodificada
+                         (p.ej. desde memoria compartida): se usa para nombrar
+                         y guardar los resultados
+            tiled: Ejecutar sharpen/edges por tiles en paralelo (ver tiling.py)
+        Returns:
+            Dict con final_image, filter_results, filters_applied y output_path
+        """
+        if not PIL_AVAILABLE or not filter_names:
+            return cls.apply_filter_chain(image_data, filter_names, filter_params)
+        
+        filter_params = filter_params or {}
+        save_stages = set(save_stages or ())
+        # 📖 Una sola decodificación
+        if isinstance(image_data, (str, Path)):
+            source_path = str(image_data)
+            buffer = cls._decode_once(source_path, filter_names, filter_params)
+        else:
+            buffer = image_data
+        
+        all_results = []
+        for index, filter_name in enumerate(filter_names):
+            filter_func = cls.get_filter(filter_name)
+            params = cls._resolve_params(filter_name, filter_params)
+            
+            # Los filtros no guardan nada cuando reciben una imagen PIL
+            if tiled:
+                from .tiling import apply_tiled_filter
+                filter_result = apply_tiled_filter(buffer, filter_name, params)
+            else:
+                filter_result = filter_func(buffer, **params)
+            buffer = filter_result['image']
+            all_results.append(filter_result)
+            print(f"✅ Applied {filter_name} (fused)")
+            
+            # 💾 Intermedios sólo si se piden explícitamente
+            is_last = index == len(filter_names) - 1
+            if source_path and not is_last and (index in save_stages or filter_name in save_stages):
+                stage_path = ImageFilters._get_output_path(source_path, filter_name, f"_stage{index}")
+                buffer.save(stage_path, quality=95)
+                filter_result['output_path'] = stage_path
+                print(f"💾 Stage saved: {stage_path}")
+        
+        # 💾 Una sola codificación del resultado final
+        final_path = None
+        if source_path:
+            final_path = output_path or ImageFilters._get_output_path(source_path, "-".join(filter_names))
+            buffer.save(final_path, quality=95)
+            all_results[-1]['output_path'] = final_path
+            print(f"💾 Saved: {final_path}")
+        
+        return {
+            "final_image": buffer,
+            "filter_results": all_results,
+            "filters_applied": filter_names,
+            "output_path": final_path,
+            "fused": True
+        }
+    
+    @classmethod
+    def _decode_once(cls, source_path: str, filter_names: list, filter_params: dict):
+        """
+        📖 Decodificar la imagen fuente una única vez a un buffer RGB
+        
+        Si la primera etapa es resize, se pide a libjpeg que decodifique ya
+        reducido (draft), nunca por debajo del tamaño pedido.
+        """
+        with Image.open(source_path) as img:
+            if filter_names[0] == 'resize':
+                size = cls._resolve_params('resize', filter_params).get('size', DEFAULT_RESIZE)
+                img.draft('RGB', size)
+            return img.convert('RGB')
 
 # =====================================================================
 # 📋 EJEMPLO DE USO PARA ESTUDIANTES
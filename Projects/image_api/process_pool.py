@@ -0,0 +1,356 @@
+"""
+🏊 Process Pool - Pool de procesos persistente compartido por la app
+
+Antes cada request de multiprocessing creaba su propio ProcessPoolExecutor
+y pagaba en cada llamada: arranque de procesos, import de Pillow/cv2/numpy
+y el pickle del ImageProcessor (self) en cada tarea. Este pool vive lo que
+vive el proceso de Django y lo comparten todos los endpoints batch:
+
+- Warm-up: al crearse arrancan todos los procesos y preparan su ImageProcessor
+- Cola de envío acotada: submit() espera si hay demasiadas tareas en vuelo
+  (backpressure) y tras un timeout lanza PoolSaturatedError, con un
+  retry_after estimado con el ritmo de tareas completadas
+- Shutdown limpio: registrado con atexit, y shutdown() explícito
+
+Configuración (variables de entorno):
+    IMAGE_POOL_WORKERS         Procesos del pool (default: CPUs disponibles, ver available_cpus)
+    IMAGE_POOL_MAX_PENDING     Tareas en vuelo máximas (default: 4 x workers)
+    IMAGE_POOL_SUBMIT_TIMEOUT  Segundos esperando hueco antes de rechazar (default: 30)
+"""
+
+import os
+import math
+import time
+import atexit
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ritmo de completado: una muestra como mucho cada RATE_SAMPLE_INTERVAL segundos
+RATE_SAMPLE_INTERVAL = 1.0
+RATE_EWMA_ALPHA = 0.3
+MAX_RETRY_AFTER = 60.0
+
+
+class PoolSaturatedError(RuntimeError):
+    """El pool tiene demasiadas tareas en vuelo: el cliente debe reintentar más tarde"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def available_cpus() -> int:
+    """
+    🧮 CPUs que este proceso puede usar de verdad
+
+    cpu_count() devuelve los cores del host aunque el contenedor esté
+    limitado: se usa la afinidad (sched_getaffinity) y la cuota de CPU del
+    cgroup (v2: cpu.max, v1: cpu.cfs_quota_us / cpu.cfs_period_us).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = mp.cpu_count()
+
+    quota = None
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()[:2]
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+# =====================================================================
+# 🔧 FUNCIONES QUE CORREN DENTRO DE LOS PROCESOS DEL POOL
+# =====================================================================
+
+# ImageProcessor propio de cada proceso hijo (creado una vez en el initializer)
+_worker_processor = None
+
+
+def _init_worker():
+    """Initializer de cada proceso: imports pesados y ImageProcessor una sola vez"""
+    global _worker_processor
+    from .processors import ImageProcessor
+    _worker_processor = ImageProcessor()
+
+
+def _warmup_task(delay: float = 0.05) -> int:
+    """Tarea vacía para forzar el arranque de todos los procesos"""
+    time.sleep(delay)  # Mantiene el proceso ocupado para que el pool arranque otro
+    return os.getpid()
+
+
+def process_image_task(image_path: str, filters: List[str],
+                       filter_params: Dict[str, Any] = None, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    📸 Procesar una imagen dentro del pool
+
+    Función de módulo: sólo se envían (path, filtros, params), no el ImageProcessor.
+    """
+    if _worker_processor is None:
+        _init_worker()
+    return _worker_processor.process_single_image(image_path, filters, filter_params, use_cache=use_cache)
+
+
+def process_frame_task(frame, image_path: str, filters: List[str],
+                       filter_params: Dict[str, Any] = None,
+                       return_frame: bool = False, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    🧠 Procesar una imagen ya decodificada en memoria compartida
+
+    Sólo viaja el FrameDescriptor (name, shape, dtype); image_path se usa
+    para la caché y para nombrar el resultado.
+    """
+    if _worker_processor is None:
+        _init_worker()
+    return _worker_processor.process_single_image(
+        image_path, filters, filter_params, frame=frame, return_frame=return_frame, use_cache=use_cache
+    )
+
+
+def filter_chain_task(image_path: str, filters: List[str], filter_params: Dict[str, Any] = None,
+                      output_path: str = None) -> Dict[str, Any]:
+    """
+    🔗 Cadena de filtros fusionada dentro del pool (workers distribuidos)
+
+    Guarda el resultado en output_path y devuelve sólo metadata: las
+    imágenes PIL no vuelven por el pipe.
+    """
+    from .cache import chain_summary
+    from .filters import FilterFactory
+
+    chain = FilterFactory.apply_filter_chain(image_path, filters, filter_params,
+                                             fused=True, output_path=output_path)
+    return chain_summary(chain)
+
+
+# =====================================================================
+# 🏊 POOL PERSISTENTE
+# =====================================================================
+
+class PersistentProcessPool:
+    """
+    🏊 ProcessPoolExecutor de larga vida con backpressure
+
+    Se recrea automáticamente si el pool se rompe (un proceso murió) o si el
+    proceso padre hizo fork (p.ej. servidores con pre-fork).
+    """
+
+    def __init__(self, max_workers: int = None, max_pending: int = None,
+                 submit_timeout: float = None):
+        self.max_workers = max_workers or int(os.getenv('IMAGE_POOL_WORKERS', 0)) or available_cpus()
+        self.max_pending = max_pending or int(os.getenv('IMAGE_POOL_MAX_PENDING', 0)) or self.max_workers * 4
+        if submit_timeout is None:
+            submit_timeout = float(os.getenv('IMAGE_POOL_SUBMIT_TIMEOUT', 30))
+        self.submit_timeout = submit_timeout
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+        # Métricas: los contadores cambian en los threads de las requests y en
+        # el thread de callbacks del executor, siempre bajo _stats_lock
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.waits = 0
+        self.restarts = 0
+        self.warmed_up_at = None
+        self.completion_rate = 0.0  # EWMA de tareas completadas por segundo
+        self._rate_sample = (time.monotonic(), 0)
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        """Crear (o recrear) el executor de forma perezosa"""
+        with self._lock:
+            if self._executor is not None and self._owner_pid == os.getpid():
+                return self._executor
+
+            if self._executor is not None:
+                # Heredado de un fork: los procesos pertenecen al padre
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                with self._stats_lock:
+                    self.in_flight = 0
+                    self.restarts += 1
+
+            # Los hijos heredan el resource tracker del padre: los segmentos de
+            # shared_frames creados en un proceso y liberados en otro no se
+            # reportan como fugas al terminar los workers
+            resource_tracker.ensure_running()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+            self._owner_pid = os.getpid()
+            logger.info(f"🏊 Process pool started with {self.max_workers} workers")
+            executor = self._executor
+
+        self._warm_up(executor)
+        return executor
+
+    def _warm_up(self, executor: ProcessPoolExecutor):
+        """🔥 Arrancar todos los procesos antes de la primera tarea real"""
+        start_time = time.time()
+        futures = [executor.submit(_warmup_task) for _ in range(self.max_workers)]
+        pids = {future.result(timeout=120) for future in futures}
+        self.warmed_up_at = time.time()
+        logger.info(f"🔥 Process pool warm-up: {len(pids)} processes in {time.time() - start_time:.2f}s")
+
+    def warm_up(self):
+        """Arrancar el pool ya (p.ej. al iniciar la app) en lugar de en la primera request"""
+        self._ensure_executor()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        📤 Enviar una tarea al pool
+
+        Bloquea mientras haya max_pending tareas en vuelo; si no se libera un
+        hueco en submit_timeout segundos lanza PoolSaturatedError.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.waits += 1
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.submit_timeout)
+            finally:
+                with self._stats_lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._stats_lock:
+                    self.rejected += 1
+                raise PoolSaturatedError(
+                    f"Process pool saturated: {self.max_pending} tasks in flight",
+                    retry_after=self.retry_after()
+                )
+
+        slots = self._slots
+        try:
+            try:
+                future = self._ensure_executor().submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                logger.warning("⚠️ Process pool broken, restarting...")
+                self._reset()
+                future = self._ensure_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            slots.release()
+            raise
+
+        with self._stats_lock:
+            if self.in_flight == 0:
+                # Pool ocioso: el tiempo sin trabajo no cuenta para el ritmo
+                self._rate_sample = (time.monotonic(), self.completed)
+            self.in_flight += 1
+            self.submitted += 1
+        future.add_done_callback(lambda _: self._on_done(slots))
+        return future
+
+    def _on_done(self, slots: threading.BoundedSemaphore):
+        if slots is self._slots:
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self._sample_completion_rate()
+        slots.release()
+
+    def _sample_completion_rate(self):
+        """Actualizar la EWMA de tareas completadas por segundo (con _stats_lock)"""
+        now = time.monotonic()
+        sampled_at, completed = self._rate_sample
+        if now - sampled_at < RATE_SAMPLE_INTERVAL:
+            return
+        sample = (self.completed - completed) / (now - sampled_at)
+        self.completion_rate = sample if self.completion_rate == 0 else (
+            RATE_EWMA_ALPHA * sample + (1 - RATE_EWMA_ALPHA) * self.completion_rate)
+        self._rate_sample = (now, self.completed)
+
+    def retry_after(self) -> float:
+        """⏱️ Segundos estimados hasta drenar las tareas en vuelo y en espera al ritmo actual"""
+        with self._stats_lock:
+            if self.completion_rate <= 0:
+                return min(self.submit_timeout, MAX_RETRY_AFTER)
+            backlog = self.in_flight + self.waiting
+            return max(1.0, min(MAX_RETRY_AFTER, math.ceil(backlog / self.completion_rate)))
+
+    def _reset(self):
+        """Descartar un executor roto"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        with self._stats_lock:
+            self.restarts += 1
+
+    def shutdown(self, wait: bool = True):
+        """🛑 Parar los procesos del pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._owner_pid == os.getpid():
+            executor.shutdown(wait=wait, cancel_futures=True)
+            logger.info("🛑 Process pool shut down")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Estadísticas del pool"""
+        with self._stats_lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'running': self._executor is not None,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'completion_rate': round(self.completion_rate, 2),
+                'rejected': self.rejected,
+                'waits': self.waits,
+                'restarts': self.restarts,
+                'warmed_up_at': self.warmed_up_at
+            }
+
+
+def settle_futures(futures: List[Future]):
+    """
+    ⏹️ Cancelar las tareas que aún no empezaron y esperar a las que ya corren
+
+    Se llama antes de liberar la memoria compartida que usan: una tarea en
+    vuelo nunca encuentra borrado su frame de entrada.
+    """
+    for future in futures:
+        future.cancel()
+    wait(futures)
+
+
+_process_pool: Optional[PersistentProcessPool] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> PersistentProcessPool:
+    """🏭 Pool compartido por todo el proceso (se crea la primera vez que se usa)"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = PersistentProcessPool()
+            atexit.register(_process_pool.shutdown)
+        return _process_pool
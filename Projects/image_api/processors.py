@@ -5,10 +5,11 @@ Base para que los estudiantes implementen procesamiento de imágenes con threadi
 Este archivo debe evolucionar durante la semana.
 """
 
+import os
 import threading
 import time
 import multiprocessing as mp
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Any
 import logging
@@ -29,6 +30,15 @@ except ImportError:
     OPENCV_AVAILABLE = False
     print("⚠️ OpenCV not installed. Run: pip install opencv-python")
 
+from .cache import get_result_cache, entry_metadata, chain_summary
+from .process_pool import (
+    get_process_pool, process_image_task, process_frame_task, settle_futures, PoolSaturatedError
+)
+from .shared_frames import (
+    SHARED_FRAMES_AVAILABLE, publish_image, release_frame, take_frame, frame_to_image,
+    return_frame as publish_result_frame
+)
+
 logger = logging.getLogger(__name__)
 
 class ImageProcessor:
@@ -43,7 +53,8 @@ class ImageProcessor:
     
     def __init__(self, max_workers: int = 4, mp_workers: int = None):
         self.max_workers = max_workers
-        self.mp_workers = mp_workers or mp.cpu_count()
+        # Multiprocessing usa el pool persistente compartido (ver process_pool.py)
+        self.mp_workers = mp_workers or get_process_pool().max_workers
         self.processed_count = 0
         # Note: No usar threading.Lock aquí para compatibilidad con multiprocessing
         self._mp_safe = True
@@ -54,11 +65,29 @@ class ImageProcessor:
     # 🔥 DÍA 1: THREADING METHODS (COMPLETO)
     # =====================================================================
     
-    def process_single_image(self, image_path: str, filters: List[str]) -> Dict[str, Any]:
+    def process_single_image(self, image_path: str, filters: List[str],
+                             filter_params: Dict[str, Any] = None, frame=None,
+                             return_frame: bool = False, tiled: bool = False,
+                             use_cache: bool = True) -> Dict[str, Any]:
         """
         📸 Procesar una imagen individual con múltiples filtros
         
         DÍA 2: Usar imágenes reales + filtros implementados
+        
+        Delante del pipeline está la caché por contenido (image_api/cache.py):
+        si ya se procesó la misma imagen con la misma cadena y parámetros, se
+        devuelve el resultado guardado sin tocar Pillow/OpenCV.
+        
+        Con `frame` (FrameDescriptor de shared_frames.py) la imagen ya viene
+        decodificada en memoria compartida y no se vuelve a leer del disco.
+        Con return_frame=True el resultado vuelve también como descriptor en
+        'result_frame' (lo libera quien lo recibe).
+        
+        Con tiled=True sharpen/edges reparten una sola imagen grande en tiles
+        entre todos los cores (ver tiling.py).
+        
+        Con use_cache=False la caché no se consulta ni se llena: lo usan los
+        benchmarks y comparaciones para medir el procesamiento real.
         """
         start_time = time.time()
         thread_id = threading.get_ident()
@@ -67,6 +96,10 @@ class ImageProcessor:
         logger.info(f"🧵 Thread {thread_id} (Process {process_id}): Procesando {image_path} con filtros {filters}")
         
         # 📁 Procesar imagen REAL
+        output_path = None
+        cache_hit = False
+        result_image = None
+        result_frame = None
         try:
             # Verificar que la imagen existe
             if not Path(image_path).exists():
@@ -74,33 +107,78 @@ class ImageProcessor:
                 # Usar imagen por defecto
                 image_path = "static/images/sample_4k.jpg"
             
-            # Simular procesamiento I/O-bound (leer archivo)
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-                file_size = len(image_data)
+            # 💾 Caché por contenido
+            cache = get_result_cache()
+            cache_key = cache.key_for(image_path, filters, filter_params, tiled=tiled) if use_cache else None
+            cached = cache.get(cache_key)
             
-            # DÍA 2: Aplicar filtros REALES usando FilterFactory
-            try:
-                from .filters import FilterFactory
-                filter_chain_result = FilterFactory.apply_filter_chain(image_path, filters)
-                
-                # Extraer resultados del nuevo formato
-                if isinstance(filter_chain_result, dict):
-                    result_image = filter_chain_result.get('final_image')
-                    filter_results = filter_chain_result.get('filter_results', [])
-                    saved_files = [r.get('output_path') for r in filter_results if r.get('output_path')]
-                    filter_status = f"real_filters_applied_{len(saved_files)}_saved"
+            if cached:
+                cache_hit = True
+                output_path = cached['output_path']
+                file_size = cached.get('file_size', 0)
+                filter_status = cached.get('filter_status', 'cached')
+                logger.info(f"💾 Cache hit: {image_path} -> {output_path}")
+            else:
+                if frame is not None:
+                    # 🧠 Imagen ya decodificada por el padre en memoria compartida
+                    file_size = Path(image_path).stat().st_size
+                    chain_input = frame_to_image(frame)
                 else:
-                    # Compatibilidad con formato anterior
-                    result_image = filter_chain_result
-                    filter_status = "real_filters_applied"
+                    # Simular procesamiento I/O-bound (leer archivo)
+                    with open(image_path, 'rb') as f:
+                        image_data = f.read()
+                        file_size = len(image_data)
+                    chain_input = image_path
+                
+                # DÍA 2: Aplicar filtros REALES usando FilterFactory
+                # Pipeline fusionado: una decodificación y sólo se guarda el resultado final
+                staging_path = cache.staging_path(cache_key, image_path)
+                cacheable = False
+                try:
+                    from .filters import FilterFactory
+                    filter_chain_result = FilterFactory.apply_filter_chain(
+                        chain_input, filters, filter_params, fused=True,
+                        output_path=staging_path, source_path=image_path, tiled=tiled
+                    )
                     
-            except Exception as e:
-                logger.warning(f"⚠️ FilterFactory error: {e}")
-                # Fallback si hay error
-                processing_delay = len(filters) * 0.3
-                time.sleep(processing_delay)
-                filter_status = "simulated_filters"
+                    # Extraer resultados del nuevo formato
+                    if isinstance(filter_chain_result, dict):
+                        result_image = filter_chain_result.get('final_image')
+                        output_path = filter_chain_result.get('output_path')
+                        filter_results = filter_chain_result.get('filter_results', [])
+                        saved_files = [r.get('output_path') for r in filter_results if r.get('output_path')]
+                        filter_status = f"real_filters_applied_{len(saved_files)}_saved"
+                        # Sólo se cachean resultados sin errores en ninguna etapa
+                        cacheable = not any('error' in r for r in filter_results)
+                    else:
+                        # Compatibilidad con formato anterior
+                        result_image = filter_chain_result
+                        filter_status = "real_filters_applied"
+                        
+                except Exception as e:
+                    logger.warning(f"⚠️ FilterFactory error: {e}")
+                    # Fallback si hay error
+                    processing_delay = len(filters) * 0.3
+                    time.sleep(processing_delay)
+                    filter_status = "simulated_filters"
+                
+                if cacheable and cache_key is not None:
+                    entry = cache.put(cache_key, staging_path, entry_metadata(
+                        image_path, filters, filter_params, chain_summary(filter_chain_result),
+                        file_size=file_size, filter_status=filter_status
+                    ))
+                    output_path = entry['output_path']
+                else:
+                    cache.discard(staging_path)
+                    if output_path == staging_path:
+                        output_path = None
+            
+            if return_frame and output_path:
+                # 📤 Devolver el resultado por memoria compartida
+                if result_image is None:
+                    with Image.open(output_path) as cached_image:
+                        result_image = cached_image.convert('RGB')
+                result_frame = publish_result_frame(result_image)
             
             # Thread-safe counter update (for multiprocessing compatibility)
             self.processed_count += 1
@@ -109,24 +187,32 @@ class ImageProcessor:
             logger.error(f"❌ Error procesando {image_path}: {e}")
             file_size = 0
             filter_status = "error"
+            output_path = None
             
         processing_time = time.time() - start_time
         
-        return {
+        result = {
             'original_path': image_path,
-            'processed_path': f'static/processed/{Path(image_path).stem}_filtered.jpg',
+            'processed_path': output_path or f'static/processed/{Path(image_path).stem}_filtered.jpg',
             'filters_applied': filters,
             'processing_time': processing_time,
             'file_size': file_size,
             'thread_id': str(thread_id),
             'process_id': process_id,
             'filter_status': filter_status,
+            'cache_hit': cache_hit,
             'status': 'success' if Path(image_path).exists() else 'used_fallback'
         }
+        if result_frame is not None:
+            result['result_frame'] = result_frame
+        return result
     
-    def process_batch_threading(self, image_paths: List[str], filters: List[str]) -> List[Dict[str, Any]]:
+    def process_batch_threading(self, image_paths: List[str], filters: List[str],
+                                use_cache: bool = True) -> List[Dict[str, Any]]:
         """
         🚀 Procesar múltiples imágenes en paralelo con ThreadPoolExecutor
+        
+        use_cache=False para medir (ver process_single_image).
         """
         logger.info(f"🚀 Threading batch: {len(image_paths)} imágenes con {self.max_workers} workers")
         
@@ -136,7 +222,7 @@ class ImageProcessor:
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # Enviar todas las tareas
             future_to_image = {
-                executor.submit(self.process_single_image, img_path, filters): img_path 
+                executor.submit(self.process_single_image, img_path, filters, use_cache=use_cache): img_path
                 for img_path in image_paths
             }
             
@@ -164,54 +250,129 @@ class ImageProcessor:
     # 🔥 DÍA 2: MULTIPROCESSING METHODS (NUEVO)
     # =====================================================================
     
-    def process_batch_multiprocessing(self, image_paths: List[str], filters: List[str]) -> List[Dict[str, Any]]:
+    def process_batch_multiprocessing(self, image_paths: List[str], filters: List[str],
+                                      transport: str = None, return_frames: bool = False,
+                                      use_cache: bool = True) -> List[Dict[str, Any]]:
         """
         🔄 Procesar múltiples imágenes con ProcessPoolExecutor (DÍA 2)
         
         NUEVO: Para filtros CPU-intensivos (sharpen, edge_detection)
+        
+        Usa el pool persistente de la app: los procesos ya están arrancados y
+        cada tarea sólo envía (path, filtros), no el ImageProcessor completo.
+        Si el pool está saturado se propaga PoolSaturatedError.
+        
+        Transportes (argumento o variable de entorno IMAGE_TRANSPORT):
+            'path'           Cada worker lee y decodifica la imagen del disco (default)
+            'shared_memory'  El padre decodifica cada imagen una vez en memoria
+                             compartida y los workers reciben sólo un descriptor
+        
+        Con return_frames=True cada resultado trae además 'frame' (array RGB
+        del resultado), devuelto por los workers también por memoria compartida.
+        use_cache=False para medir (ver process_single_image).
         """
-        logger.info(f"🔄 Multiprocessing batch: {len(image_paths)} imágenes con {self.mp_workers} workers")
+        transport = transport or os.getenv('IMAGE_TRANSPORT', 'path')
+        logger.info(f"🔄 Multiprocessing batch: {len(image_paths)} imágenes con {self.mp_workers} workers ({transport})")
         
         results = []
         start_time = time.time()
+        segments = []
+        future_to_image = {}
+        collected = set()
         
         try:
-            with ProcessPoolExecutor(max_workers=self.mp_workers) as executor:
-                # Enviar todas las tareas
-                future_to_image = {
-                    executor.submit(self.process_single_image, img_path, filters): img_path 
-                    for img_path in image_paths
-                }
-                
-                # Recopilar resultados
-                for future in as_completed(future_to_image):
-                    image_path = future_to_image[future]
-                    try:
-                        result = future.result(timeout=60)  # Más tiempo para MP
-                        results.append(result)
-                        logger.info(f"✅ MP completed: {image_path}")
-                    except Exception as e:
-                        logger.error(f"❌ MP error {image_path}: {e}")
-                        results.append({
-                            'original_path': image_path,
-                            'error': str(e),
-                            'process_id': mp.current_process().pid
-                        })
+            pool = get_process_pool()
+            
+            # Enviar todas las tareas (submit aplica backpressure)
+            if transport == 'shared_memory' and SHARED_FRAMES_AVAILABLE:
+                self._submit_shared_frames(pool, image_paths, filters, segments, future_to_image, return_frames,
+                                           use_cache)
+            else:
+                for img_path in image_paths:
+                    future = (pool.submit(process_frame_task, None, img_path, filters, None, return_frames, use_cache)
+                              if return_frames else pool.submit(process_image_task, img_path, filters, None, use_cache))
+                    future_to_image[future] = img_path
+            
+            # Recopilar resultados
+            for future in as_completed(future_to_image):
+                image_path = future_to_image[future]
+                try:
+                    result = future.result(timeout=60)  # Más tiempo para MP
+                    collected.add(future)
+                    if result.get('result_frame'):
+                        result['frame'] = take_frame(result.pop('result_frame'))
+                    results.append(result)
+                    logger.info(f"✅ MP completed: {image_path}")
+                except Exception as e:
+                    if future.done():
+                        collected.add(future)
+                    logger.error(f"❌ MP error {image_path}: {e}")
+                    results.append({
+                        'original_path': image_path,
+                        'error': str(e),
+                        'process_id': mp.current_process().pid
+                    })
         
+        except PoolSaturatedError:
+            raise
         except Exception as e:
             logger.error(f"❌ ProcessPoolExecutor failed: {e}")
             # Fallback a threading
             logger.info("🔄 Fallback to threading...")
-            return self.process_batch_threading(image_paths, filters)
+            return self.process_batch_threading(image_paths, filters, use_cache)
+        finally:
+            # 🗑️ Los frames de entrada los libera siempre el padre, cuando ya no
+            # los usa ninguna tarea (p. ej. tras un PoolSaturatedError a mitad del envío)
+            pending = [future for future in future_to_image if future not in collected]
+            settle_futures(pending)
+            for future in pending:
+                if not future.cancelled() and future.exception() is None and future.result().get('result_frame'):
+                    try:
+                        take_frame(future.result()['result_frame'])
+                    except Exception as e:
+                        logger.warning(f"⚠️ Could not release result frame of {future_to_image[future]}: {e}")
+            for shm in segments:
+                release_frame(shm)
         
         total_time = time.time() - start_time
         logger.info(f"🎯 MP batch completado: {len(results)} resultados en {total_time:.2f}s")
         
         return results
     
+    def _submit_shared_frames(self, pool, image_paths: List[str], filters: List[str], segments: list,
+                              future_to_image: Dict[Any, str], return_frames: bool, use_cache: bool = True):
+        """
+        🧠 Publicar cada imagen única una sola vez en memoria compartida y enviar descriptores
+        
+        Las imágenes que ya están en la caché de resultados no se decodifican:
+        se envían por path y el worker responde desde la caché. Segmentos y
+        futures se van añadiendo a `segments` y `future_to_image`, así el
+        llamador los ve aunque el envío falle a mitad.
+        """
+        cache = get_result_cache()
+        frames = {}
+        
+        for img_path in image_paths:
+            if img_path not in frames:
+                frames[img_path] = None
+                if Path(img_path).exists() and not (use_cache and cache.contains(cache.key_for(img_path, filters))):
+                    try:
+                        shm, descriptor = publish_image(img_path)
+                        segments.append(shm)
+                        frames[img_path] = descriptor
+                    except Exception as e:
+                        logger.warning(f"⚠️ Shared memory transport failed for {img_path}: {e}")
+            
+            future = pool.submit(process_frame_task, frames[img_path], img_path, filters, None, return_frames,
+                                 use_cache)
+            future_to_image[future] = img_path
+    
     def compare_performance(self, image_paths: List[str], filters: List[str]) -> Dict[str, Any]:
         """
         📊 Comparar rendimiento: Sequential vs Threading vs Multiprocessing (DÍA 2)
+        
+        Sin caché de resultados: si no, la primera pasada la llenaría y las
+        siguientes sólo medirían aciertos.
         """
         logger.info(f"📊 Performance comparison: {len(image_paths)} imágenes, {len(filters)} filtros")
         
@@ -219,18 +380,18 @@ class ImageProcessor:
         sequential_start = time.time()
         sequential_results = []
         for img_path in image_paths:
-            result = self.process_single_image(img_path, filters)
+            result = self.process_single_image(img_path, filters, use_cache=False)
             sequential_results.append(result)
         sequential_time = time.time() - sequential_start
         
         # 2. Threading
         threading_start = time.time()
-        threading_results = self.process_batch_threading(image_paths, filters)
+        threading_results = self.process_batch_threading(image_paths, filters, use_cache=False)
         threading_time = time.time() - threading_start
         
         # 3. Multiprocessing (DÍA 2)
         mp_start = time.time()
-        mp_results = self.process_batch_multiprocessing(image_paths, filters)
+        mp_results = self.process_batch_multiprocessing(image_paths, filters, use_cache=False)
         mp_time = time.time() - mp_start
         
         # Calcular métricas
@@ -317,9 +478,22 @@ class ImageProcessor:
             'mp_workers': self.mp_workers,
             'active_threads': threading.active_count(),
             'pil_available': PIL_AVAILABLE,
-            'opencv_available': OPENCV_AVAILABLE
+            'opencv_available': OPENCV_AVAILABLE,
+            'result_cache': get_result_cache().get_stats(),
+            'process_pool': get_process_pool().get_stats()
         }
 
+_shared_processor = None
+_shared_processor_lock = threading.Lock()
+
+def get_image_processor() -> ImageProcessor:
+    """🏭 ImageProcessor compartido por todas las views (en lugar de uno por request)"""
+    global _shared_processor
+    with _shared_processor_lock:
+        if _shared_processor is None:
+            _shared_processor = ImageProcessor(max_workers=4)
+        return _shared_processor
+
 # =====================================================================
 # 🧪 FUNCIONES DE TESTING PARA DÍA 2
 # =====================================================================
@@ -0,0 +1,153 @@
+"""
+🧠 Shared Frames - Transporte de imágenes por memoria compartida
+
+Extiende la idea de Chapter-Threads/Session4-IPC (Shared Memory) al
+ImageProcessor real: en lugar de mandar a cada proceso un PIL Image
+pickleado, o un path que vuelve a leer y decodificar del disco, la imagen
+se decodifica UNA vez en un buffer NumPy dentro de un segmento
+multiprocessing.shared_memory, y los procesos reciben sólo un descriptor
+pequeño (name, shape, dtype). Los resultados vuelven igual.
+
+Reglas de vida de los segmentos:
+- Quien crea un segmento para enviarlo (publish_*) lo libera con release_frame()
+- Los lectores sólo usan read_frame()/write_frame(), que abren y cierran el
+  segmento en cada llamada y nunca dejan vistas vivas sobre la memoria
+- Un resultado devuelto por un worker lo libera quien lo recibe (take_frame())
+
+⚠️ Docker limita /dev/shm a 64MB por defecto: para imágenes grandes hay que
+subir shm_size en el container antes de usar este transporte.
+"""
+
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+SHARED_FRAMES_AVAILABLE = NUMPY_AVAILABLE and PIL_AVAILABLE
+
+
+@dataclass(frozen=True)
+class FrameDescriptor:
+    """📇 Lo único que viaja entre procesos: nombre del segmento, shape y dtype"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @property
+    def nbytes(self) -> int:
+        size = np.dtype(self.dtype).itemsize
+        for dim in self.shape:
+            size *= dim
+        return size
+
+
+# =====================================================================
+# 📤 CREAR SEGMENTOS
+# =====================================================================
+
+def allocate_frame(shape: Tuple[int, ...], dtype: str = 'uint8') -> Tuple[shared_memory.SharedMemory, FrameDescriptor]:
+    """Reservar un segmento vacío (p.ej. para que los workers escriban el resultado)"""
+    descriptor_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(1, descriptor_size))
+    return shm, FrameDescriptor(shm.name, tuple(int(d) for d in shape), np.dtype(dtype).str)
+
+
+def publish_frame(array: Any) -> Tuple[shared_memory.SharedMemory, FrameDescriptor]:
+    """Copiar un array NumPy a un segmento nuevo"""
+    array = np.ascontiguousarray(array)
+    shm, descriptor = allocate_frame(array.shape, array.dtype.str)
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    del view
+    return shm, descriptor
+
+
+def publish_image(image_data: Any) -> Tuple[shared_memory.SharedMemory, FrameDescriptor]:
+    """
+    📖 Decodificar una imagen (path o PIL) una sola vez a un frame RGB compartido
+    """
+    if isinstance(image_data, Image.Image):
+        return publish_frame(np.asarray(image_data.convert('RGB')))
+
+    with Image.open(image_data) as img:
+        return publish_frame(np.asarray(img.convert('RGB')))
+
+
+def release_frame(shm: Optional[shared_memory.SharedMemory]):
+    """🗑️ Cerrar y borrar un segmento creado por este proceso"""
+    if shm is None:
+        return
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# =====================================================================
+# 📥 LEER / ESCRIBIR SIN DEJAR VISTAS VIVAS
+# =====================================================================
+
+def read_frame(descriptor: FrameDescriptor, region: Tuple[slice, ...] = None) -> Any:
+    """Copiar el frame (o una región con slices) a un array propio"""
+    shm = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        view = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=shm.buf)
+        data = (view if region is None else view[region]).copy()
+        del view
+    finally:
+        shm.close()
+    return data
+
+
+def write_frame(descriptor: FrameDescriptor, data: Any, offset: Tuple[int, int] = (0, 0)):
+    """Escribir `data` dentro del frame compartido a partir de offset (fila, columna)"""
+    shm = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        view = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=shm.buf)
+        row, col = offset
+        view[row:row + data.shape[0], col:col + data.shape[1]] = data
+        del view
+    finally:
+        shm.close()
+
+
+def frame_to_image(descriptor: FrameDescriptor):
+    """🖼️ PIL Image a partir de un frame compartido"""
+    return Image.fromarray(read_frame(descriptor))
+
+
+def return_frame(image_or_array: Any) -> FrameDescriptor:
+    """
+    📤 Publicar un resultado desde un worker
+
+    El worker cierra su handle pero no borra el segmento: lo libera el
+    proceso que lo recibe con take_frame().
+    """
+    array = np.asarray(image_or_array)
+    shm, descriptor = publish_frame(array)
+    shm.close()
+    return descriptor
+
+
+def take_frame(descriptor: FrameDescriptor) -> Any:
+    """📥 Leer un resultado devuelto por un worker y liberar su segmento"""
+    shm = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        view = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=shm.buf)
+        data = view.copy()
+        del view
+    finally:
+        release_frame(shm)
+    return data
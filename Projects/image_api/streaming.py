@@ -0,0 +1,148 @@
+"""
+📡 Streaming - Servir imágenes sin cargarlas enteras en memoria
+
+Antes cada descarga hacía image_file.read() y guardaba el archivo completo
+en un HttpResponse: 100 descargas concurrentes de la imagen 4K = 100 copias
+en RAM. Aquí el archivo se envía por bloques (IMAGE_STREAM_CHUNK_SIZE) y,
+si el servidor WSGI lo soporta, con wsgi.file_wrapper (sendfile).
+
+Además:
+- Range: un solo rango de bytes -> 206 Partial Content (416 si no es válido)
+- ETag / Last-Modified: GET condicionales -> 304 Not Modified
+- If-Range: si la imagen cambió se ignora el Range y se envía completa
+"""
+
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+def get_chunk_size() -> int:
+    return getattr(settings, 'IMAGE_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """🏷️ ETag fuerte a partir de tamaño + mtime (no hace falta leer el archivo)"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    📏 Interpretar un header Range de un solo rango
+
+    Returns:
+        (inicio, fin) inclusivos, None si el header no aplica (se envía el
+        archivo completo) o lanza ValueError si el rango no es satisfacible
+    """
+    unit, _, ranges = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        # Múltiples rangos (multipart/byteranges) no soportados: archivo completo
+        return None
+
+    start_text, separator, end_text = ranges.strip().partition('-')
+    if not separator or not all(text == '' or text.isdigit() for text in (start_text, end_text)):
+        # Header mal formado: se ignora
+        return None
+
+    if start_text == '':
+        # bytes=-N: los últimos N bytes
+        if end_text == '':
+            return None
+        suffix = int(end_text)
+        if suffix == 0 or file_size == 0:
+            raise ValueError(f"Range {range_header} not satisfiable for {file_size} bytes")
+        return max(0, file_size - suffix), file_size - 1
+
+    start = int(start_text)
+    if start >= file_size:
+        raise ValueError(f"Range {range_header} not satisfiable for {file_size} bytes")
+    end = int(end_text) if end_text else file_size - 1
+    if end < start:
+        return None
+    return start, min(end, file_size - 1)
+
+
+def _if_range_matches(request, etag: str, last_modified: float) -> bool:
+    """If-Range: el Range sólo vale si la imagen no cambió"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(last_modified) <= if_range_date
+
+
+def _iter_file_range(path: Path, start: int, length: int, chunk_size: int):
+    """Generador de bloques de un rango del archivo"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def stream_file_response(request, path, content_type: str = 'image/jpeg') -> HttpResponse:
+    """
+    📡 Respuesta en streaming para un archivo, con Range y GET condicional
+
+    Args:
+        request: HttpRequest (se leen Range, If-Range, If-None-Match, If-Modified-Since)
+        path: Archivo a servir
+        content_type: MIME type de la respuesta
+    Returns:
+        FileResponse (200), StreamingHttpResponse (206), 304/412 o 416
+    """
+    path = Path(path)
+    stat = path.stat()
+    etag = file_etag(stat)
+    validators = {'ETag': etag, 'Last-Modified': http_date(stat.st_mtime)}
+
+    # 🔁 GET condicional: 304 sin enviar el cuerpo
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        for header, value in validators.items():
+            conditional[header] = value
+        return conditional
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    chunk_size = get_chunk_size()
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_file_range(path, start, length, chunk_size),
+            status=206, content_type=content_type
+        )
+        response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+        response['Content-Length'] = length
+    else:
+        # FileResponse usa wsgi.file_wrapper (sendfile) si el servidor lo ofrece
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.block_size = chunk_size
+
+    response['Accept-Ranges'] = 'bytes'
+    for header, value in validators.items():
+        response[header] = value
+    return response
@@ -36,8 +36,10 @@ urlpatterns = [
     
     # 🌐 PROJECT DAY 3: Distributed processing endpoints
     path('process-batch/distributed/', views.process_batch_distributed, name='process_batch_distributed'),
+    path('process-batch/distributed/bulk/', views.process_batch_distributed_bulk, name='process_batch_distributed_bulk'),
     path('workers/status/', views.workers_status, name='workers_status'),
     path('task/<str:task_id>/status/', views.task_status, name='task_status'),
+    path('tasks/events/', views.task_events, name='task_events'),
     
     # 📊 Simple monitoring endpoints
     path('metrics/', views.simple_metrics, name='simple_metrics'),
@@ -10,11 +10,10 @@ import time
 import json
 import logging
 import threading
-import random
 import traceback
 from pathlib import Path
 
-from django.http import HttpResponse, JsonResponse, Http404
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
@@ -23,21 +22,82 @@ from django.utils.decorators import method_decorator
 from django.views import View
 
 # Import distributed components
-from distributed.redis_queue import DistributedTaskQueue
+from distributed.backend import create_task_queue, create_worker_registry
+from distributed.connection import WatcherLimitError
+
+from .catalog import get_image_catalog
+from .streaming import stream_file_response
 
 logger = logging.getLogger(__name__)
 
+# Espera máxima de ?wait= en task_status y de una conexión de task-events
+TASK_STATUS_MAX_WAIT = float(os.getenv('TASK_STATUS_MAX_WAIT', 30))
+TASK_EVENTS_MAX_WAIT = float(os.getenv('TASK_EVENTS_MAX_WAIT', 300))
+
+def get_catalog():
+    """🗂️ Catálogo de static/images (indexado una vez, refresco incremental por mtime)"""
+    return get_image_catalog(Path(settings.STATICFILES_DIRS[0]) / "images")
+
 def get_available_images():
     """🖼️ UTILITY: Get available images dynamically - NO MORE HARDCODED LISTS!"""
-    static_images_path = Path('static/images')
-    if static_images_path.exists():
-        valid_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
-        images = []
-        for img_path in static_images_path.glob('*'):
-            if img_path.suffix.lower() in valid_extensions:
-                images.append(str(img_path))
-        return images
-    return ["static/images/sample_4k.jpg"]  # Fallback
+    images = list(get_catalog().paths())
+    return images or ["static/images/sample_4k.jpg"]  # Fallback
+
+def pool_saturated_response(error):
+    """🚦 503 cuando el pool de procesos compartido no acepta más trabajo"""
+    response = JsonResponse({
+        "error": "Servidor saturado, reintente más tarde",
+        "message": str(error),
+        "retry_after": round(error.retry_after)
+    }, status=503)
+    response['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
+def watchers_exhausted_response(error):
+    """🚦 503 cuando todas las conexiones de espera (pub/sub) del proceso están en uso"""
+    response = JsonResponse({
+        "error": "Demasiadas esperas abiertas, reintente más tarde",
+        "message": str(error),
+        "suggestion": "Reintente sin ?wait= o consulte el estado con polling"
+    }, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+def admission_rejected_response(error):
+    """🚦 429 (límite del cliente) o 503 (cola o backlog llenos) con Retry-After según el ritmo de drenado; 413 si la petición sola supera el límite"""
+    if error.status == 413:
+        return JsonResponse({
+            "error": "Petición demasiado grande",
+            "message": str(error),
+            "suggestion": "Divida las imágenes en varias peticiones o use process-batch/distributed/",
+            **error.details
+        }, status=413)
+    response = JsonResponse({
+        "error": "Demasiadas peticiones" if error.status == 429 else "Servidor saturado, reintente más tarde",
+        "message": str(error),
+        "retry_after": round(error.retry_after),
+        **error.details
+    }, status=error.status)
+    response['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
+def parse_sync_count(data, default):
+    """
+    🔢 'count' de los endpoints síncronos: entero positivo hasta SYNC_MAX_BACKLOG
+    
+    Returns:
+        (count, None) o (None, JsonResponse 400/413)
+    """
+    count = data.get('count', default)
+    if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+        return None, JsonResponse({"error": "'count' must be a positive integer"}, status=400)
+    limit = get_admission_controller().sync_limit()
+    if count > limit:
+        return None, JsonResponse({
+            "error": f"Too many images in one request: {count} > {limit}",
+            "suggestion": "Split the images across several requests or use process-batch/distributed/"
+        }, status=413)
+    return count, None
 
 # ============================================================================
 # 🏠 HEALTH CHECK ENDPOINT
@@ -58,24 +118,104 @@ def health_check(request):
         }
     })
 
+def describe_task(task_queue, task_id, task_status):
+    """📋 Estado de un task para el cliente: tiempos, progreso del job, resultado o causa del fallo"""
+    # Parse task data for better presentation
+    status_info = {
+        "task_id": task_id,
+        "status": task_status.get('status', 'unknown'),
+        "created_at": task_status.get('created_at'),
+        "started_at": task_status.get('started_at'),
+        "completed_at": task_status.get('completed_at'),
+    }
+    
+    # Add timing information
+    if status_info['created_at'] and status_info['completed_at']:
+        status_info['total_duration'] = status_info['completed_at'] - status_info['created_at']
+    
+    # Job padre (batch distribuido): progreso desde sus contadores,
+    # sin leer las subtareas
+    if task_status.get('kind') == 'job':
+        total = task_status['total']
+        finished = task_status['done'] + task_status['failed']
+        status_info['progress'] = {
+            "total": total,
+            "done": task_status['done'],
+            "failed": task_status['failed'],
+            "remaining": total - finished,
+            "percent": round(finished / total * 100, 1) if total else 100.0
+        }
+        results = task_queue.get_job_results(task_id)
+        status_info['result'] = {
+            "images_processed": finished,
+            "images_successful": task_status['done'],
+            "images_failed": task_status['failed'],
+            "workers_used": sorted({
+                r['result'].get('worker_id') for r in results
+                if r.get('status') == 'completed' and r['result'].get('worker_id')
+            }),
+            "results": results
+        }
+        if task_status.get('status') == 'failed':
+            status_info['error'] = f"All {total} subtasks failed"
+    
+    # Add result or error information
+    elif task_status.get('status') == 'completed':
+        # Ya decodificado por la cola (distributed.codec)
+        status_info['result'] = task_status.get('result') or {}
+        
+    elif task_status.get('status') == 'failed':
+        status_info['error'] = task_status.get('error', 'Unknown error')
+        status_info['failure_type'] = 'job_failure'  # vs worker_failure
+        
+        # Analyze error type
+        error_msg = status_info['error'].lower()
+        if 'cannot handle filters' in error_msg:
+            status_info['failure_reason'] = 'worker_capability_mismatch'
+            status_info['explanation'] = 'Worker tomó task pero no puede manejar el filtro requerido'
+        elif 'connection' in error_msg or 'timeout' in error_msg:
+            status_info['failure_reason'] = 'communication_error'
+            status_info['explanation'] = 'Error de comunicación con Redis o worker'
+        else:
+            status_info['failure_reason'] = 'processing_error'
+            status_info['explanation'] = 'Error durante el procesamiento de la imagen'
+    
+    # Add raw task data for debugging
+    status_info['raw_task_data'] = task_status
+    return status_info
+
 @require_http_methods(["GET"])
 def task_status(request, task_id):
     """
     📋 Get individual task status - distingue entre job failure vs worker failure
     
+    Con ?wait=<segundos> (máx. TASK_STATUS_MAX_WAIT) la respuesta espera a que
+    el task termine: una sola petición en lugar de hacer polling.
+    
     Args:
         task_id: UUID del task a consultar
         
     Returns:
         Detailed task status with failure reasons
     """
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return JsonResponse({"error": "'wait' must be a number of seconds"}, status=400)
+    
     try:
         import os
         redis_host = os.getenv('REDIS_HOST', 'localhost')
         redis_port = int(os.getenv('REDIS_PORT', 6379))
-        task_queue = DistributedTaskQueue(redis_host, redis_port)
+        task_queue = create_task_queue(redis_host, redis_port)
         
-        task_status = task_queue.get_task_status(task_id)
+        if wait > 0:
+            try:
+                task_status = task_queue.wait_for_task(task_id, min(wait, TASK_STATUS_MAX_WAIT))
+            except WatcherLimitError as e:
+                return watchers_exhausted_response(e)
+        else:
+            task_status = task_queue.get_task_status(task_id)
         
         if not task_status:
             return JsonResponse({
@@ -83,47 +223,7 @@ def task_status(request, task_id):
                 "suggestion": "Verifique que el task_id sea correcto"
             }, status=404)
         
-        # Parse task data for better presentation
-        status_info = {
-            "task_id": task_id,
-            "status": task_status.get('status', 'unknown'),
-            "created_at": task_status.get('created_at'),
-            "started_at": task_status.get('started_at'),
-            "completed_at": task_status.get('completed_at'),
-        }
-        
-        # Add timing information
-        if status_info['created_at'] and status_info['completed_at']:
-            status_info['total_duration'] = status_info['completed_at'] - status_info['created_at']
-        
-        # Add result or error information
-        if task_status.get('status') == 'completed':
-            result_raw = task_status.get('result', '{}')
-            try:
-                status_info['result'] = json.loads(result_raw)
-            except:
-                status_info['result_raw'] = result_raw
-                
-        elif task_status.get('status') == 'failed':
-            status_info['error'] = task_status.get('error', 'Unknown error')
-            status_info['failure_type'] = 'job_failure'  # vs worker_failure
-            
-            # Analyze error type
-            error_msg = status_info['error'].lower()
-            if 'cannot handle filters' in error_msg:
-                status_info['failure_reason'] = 'worker_capability_mismatch'
-                status_info['explanation'] = 'Worker tomó task pero no puede manejar el filtro requerido'
-            elif 'connection' in error_msg or 'timeout' in error_msg:
-                status_info['failure_reason'] = 'communication_error'
-                status_info['explanation'] = 'Error de comunicación con Redis o worker'
-            else:
-                status_info['failure_reason'] = 'processing_error'
-                status_info['explanation'] = 'Error durante el procesamiento de la imagen'
-        
-        # Add raw task data for debugging
-        status_info['raw_task_data'] = task_status
-        
-        return JsonResponse(status_info)
+        return JsonResponse(describe_task(task_queue, task_id, task_status))
         
     except Exception as e:
         import traceback
@@ -131,6 +231,53 @@ def task_status(request, task_id):
         logger.error(f"📋 Full traceback: {traceback.format_exc()}")
         return JsonResponse({"error": str(e)}, status=500)
 
+@require_http_methods(["GET"])
+def task_events(request):
+    """
+    📡 Server-Sent Events: estado final de varios tasks por una sola conexión
+    
+    GET /api/tasks/events/?ids=<id1>,<id2>,...&timeout=<segundos>
+    
+    Emite un evento "task" (mismo JSON que task_status) por cada task en
+    cuanto termina, "not_found" para ids desconocidos y "end" al terminar
+    todos o al agotar el timeout (con los ids que siguen pendientes).
+    """
+    task_ids = [task_id for task_id in request.GET.get('ids', '').split(',') if task_id]
+    if not task_ids:
+        return JsonResponse({"error": "Pass the task ids as ?ids=<id1>,<id2>,..."}, status=400)
+    try:
+        timeout = min(float(request.GET.get('timeout', TASK_EVENTS_MAX_WAIT)), TASK_EVENTS_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({"error": "'timeout' must be a number of seconds"}, status=400)
+    
+    task_queue = create_task_queue(os.getenv('REDIS_HOST', 'localhost'), int(os.getenv('REDIS_PORT', 6379)))
+    try:
+        watch = task_queue.watch_tasks(task_ids, timeout)
+    except WatcherLimitError as e:
+        return watchers_exhausted_response(e)
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def events():
+        pending = set(task_ids)
+        try:
+            for task_id, task_status in watch:
+                pending.discard(task_id)
+                if task_status is None:
+                    yield sse("not_found", {"task_id": task_id})
+                else:
+                    yield sse("task", describe_task(task_queue, task_id, task_status))
+        except Exception as e:
+            logger.error(f"❌ Error streaming task events: {e}")
+            yield sse("error", {"error": str(e)})
+        yield sse("end", {"pending": [task_id for task_id in task_ids if task_id in pending]})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: no bufferizar el stream
+    return response
+
 # ============================================================================
 # 🖼️ IMAGE SERVING ENDPOINTS
 # ============================================================================
@@ -162,19 +309,16 @@ def serve_4k_image(request):
         }, status=404)
     
     try:
-        # 📖 I/O OPERATION: Leer archivo del disco
-        with open(image_path, 'rb') as image_file:
-            image_data = image_file.read()
+        # 📖 I/O OPERATION: Enviar archivo del disco en streaming (por bloques,
+        # con Range y ETag/Last-Modified) en lugar de leerlo entero a memoria
+        response = stream_file_response(request, image_path, content_type='image/jpeg')
         
         # Calcular estadísticas
-        file_size_mb = len(image_data) / (1024 * 1024)
+        file_size_mb = image_path.stat().st_size / (1024 * 1024)
         processing_time = time.time() - start_time
         
-        logger.info(f"✅ Imagen servida: {file_size_mb:.2f}MB en {processing_time:.3f}s")
+        logger.info(f"✅ Imagen servida ({response.status_code}): {file_size_mb:.2f}MB en {processing_time:.3f}s")
         
-        # Crear respuesta HTTP con la imagen
-        response = HttpResponse(image_data, content_type='image/jpeg')
-        response['Content-Length'] = len(image_data)
         response['X-File-Size-MB'] = f"{file_size_mb:.2f}"
         response['X-Processing-Time'] = f"{processing_time:.3f}"
         response['X-IO-Type'] = "I/O-bound"
@@ -208,9 +352,9 @@ def get_image_info(request):
         }, status=404)
     
     try:
-        # Obtener estadísticas del archivo
-        stat_info = image_path.stat()
-        file_size_bytes = stat_info.st_size
+        # Obtener estadísticas del archivo (del catálogo: sin stat ni abrir la imagen)
+        entry = get_catalog().get(image_path.name)
+        file_size_bytes = entry.size if entry else image_path.stat().st_size
         file_size_mb = file_size_bytes / (1024 * 1024)
         
         return JsonResponse({
@@ -219,6 +363,10 @@ def get_image_info(request):
             "path": str(image_path),
             "size_bytes": file_size_bytes,
             "size_mb": round(file_size_mb, 2),
+            "width": entry.width if entry else None,
+            "height": entry.height if entry else None,
+            "format": entry.format if entry else None,
+            "sha256": entry.sha256 if entry else None,
             "is_4k_size": file_size_mb > 5,  # Rough estimate for 4K image
             "endpoints": {
                 "download": "/api/image/4k/",
@@ -259,15 +407,13 @@ def serve_slow_image(request):
         }, status=404)
     
     try:
-        with open(image_path, 'rb') as image_file:
-            image_data = image_file.read()
+        response = stream_file_response(request, image_path, content_type='image/jpeg')
         
         total_time = time.time() - start_time
-        file_size_mb = len(image_data) / (1024 * 1024)
+        file_size_mb = image_path.stat().st_size / (1024 * 1024)
         
         logger.info(f"🐌 Imagen 'procesada' y servida: {total_time:.2f}s total")
         
-        response = HttpResponse(image_data, content_type='image/jpeg')
         response['X-Processing-Time'] = f"{total_time:.3f}"
         response['X-Simulated-Delay'] = f"{delay:.1f}"
         response['X-File-Size-MB'] = f"{file_size_mb:.2f}"
@@ -325,7 +471,9 @@ def get_server_stats(request):
 
 import json
 from django.views.decorators.csrf import csrf_exempt
-from .processors import ImageProcessor
+from .processors import get_image_processor
+from .process_pool import PoolSaturatedError
+from .admission import AdmissionRejected, get_admission_controller
 from .filters import FilterFactory
 
 @csrf_exempt
@@ -339,12 +487,16 @@ def process_batch_sequential(request):
     try:
         data = json.loads(request.body)
         filters = data.get('filters', ['resize', 'blur', 'brightness'])
-        count = data.get('count', 5)
+        count, error = parse_sync_count(data, 5)
+        if error:
+            return error
+        # Una imagen a la vez, pero sharpen/edges pueden usar todos los cores por tiles
+        tiled = bool(data.get('tiled', False))
         
         start_time = time.time()
         
         # Procesamiento SECUENCIAL usando imágenes REALES
-        processor = ImageProcessor()
+        processor = get_image_processor()
         results = []
         
         # 🎯 IMPROVED: Get images dynamically
@@ -353,7 +505,7 @@ def process_batch_sequential(request):
         for i in range(count):
             # Alternar entre las imágenes disponibles
             image_path = available_images[i % len(available_images)]
-            result = processor.process_single_image(image_path, filters)
+            result = processor.process_single_image(image_path, filters, tiled=tiled, use_cache=False)
             results.append(result)
         
         total_time = time.time() - start_time
@@ -362,6 +514,7 @@ def process_batch_sequential(request):
             "method": "sequential",
             "processed_count": len(results),
             "filters_used": filters,
+            "tiled": tiled,
             "total_time": round(total_time, 3),
             "avg_time_per_image": round(total_time / count, 3),
             "performance": "🐌 LENTO - sin concurrencia"
@@ -381,19 +534,21 @@ def process_batch_threading(request):
     try:
         data = json.loads(request.body)
         filters = data.get('filters', ['resize', 'blur', 'brightness'])
-        count = data.get('count', 5)
+        count, error = parse_sync_count(data, 5)
+        if error:
+            return error
         
         start_time = time.time()
         
         # Procesamiento con THREADING usando imágenes REALES
-        processor = ImageProcessor()
+        processor = get_image_processor()
         
         # 🎯 IMPROVED: Get images dynamically
         available_images = get_available_images()
         
         # Generar lista de imágenes reales para procesar
         real_images = [available_images[i % len(available_images)] for i in range(count)]
-        results = processor.process_batch_threading(real_images, filters)
+        results = processor.process_batch_threading(real_images, filters, use_cache=False)
         
         total_time = time.time() - start_time
         
@@ -421,29 +576,29 @@ def compare_performance(request):
     try:
         data = json.loads(request.body)
         filters = data.get('filters', ['resize', 'blur', 'brightness'])
-        count = data.get('count', 5)
+        count, error = parse_sync_count(data, 5)
+        if error:
+            return error
         
-        processor = ImageProcessor()
+        processor = get_image_processor()
         
         # Usar imágenes reales para ambos tests
-        available_images = [
-            "static/images/sample_4k.jpg",
-            "static/images/Clocktower_Panorama_20080622_20mb.jpg"
-        ]
+        available_images = get_available_images()
         
-        # Test SECUENCIAL con imágenes REALES
+        # Test SECUENCIAL con imágenes REALES (sin caché de resultados en ambos tests:
+        # la primera pasada la llenaría y threading sólo mediría aciertos)
         start_seq = time.time()
         results_seq = []
         for i in range(count):
             image_path = available_images[i % len(available_images)]
-            result = processor.process_single_image(image_path, filters)
+            result = processor.process_single_image(image_path, filters, use_cache=False)
             results_seq.append(result)
         time_sequential = time.time() - start_seq
         
         # Test THREADING con imágenes REALES
         start_thr = time.time()
         real_images = [available_images[i % len(available_images)] for i in range(count)]
-        results_threading = processor.process_batch_threading(real_images, filters)
+        results_threading = processor.process_batch_threading(real_images, filters, use_cache=False)
         time_threading = time.time() - start_thr
         
         # Calcular speedup
@@ -490,9 +645,14 @@ def process_batch_multiprocessing(request):
     POST body: {"count": 3, "filters": ["heavy_sharpen", "edge_detection"]}
     """
     try:
+        admission = get_admission_controller()
+        admission.check_client(request)
+        
         # Parse request
         data = json.loads(request.body)
-        count = data.get('count', 3)
+        count, error = parse_sync_count(data, 3)
+        if error:
+            return error
         filters = data.get('filters', ['heavy_sharpen', 'edge_detection'])
         
         # Validar filtros pesados
@@ -500,14 +660,8 @@ def process_batch_multiprocessing(request):
         if not any(f in heavy_filters for f in filters):
             logger.warning(f"⚠️ No heavy filters detected in {filters}, MP may not show advantage")
         
-        # Imágenes disponibles
-        static_dir = Path(settings.STATICFILES_DIRS[0])
-        image_dir = static_dir / "images"
-        
-        available_images = []
-        for img_file in image_dir.glob("*.jpg"):
-            if img_file.stat().st_size > 100000:  # > 100KB
-                available_images.append(str(img_file))
+        # Imágenes disponibles (> 100KB)
+        available_images = get_catalog().paths(min_size=100000, extensions=('.jpg',))
         
         if not available_images:
             return JsonResponse({
@@ -515,13 +669,13 @@ def process_batch_multiprocessing(request):
                 "instructions": "Coloca imágenes .jpg en static/images/"
             }, status=404)
         
-        from .processors import ImageProcessor
-        processor = ImageProcessor(max_workers=4)
+        processor = get_image_processor()
         
         # Test MULTIPROCESSING con imágenes REALES
         start_mp = time.time()
         real_images = [available_images[i % len(available_images)] for i in range(count)]
-        results_mp = processor.process_batch_multiprocessing(real_images, filters)
+        with admission.admit_sync(count):
+            results_mp = processor.process_batch_multiprocessing(real_images, filters, use_cache=False)
         time_mp = time.time() - start_mp
         
         # Contar resultados exitosos
@@ -546,6 +700,10 @@ def process_batch_multiprocessing(request):
             "recommendation": "🎯 Multiprocessing bypasses GIL for CPU-intensive work"
         })
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except PoolSaturatedError as e:
+        return pool_saturated_response(e)
     except Exception as e:
         logger.error(f"❌ Multiprocessing error: {e}")
         return JsonResponse({"error": str(e)}, status=500)
@@ -562,19 +720,18 @@ def compare_all_methods(request):
     POST body: {"count": 5, "filters": ["heavy_sharpen", "edge_detection"]}
     """
     try:
+        admission = get_admission_controller()
+        admission.check_client(request)
+        
         # Parse request
         data = json.loads(request.body)
-        count = data.get('count', 5)
+        count, error = parse_sync_count(data, 5)
+        if error:
+            return error
         filters = data.get('filters', ['heavy_sharpen', 'edge_detection'])
         
-        # Imágenes disponibles
-        static_dir = Path(settings.STATICFILES_DIRS[0])
-        image_dir = static_dir / "images"
-        
-        available_images = []
-        for img_file in image_dir.glob("*.jpg"):
-            if img_file.stat().st_size > 100000:  # > 100KB
-                available_images.append(str(img_file))
+        # Imágenes disponibles (> 100KB)
+        available_images = get_catalog().paths(min_size=100000, extensions=('.jpg',))
         
         if not available_images:
             return JsonResponse({
@@ -582,14 +739,14 @@ def compare_all_methods(request):
                 "instructions": "Coloca imágenes .jpg en static/images/"
             }, status=404)
         
-        from .processors import ImageProcessor
-        processor = ImageProcessor(max_workers=4)
+        processor = get_image_processor()
         
         # Preparar imágenes para test
         test_images = [available_images[i % len(available_images)] for i in range(count)]
         
         # Ejecutar comparación completa usando el método del processor
-        comparison = processor.compare_performance(test_images, filters)
+        with admission.admit_sync(count):
+            comparison = processor.compare_performance(test_images, filters)
         
         # Agregar información adicional para la respuesta
         comparison["api_info"] = {
@@ -601,6 +758,10 @@ def compare_all_methods(request):
         
         return JsonResponse(comparison)
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except PoolSaturatedError as e:
+        return pool_saturated_response(e)
     except Exception as e:
         logger.error(f"❌ Compare all methods error: {e}")
         return JsonResponse({"error": str(e)}, status=500)
@@ -617,9 +778,14 @@ def stress_test(request):
     POST body: {"count": 20, "filters": ["heavy_sharpen", "edge_detection", "resize"]}
     """
     try:
+        admission = get_admission_controller()
+        admission.check_client(request)
+        
         # Parse request
         data = json.loads(request.body)
-        count = data.get('count', 20)
+        count, error = parse_sync_count(data, 20)
+        if error:
+            return error
         filters = data.get('filters', ['heavy_sharpen', 'edge_detection', 'resize'])
         
         # Validaciones de seguridad
@@ -631,20 +797,14 @@ def stress_test(request):
             }, status=400)
         
         # Imágenes disponibles
-        static_dir = Path(settings.STATICFILES_DIRS[0])
-        image_dir = static_dir / "images"
-        
-        available_images = []
-        for img_file in image_dir.glob("*.jpg"):
-            available_images.append(str(img_file))
+        available_images = get_catalog().paths(extensions=('.jpg',))
         
         if not available_images:
             return JsonResponse({
                 "error": "No hay imágenes disponibles para stress test"
             }, status=404)
         
-        from .processors import ImageProcessor
-        processor = ImageProcessor(max_workers=4)
+        processor = get_image_processor()
         
         # Stress test con multiprocessing
         start_stress = time.time()
@@ -652,7 +812,8 @@ def stress_test(request):
         
         # Usar multiprocessing para el stress test
         logger.info(f"🔥 Starting stress test: {count} images with filters {filters}")
-        results = processor.process_batch_multiprocessing(test_images, filters)
+        with admission.admit_sync(count):
+            results = processor.process_batch_multiprocessing(test_images, filters, use_cache=False)
         
         stress_time = time.time() - start_stress
         
@@ -684,6 +845,10 @@ def stress_test(request):
             }
         })
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except PoolSaturatedError as e:
+        return pool_saturated_response(e)
     except Exception as e:
         logger.error(f"❌ Stress test error: {e}")
         return JsonResponse({"error": str(e)}, status=500)
@@ -693,6 +858,80 @@ def stress_test(request):
 # 🌐 DISTRIBUTED PROCESSING ENDPOINTS
 # ============================================================================
 
+# Máximo de subtareas (imágenes) en una petición a process-batch/distributed/bulk/
+BULK_MAX_SUBTASKS = int(os.getenv('BULK_MAX_SUBTASKS', 10000))
+
+# "pull": los workers toman las tareas de las colas compartidas (por defecto)
+# "scheduled": el API asigna cada subtarea a un worker (distributed.scheduler)
+TASK_DISPATCH = os.getenv('TASK_DISPATCH', 'pull')
+
+def parse_distributed_job(data):
+    """
+    📋 Validar la especificación de un job distribuido
+    
+    Returns:
+        (job, None) con filters/filter_params/count/priority, o (None, error) para un 400
+    """
+    from distributed.redis_queue import priority_lane
+    
+    if not isinstance(data, dict):
+        return None, {"error": "Each job must be a JSON object"}
+    filters = data.get('filters', ['resize'])
+    filter_params = data.get('filter_params', {})
+    count = data.get('count', 2)
+    
+    # Prioridad: 1/"high", 2/"normal" (por defecto) o 3/"low"
+    try:
+        priority = priority_lane(data.get('priority', 2))
+    except ValueError as e:
+        return None, {"error": str(e)}
+    
+    # Validar filtros: una tarea con filtros desconocidos no la reclamaría ningún worker
+    if not isinstance(filters, list) or not all(isinstance(f, str) for f in filters):
+        return None, {"error": "'filters' must be a list of filter names"}
+    unknown_filters = [f for f in filters if f not in FilterFactory.AVAILABLE_FILTERS]
+    if unknown_filters:
+        return None, {
+            "error": f"Unknown filters: {unknown_filters}",
+            "available_filters": list(FilterFactory.AVAILABLE_FILTERS)
+        }
+    if not isinstance(count, int) or count < 1:
+        return None, {"error": "'count' must be a positive integer"}
+    
+    return {"filters": filters, "filter_params": filter_params, "count": count, "priority": priority}, None
+
+def capable_workers_for(filters, active_workers):
+    """🎯 Workers activos que tienen todos los filtros (las tareas se encolan por conjunto de filtros)"""
+    return [
+        w for w in active_workers
+        if 'all' in w.get('capabilities', []) or set(filters) <= set(w.get('capabilities', []))
+    ]
+
+def dispatch_mode(task_queue):
+    """'scheduled' si TASK_DISPATCH lo pide y el motor de la cola lo soporta, si no 'pull'"""
+    return 'scheduled' if TASK_DISPATCH == 'scheduled' and task_queue.supports_dispatch else 'pull'
+
+def schedule_batch(batch, active_workers, task_queue):
+    """
+    ⚖️ Con TASK_DISPATCH=scheduled, elegir el worker de cada subtarea
+    
+    Menor tiempo de finalización esperado según las tareas que ya tiene cada
+    worker y su EWMA por filtro (power of two choices por defecto). Rellena
+    'workers' en cada job del batch y devuelve cuántas subtareas recibe cada
+    worker ({} en modo pull).
+    """
+    if dispatch_mode(task_queue) != 'scheduled':
+        return {}
+    from distributed.scheduler import LoadAwareScheduler
+    
+    scheduler = LoadAwareScheduler(active_workers, queued=task_queue.get_dispatched_lengths())
+    assignments = {}
+    for job in batch:
+        job['workers'] = scheduler.assign(job['task_data']['filters'], len(job['images'])) or None
+        for worker_id in job['workers'] or []:
+            assignments[worker_id] = assignments.get(worker_id, 0) + 1
+    return assignments
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def process_batch_distributed(request):
@@ -702,21 +941,22 @@ def process_batch_distributed(request):
     Distribuye tareas entre múltiples workers containerizados.
     """
     import json
-    from distributed.redis_queue import DistributedTaskQueue
-    from distributed.worker_registry import WorkerRegistry
     
     try:
-        data = json.loads(request.body)
-        filters = data.get('filters', ['resize'])
-        filter_params = data.get('filter_params', {})
-        count = data.get('count', 2)
+        admission = get_admission_controller()
+        admission.check_client(request)
+        
+        job, error = parse_distributed_job(json.loads(request.body))
+        if error:
+            return JsonResponse(error, status=400)
+        filters, filter_params, count, priority = job['filters'], job['filter_params'], job['count'], job['priority']
         
         # Initialize distributed components with Docker environment variables
         import os
         redis_host = os.getenv('REDIS_HOST', 'localhost')
         redis_port = int(os.getenv('REDIS_PORT', 6379))
-        task_queue = DistributedTaskQueue(redis_host, redis_port)
-        registry = WorkerRegistry(redis_host, redis_port, redis_db=0)
+        task_queue = create_task_queue(redis_host, redis_port)
+        registry = create_worker_registry(redis_host, redis_port)
         
         # Check available workers
         active_workers = registry.get_active_workers()
@@ -726,28 +966,38 @@ def process_batch_distributed(request):
                 "suggestion": "Start workers with: docker-compose up -d"
             }, status=503)
         
-        # Prepare image list - Use real images
-        image_paths = []
-        static_dir = Path(settings.BASE_DIR) / 'static' / 'images'
-        available_images = [
-            'sample_4k.jpg',
-            'Clocktower_Panorama_20080622_20mb.jpg'
-        ]
+        # Las tareas se encolan por conjunto de filtros: hace falta al menos
+        # un worker que los tenga todos
+        capable_workers = capable_workers_for(filters, active_workers)
+        if not capable_workers:
+            return JsonResponse({
+                "error": f"No active worker can apply all of {filters}",
+                "suggestion": "Start a worker whose WORKER_CAPABILITIES include these filters"
+            }, status=503)
         
-        for i in range(count):
-            image_path = static_dir / available_images[i % len(available_images)]
-            image_paths.append(str(image_path))
+        # Backpressure: no encolar si el carril ya tiene demasiadas tareas esperando
+        admission.check_queue(task_queue, {priority: count})
+        
+        # Prepare image list - Use real images from the catalog
+        image_paths = get_catalog().pick(count, min_size=100000)
+        if not image_paths:
+            return JsonResponse({
+                "error": "No images available for distributed processing",
+                "instructions": "Put images in static/images/"
+            }, status=404)
         
-        # Enqueue task for distributed processing
+        # Fan out: una subtarea por imagen bajo un job padre, para que
+        # todos los workers procesen el batch en paralelo
         task_data = {
             'filters': filters,
             'filter_params': filter_params,
-            'images': image_paths,
             'distributed': True
         }
         
         start_time = time.time()
-        task_id = task_queue.enqueue_task(task_data)
+        batch = [{'task_data': task_data, 'images': image_paths, 'priority': priority}]
+        assignments = schedule_batch(batch, capable_workers, task_queue)
+        task_id = task_queue.enqueue_jobs(batch)[0]
         
         # Return task ID immediately (ASYNC pattern)
         total_time = time.time() - start_time
@@ -756,9 +1006,14 @@ def process_batch_distributed(request):
             "success": True,
             "method": "distributed",
             "task_id": task_id,
+            "subtasks": len(image_paths),
+            "priority": priority,
             "processing_time": round(total_time, 3),
             "worker_info": {
-                "active_workers": len(active_workers)
+                "active_workers": len(active_workers),
+                "capable_workers": len(capable_workers),
+                "dispatch": dispatch_mode(task_queue),
+                "assignments": assignments
             },
             "status": "enqueued",
             "message": "Task queued successfully - check status with /api/task-status/{task_id}",
@@ -769,6 +1024,8 @@ def process_batch_distributed(request):
             }
         })
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
     except Exception as e:
@@ -778,6 +1035,115 @@ def process_batch_distributed(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def process_batch_distributed_bulk(request):
+    """
+    📦 Bulk: muchos jobs distribuidos en una sola petición
+    
+    Body: lista de jobs (o {"jobs": [...]}) con el mismo formato que
+    process-batch/distributed/. Todos se validan antes de encolar nada y se
+    encolan en pocas round trips a Redis (enqueue_jobs), así un productor
+    sigue el ritmo de muchos workers sin una petición HTTP por tarea.
+    """
+    import json
+    
+    try:
+        admission = get_admission_controller()
+        admission.check_client(request)
+        
+        data = json.loads(request.body)
+        specs = data.get('jobs') if isinstance(data, dict) else data
+        if not isinstance(specs, list) or not specs:
+            return JsonResponse({"error": "Send a non-empty list of jobs (or {\"jobs\": [...]})"}, status=400)
+        
+        jobs = []
+        for index, spec in enumerate(specs):
+            job, error = parse_distributed_job(spec)
+            if error:
+                return JsonResponse({**error, "job_index": index}, status=400)
+            jobs.append(job)
+        
+        total_subtasks = sum(job['count'] for job in jobs)
+        if total_subtasks > BULK_MAX_SUBTASKS:
+            return JsonResponse({
+                "error": f"Too many subtasks in one request: {total_subtasks} > {BULK_MAX_SUBTASKS}",
+                "suggestion": "Split the jobs across several requests"
+            }, status=413)
+        
+        redis_host = os.getenv('REDIS_HOST', 'localhost')
+        redis_port = int(os.getenv('REDIS_PORT', 6379))
+        task_queue = create_task_queue(redis_host, redis_port)
+        registry = create_worker_registry(redis_host, redis_port)
+        
+        active_workers = registry.get_active_workers()
+        if not active_workers:
+            return JsonResponse({
+                "error": "No active workers available",
+                "suggestion": "Start workers with: docker-compose up -d"
+            }, status=503)
+        
+        # Cada conjunto de filtros distinto necesita al menos un worker capaz
+        filter_sets = {tuple(sorted(set(job['filters']))) for job in jobs}
+        uncovered = [list(fs) for fs in filter_sets if not capable_workers_for(fs, active_workers)]
+        if uncovered:
+            return JsonResponse({
+                "error": f"No active worker can apply all of {uncovered}",
+                "suggestion": "Start a worker whose WORKER_CAPABILITIES include these filters"
+            }, status=503)
+        
+        incoming = {}
+        for job in jobs:
+            incoming[job['priority']] = incoming.get(job['priority'], 0) + job['count']
+        admission.check_queue(task_queue, incoming)
+        
+        catalog = get_catalog()
+        batch = []
+        for job in jobs:
+            image_paths = catalog.pick(job['count'], min_size=100000)
+            if not image_paths:
+                return JsonResponse({
+                    "error": "No images available for distributed processing",
+                    "instructions": "Put images in static/images/"
+                }, status=404)
+            batch.append({
+                'task_data': {'filters': job['filters'], 'filter_params': job['filter_params'], 'distributed': True},
+                'images': image_paths,
+                'priority': job['priority']
+            })
+        
+        start_time = time.time()
+        assignments = schedule_batch(batch, active_workers, task_queue)
+        task_ids = task_queue.enqueue_jobs(batch)
+        total_time = time.time() - start_time
+        
+        return JsonResponse({
+            "success": True,
+            "method": "distributed_bulk",
+            "task_ids": task_ids,
+            "jobs": len(task_ids),
+            "subtasks": sum(len(job['images']) for job in batch),
+            "processing_time": round(total_time, 3),
+            "worker_info": {
+                "active_workers": len(active_workers),
+                "dispatch": dispatch_mode(task_queue),
+                "assignments": assignments
+            },
+            "status": "enqueued",
+            "message": "Jobs queued - follow them with /api/tasks/events/?ids=<ids>"
+        })
+        
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
+    except Exception as e:
+        import traceback
+        logger.error(f"❌ Bulk distributed processing error: {e}")
+        logger.error(f"📋 Full traceback: {traceback.format_exc()}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
 @require_http_methods(["GET"])
 def workers_status(request):
     """
@@ -787,14 +1153,13 @@ def workers_status(request):
     """
     try:
         import os
-        from distributed.redis_queue import DistributedTaskQueue
-        from distributed.worker_registry import WorkerRegistry
-        
+        from distributed.scheduler import worker_load
+            
         # Use Docker environment variables for Redis connection
         redis_host = os.getenv('REDIS_HOST', 'localhost')
         redis_port = int(os.getenv('REDIS_PORT', 6379))
-        registry = WorkerRegistry(redis_host, redis_port, redis_db=0)
-        task_queue = DistributedTaskQueue(redis_host, redis_port)
+        registry = create_worker_registry(redis_host, redis_port)
+        task_queue = create_task_queue(redis_host, redis_port)
         
         # Get active workers
         active_workers = registry.get_active_workers()
@@ -813,8 +1178,10 @@ def workers_status(request):
                 "last_heartbeat": worker.get('time_since_heartbeat', 0),
                 "tasks_completed": worker.get('tasks_completed', 0),
                 "tasks_failed": worker.get('tasks_failed', 0),
+                "in_flight": worker_load(worker),
+                "filter_ewma": worker.get('filter_ewma', {}),
                 "uptime": time.time() - worker.get('registered_at', time.time()),
-                "health": "healthy" if worker.get('time_since_heartbeat', 0) < 60 else "warning"
+                "health": "healthy" if worker.get('time_since_heartbeat', 0) < 2 * registry.heartbeat_interval else "warning"
             }
             workers_info.append(worker_info)
         
@@ -829,9 +1196,15 @@ def workers_status(request):
             },
             "queue_stats": {
                 "pending_tasks": queue_stats['queue_length'],
+                "pending_by_priority": queue_stats['lanes'],
+                "dispatched_by_worker": queue_stats['dispatched'],
                 "total_tasks_processed": queue_stats['total_tasks'],
-                "task_status_breakdown": queue_stats['status_breakdown']
+                "task_status_breakdown": queue_stats['status_breakdown'],
+                "engine": queue_stats.get('engine', 'list'),
+                "streams": queue_stats.get('streams', {}),
+                "dedupe": queue_stats['dedupe']
             },
+            "admission": get_admission_controller().get_stats(),
             "system_capabilities": registry_stats['available_capabilities'],
             "performance": {
                 "total_tasks_completed": registry_stats['total_tasks_completed'],
@@ -869,7 +1242,12 @@ def simple_metrics(request):
     
     ⚠️  IMPORTANT: Scaling recommendations are educational only
     ⚠️  No automatic scaling is performed
+    
+    Incluye el estado de los pools de conexiones Redis de este proceso
+    (creadas, en uso, esperas por una conexión libre).
     """
+    from distributed.connection import pool_stats
+    
     try:
         # Import here to avoid errors if simple_monitoring not available
         from simple_monitoring.metrics_collector import SimpleMetricsCollector
@@ -901,6 +1279,7 @@ def simple_metrics(request):
                 'note': '⚠️ Educational recommendations only - No automatic execution'
             },
             'scaling_config': scaling_config,
+            'redis_pools': pool_stats(),
             'timestamp': time.time()
         })
         
@@ -909,6 +1288,7 @@ def simple_metrics(request):
             'status': 'error',
             'message': 'Simple monitoring system not available',
             'suggestion': 'Install psutil: pip install psutil',
+            'redis_pools': pool_stats(),
             'timestamp': time.time()
         }, status=503)
     except Exception as e:
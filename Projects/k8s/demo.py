@@ -205,7 +205,7 @@ def main():
     for attempt in range(12):  # Max 2 minutes
         try:
             workers_check = subprocess.run(
-                "kubectl exec deployment/redis-deployment -- redis-cli HLEN workers",
+                "kubectl exec deployment/redis-deployment -- redis-cli ZCARD workers:heartbeats",
                 shell=True,
                 capture_output=True,
                 text=True,
@@ -19,11 +19,11 @@ def check_requirements():
         print("⚠️ Para stress test avanzado, instala: pip install requests")
         return False
 
-def send_heavy_task_advanced():
-    """Send heavy task using requests (advanced method)"""
+def send_heavy_batch_bulk(tasks):
+    """Send a whole batch of heavy tasks in one request (bulk endpoint)"""
     import requests
     
-    payload = {
+    job = {
         "filters": ["resize", "blur", "sharpen", "edges"],
         "filter_params": {
             "resize": {"width": 2048, "height": 2048},
@@ -35,20 +35,20 @@ def send_heavy_task_advanced():
     
     try:
         response = requests.post(
-            "http://localhost:8000/api/process-batch/distributed/",
-            json=payload,
-            timeout=10
+            "http://localhost:8000/api/process-batch/distributed/bulk/",
+            json={"jobs": [job] * tasks},
+            timeout=30
         )
         if response.status_code == 200:
-            task_id = response.json().get('task_id', 'unknown')[:8]
-            print(f"✅ Heavy task sent: {task_id}")
-            return True
+            sent = response.json().get('jobs', 0)
+            print(f"✅ Bulk: {sent} heavy tasks sent in one request")
+            return sent
         else:
             print(f"❌ HTTP {response.status_code}")
-            return False
+            return 0
     except Exception as e:
         print(f"❌ Error: {e}")
-        return False
+        return 0
 
 def send_heavy_task_curl():
     """Send heavy task using curl (fallback method)"""
@@ -109,9 +109,8 @@ def stress_test(duration_minutes=5, tasks_per_batch=10):
     has_requests = check_requirements()
     
     if has_requests:
-        print("🚀 Usando método avanzado (requests + threading)")
-        send_task = send_heavy_task_advanced
-        max_workers = 5
+        print("🚀 Usando método avanzado (requests + endpoint bulk: una petición por batch)")
+        send_task = None
     else:
         print("🚀 Usando método básico (curl)")
         send_task = send_heavy_task_curl
@@ -126,11 +125,14 @@ def stress_test(duration_minutes=5, tasks_per_batch=10):
         batch_count += 1
         print(f"\n📦 Batch {batch_count}:")
         
-        # Send tasks in parallel
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(send_task) for _ in range(tasks_per_batch)]
-            success_count = sum(1 for f in futures if f.result())
-            total_sent += success_count
+        if send_task is None:
+            success_count = send_heavy_batch_bulk(tasks_per_batch)
+        else:
+            # Send tasks in parallel
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(send_task) for _ in range(tasks_per_batch)]
+                success_count = sum(1 for f in futures if f.result())
+        total_sent += success_count
         
         print(f"✅ Sent {success_count}/{tasks_per_batch} tasks (Total: {total_sent})")
         
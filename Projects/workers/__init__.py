@@ -5,10 +5,12 @@ Componentes:
 - filter_worker.py: ProcessPoolExecutor workers
 - queue_manager.py: IPC communication
 - monitor.py: Resource monitoring
+- local_cluster.py: Local queue engine (workers in local processes)
 """
 
 from .filter_worker import FilterWorker, WorkerPool
 from .queue_manager import QueueManager
 from .monitor import ResourceMonitor
+from .local_cluster import LocalCluster, get_local_cluster
 
-__all__ = ['FilterWorker', 'WorkerPool', 'QueueManager', 'ResourceMonitor'] 
\ No newline at end of file
+__all__ = ['FilterWorker', 'WorkerPool', 'QueueManager', 'ResourceMonitor', 'LocalCluster', 'get_local_cluster'] 
\ No newline at end of file
@@ -8,6 +8,17 @@ This worker:
 3. Processes image tasks using appropriate filters
 4. Sends heartbeats for health monitoring
 5. Handles graceful shutdown
+
+Concurrency: up to WORKER_CONCURRENCY tasks run at once (one per slot, a
+thread each) and up to WORKER_PREFETCH more are claimed ahead so a slot
+never waits on Redis. Chains with heavy filters (sharpen/edges) run in the
+persistent process pool; light chains and file I/O stay on the slot thread.
+Both default to the CPUs actually available to the container.
+
+Claims are batched: one get_tasks round trip takes as many tasks as the
+window has room for, up to what keeps the slots busy for WORKER_BATCH_WINDOW_MS
+at the observed per-task time (capped by WORKER_MAX_BATCH). Light tasks are
+claimed many at a time; heavy ones still one by one.
 """
 
 import os
@@ -17,14 +28,20 @@ import signal
 import logging
 from typing import Dict, List
 import threading
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from distributed.redis_queue import DistributedTaskQueue
-from distributed.worker_registry import WorkerRegistry, HeartbeatManager
+from distributed.backend import create_task_queue, create_worker_registry
+from distributed.worker_registry import HeartbeatManager
 from image_api.filters import FilterFactory
 from image_api.processors import ImageProcessor
+from image_api.cache import get_result_cache, entry_metadata
+from image_api.catalog import get_image_catalog
+from image_api.process_pool import get_process_pool, filter_chain_task, available_cpus, PoolSaturatedError
 
 # Configure logging
 logging.basicConfig(
@@ -37,12 +54,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# CPU-bound filters: run in the process pool instead of on a slot thread
+HEAVY_FILTERS = {'sharpen', 'edges'}
+
 class DistributedImageWorker:
     """
     Distributed worker that processes image tasks from Redis queue.
     """
     
-    def __init__(self):
+    def __init__(self, task_queue=None, registry=None):
+        """
+        Args:
+            task_queue: Queue backend (default: create_task_queue(), TASK_QUEUE_ENGINE)
+            registry: Worker registry (default: the one matching the queue engine)
+        """
         # Get configuration from environment
         self.worker_id = os.getenv('WORKER_ID', f'worker-{int(time.time())}')
         self.worker_name = os.getenv('WORKER_NAME', 'Generic Worker')
@@ -59,13 +84,50 @@ class DistributedImageWorker:
         self.worker_type = os.getenv('WORKER_TYPE', 'general')
         
         # Initialize components
-        self.task_queue = DistributedTaskQueue(self.redis_host, self.redis_port, redis_db=0)
-        self.registry = WorkerRegistry(self.redis_host, self.redis_port, redis_db=0)
+        self.task_queue = task_queue or create_task_queue(self.redis_host, self.redis_port, redis_db=0)
+        self.registry = registry or create_worker_registry(self.redis_host, self.redis_port, redis_db=0)
         self.filter_factory = FilterFactory()
         self.processor = ImageProcessor()
+        self.result_cache = get_result_cache()
+        
+        # Concurrency: slots run tasks, the prefetch window bounds claimed tasks
+        self.concurrency = int(os.getenv('WORKER_CONCURRENCY', 0)) or available_cpus()
+        self.prefetch = int(os.getenv('WORKER_PREFETCH', -1))
+        if self.prefetch < 0:
+            self.prefetch = self.concurrency
+        self._window = threading.BoundedSemaphore(self.concurrency + self.prefetch)
+        # Batched claims, sized by the per-task time EWMA (1 = one task per claim)
+        self.max_batch = max(1, int(os.getenv('WORKER_MAX_BATCH', 16)))
+        self.batch_window = float(os.getenv('WORKER_BATCH_WINDOW_MS', 100)) / 1000
+        self.task_time_ewma = None
+        self._executor = None
+        # Only worth the IPC when heavy chains can run side by side
+        self.process_pool = get_process_pool() if self.concurrency > 1 else None
         
         # Worker state
         self.running = False
+        self.active_tasks = set()  # Claimed and not yet acked (running or prefetched)
+        self._active_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        
+        # Per-slot utilization since the last heartbeat
+        self._free_slots = queue.SimpleQueue()
+        for slot in range(self.concurrency):
+            self._free_slots.put(slot)
+        self._slot_busy = [0.0] * self.concurrency
+        self._slot_started = [None] * self.concurrency
+        self._slots_reported_at = time.monotonic()
+        
+        # Per-filter processing time (EWMA), published for load-aware scheduling
+        self.ewma_alpha = float(os.getenv('WORKER_EWMA_ALPHA', 0.3))
+        self.filter_ewma = {}
+        
+        # Reliable queue maintenance: extend the visibility of our tasks and
+        # re-enqueue tasks lost by dead workers
+        self.reaper_interval = min(float(os.getenv('TASK_REAPER_INTERVAL', 15)),
+                                   self.task_queue.visibility_timeout / 3)
+        self._stop_event = threading.Event()
+        self._maintenance_thread = None
         self.stats = {
             'tasks_completed': 0,
             'tasks_failed': 0,
@@ -78,21 +140,24 @@ class DistributedImageWorker:
         # Store capabilities and host for re-registration
         self.heartbeat_manager.capabilities = self.capabilities
         self.heartbeat_manager.host = os.getenv('HOSTNAME', 'container')
+        self.heartbeat_manager.stats_provider = self._slot_stats
         
         logger.info(f"🚀 Initialized worker {self.worker_id} ({self.worker_name})")
         logger.info(f"📋 Capabilities: {self.capabilities}")
         logger.info(f"🎯 Worker type: {self.worker_type}")
+        logger.info(f"🧵 Concurrency: {self.concurrency} slots, prefetch {self.prefetch}, "
+                    f"claim batches up to {self.max_batch}")
     
     def start(self):
         """Start the worker."""
         try:
-            # Test Redis connection
-            self.task_queue.redis_client.ping()
-            self.registry.redis_client.ping()
-            logger.info("✅ Redis connection successful")
+            # Test the queue (Redis or local) connection
+            self.task_queue.ping()
+            self.registry.ping()
+            logger.info("✅ Queue connection successful")
             
         except Exception as e:
-            logger.error(f"❌ Failed to connect to Redis: {e}")
+            logger.error(f"❌ Failed to connect to the queue: {e}")
             return
         
         # Register worker
@@ -118,14 +183,24 @@ class DistributedImageWorker:
             return
         logger.info(f"✅ Worker {self.worker_id} verified in active workers list")
         
+        # Recover tasks left in our processing list by a previous run
+        recovered = self.task_queue.requeue_worker_tasks(self.worker_id)
+        if recovered['requeued'] or recovered['failed']:
+            logger.warning(f"♻️ Recovered tasks from previous run: {recovered}")
+        
         # Start heartbeat
         self.heartbeat_manager.start()
         
+        # Start reliable queue maintenance
+        self._maintenance_thread = threading.Thread(target=self._maintenance_loop, daemon=True)
+        self._maintenance_thread.start()
+        
         # Set up signal handlers for graceful shutdown
         signal.signal(signal.SIGTERM, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
         
         # Start main processing loop
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='slot')
         self.running = True
         logger.info(f"🎯 Worker {self.worker_id} started, waiting for tasks...")
         
@@ -137,34 +212,140 @@ class DistributedImageWorker:
             self._shutdown()
     
     def _process_loop(self):
-        """Main processing loop."""
+        """Main processing loop: claim batches of tasks while the prefetch window has room."""
         consecutive_empty_polls = 0
         max_empty_polls = 10
         
         while self.running:
+            # Wait for a free place in the window (running + prefetched)
+            if not self._window.acquire(timeout=1):
+                continue
+            # Take more free places, up to the batch size, without waiting
+            places = 1
+            batch_size = self._batch_size()
+            while places < batch_size and self._window.acquire(blocking=False):
+                places += 1
+            
+            tasks = []
             try:
-                # Get next task from queue
-                task = self.task_queue.get_task(self.worker_id, timeout=5)
-                
-                if task is None:
-                    consecutive_empty_polls += 1
-                    if consecutive_empty_polls >= max_empty_polls:
-                        logger.debug(f"💤 No tasks for {max_empty_polls * 5}s, worker {self.worker_id} idle")
-                        consecutive_empty_polls = 0
+                tasks = self.task_queue.get_tasks(self.worker_id, places, timeout=5,
+                                                  capabilities=self.capabilities)
+            except Exception as e:
+                logger.error(f"❌ Error in processing loop: {e}")
+                time.sleep(1)  # Brief pause before retry
+            for _ in range(places - len(tasks)):
+                self._window.release()
+            
+            if not tasks:
+                consecutive_empty_polls += 1
+                if consecutive_empty_polls >= max_empty_polls:
+                    logger.debug(f"💤 No tasks for {max_empty_polls * 5}s, worker {self.worker_id} idle")
+                    consecutive_empty_polls = 0
+                continue
+            
+            consecutive_empty_polls = 0
+            
+            # Process each task on a slot (acked inside with complete_task/fail_task)
+            with self._active_lock:
+                self.active_tasks.update(task['id'] for task in tasks)
+            for task in tasks:
+                self._executor.submit(self._run_task, task)
+    
+    def _batch_size(self) -> int:
+        """Tasks per claim: enough to keep every slot busy for batch_window at the observed task time."""
+        if self.max_batch == 1 or self.task_time_ewma is None:
+            return 1
+        batch = int(self.batch_window * self.concurrency / max(self.task_time_ewma, 1e-3))
+        return max(1, min(batch, self.max_batch))
+    
+    def _run_task(self, task: Dict):
+        """Run one task on a free slot and account the slot's busy time."""
+        slot = self._free_slots.get()
+        started = time.monotonic()
+        self._slot_started[slot] = started
+        try:
+            logger.info(f"📝 Processing task {task['id']} on slot {slot} (retries: {task.get('retries', 0)})")
+            self._process_task(task)
+        except Exception as e:
+            logger.error(f"❌ Error running task {task['id']}: {e}")
+        finally:
+            with self._stats_lock:
+                finished = time.monotonic()
+                self._slot_busy[slot] += finished - max(started, self._slots_reported_at)
+                self._slot_started[slot] = None
+                duration = finished - started
+                self.task_time_ewma = duration if self.task_time_ewma is None else (
+                    self.ewma_alpha * duration + (1 - self.ewma_alpha) * self.task_time_ewma)
+            self._free_slots.put(slot)
+            with self._active_lock:
+                self.active_tasks.discard(task['id'])
+            self._window.release()
+    
+    def _slot_stats(self) -> Dict:
+        """Heartbeat gauges: per-slot utilization since the previous heartbeat, load and filter EWMA."""
+        now = time.monotonic()
+        with self._stats_lock:
+            window = now - self._slots_reported_at
+            utilization = []
+            for slot in range(self.concurrency):
+                busy = self._slot_busy[slot]
+                started = self._slot_started[slot]
+                if started is not None:
+                    busy += now - max(started, self._slots_reported_at)
+                utilization.append(round(min(busy / window, 1.0), 3) if window > 0 else 0.0)
+                self._slot_busy[slot] = 0.0
+            self._slots_reported_at = now
+            last_task_at = self.stats['last_task_at']
+            filter_ewma = {name: round(seconds, 4) for name, seconds in self.filter_ewma.items()}
+        
+        with self._active_lock:
+            active = len(self.active_tasks)
+        running = sum(1 for started in self._slot_started if started is not None)
+        return {
+            'concurrency': self.concurrency,
+            'prefetch': self.prefetch,
+            'slots_busy': running,
+            'prefetched': max(0, active - running),
+            'slot_utilization': json.dumps(utilization),
+            'utilization': round(sum(utilization) / len(utilization), 3),
+            'filter_ewma': json.dumps(filter_ewma),
+            'last_task_at': last_task_at
+        }
+    
+    def _update_filter_ewma(self, filter_results: List[Dict]):
+        """Fold the duration of each filter stage into its EWMA."""
+        with self._stats_lock:
+            for stage in filter_results:
+                name, duration = stage.get('filter'), stage.get('duration')
+                if not name or duration is None or 'error' in stage:
                     continue
+                previous = self.filter_ewma.get(name)
+                self.filter_ewma[name] = duration if previous is None else (
+                    self.ewma_alpha * duration + (1 - self.ewma_alpha) * previous)
+    
+    def _maintenance_loop(self):
+        """Keep our tasks visible, re-enqueue expired tasks and trim the finished index."""
+        while not self._stop_event.wait(self.reaper_interval):
+            try:
+                with self._active_lock:
+                    task_ids = list(self.active_tasks)
+                self.task_queue.touch_tasks(task_ids)
                 
-                consecutive_empty_polls = 0
-                
-                # Process the task
-                logger.info(f"📝 Processing task {task['id']}")
-                self._process_task(task)
+                reaped = self.task_queue.requeue_expired_tasks()
+                if reaped['requeued'] or reaped['failed']:
+                    logger.warning(f"♻️ Reaper: {reaped['requeued']} tasks requeued, "
+                                   f"{reaped['failed']} failed after max retries")
                 
-                # Update heartbeat with current stats
-                self.heartbeat_manager.update_stats(**self.stats)
+                # Tasks dispatched to workers that died go back to the shared queues
+                released = self.task_queue.release_orphaned_dispatch(self.registry.get_active_worker_ids())
+                if released:
+                    logger.warning(f"♻️ Released {released} tasks dispatched to inactive workers")
                 
+                # Hashes past TASK_RESULT_TTL are already gone: drop their index entries
+                if self.task_queue.result_ttl:
+                    self.task_queue.clear_completed_tasks(self.task_queue.result_ttl)
             except Exception as e:
-                logger.error(f"❌ Error in processing loop: {e}")
-                time.sleep(1)  # Brief pause before retry
+                logger.error(f"❌ Error in maintenance loop: {e}")
     
     def _make_serializable(self, filter_results):
         """
@@ -211,12 +392,14 @@ class DistributedImageWorker:
             images = task_data.get('images', [])
             
             if not images:
-                # Use default images if none specified - prioritize 20MB image for demo
-                images = ['static/images/Clocktower_Panorama_20080622_20mb.jpg', 'static/images/sample_4k.jpg']
+                # Use the image catalog if none specified - largest first for the demo
+                catalog = get_image_catalog()
+                images = [entry.path for entry in sorted(catalog.entries(), key=lambda e: e.size, reverse=True)]
             
             logger.info(f"🖼️ Processing {len(images)} images with filters: {filters}")
             
-            # Check if this worker can handle all requested filters
+            # Routing only hands us tasks we can run; unrouted tasks (queued
+            # before routing existed) may still need a filter we lack
             unsupported_filters = [f for f in filters if f not in self.capabilities and 'all' not in self.capabilities]
             if unsupported_filters:
                 raise ValueError(f"Worker {self.worker_id} cannot handle filters: {unsupported_filters}")
@@ -225,24 +408,55 @@ class DistributedImageWorker:
             results = []
             for image_path in images:
                 try:
-                    # Simulate file I/O (reading image)
-                    with open(image_path, 'rb') as f:
-                        image_size = len(f.read())
-                    
-                    logger.debug(f"📂 Loaded image {image_path} ({image_size} bytes)")
+                    # Content-addressed cache: a hit skips reading, decoding and encoding
+                    cache_key = self.result_cache.key_for(image_path, filters, filter_params)
+                    cached = self.result_cache.get(cache_key)
                     
-                    # Apply filter chain
-                    filter_results = self.filter_factory.apply_filter_chain(
-                        image_path, filters, filter_params
-                    )
-                    
-                    # Collect results (serialize-safe, no PIL Images)
-                    serializable_filter_results = self._make_serializable(filter_results)
+                    if cached:
+                        logger.info(f"💾 Cache hit for {image_path}")
+                        serializable_filter_results = cached['filter_results']
+                    else:
+                        # Simulate file I/O (reading image)
+                        with open(image_path, 'rb') as f:
+                            image_size = len(f.read())
+                        
+                        logger.debug(f"📂 Loaded image {image_path} ({image_size} bytes)")
+                        
+                        # Apply filter chain (fused: decode once, encode only the final image)
+                        staging_path = self.result_cache.staging_path(cache_key, image_path)
+                        filter_results = None
+                        if self.process_pool and HEAVY_FILTERS.intersection(filters):
+                            try:
+                                filter_results = self.process_pool.submit(
+                                    filter_chain_task, image_path, filters, filter_params, staging_path
+                                ).result()
+                            except PoolSaturatedError as e:
+                                # Backpressure, not a bad image: run it on this slot instead
+                                logger.warning(f"⚠️ Process pool saturated, running {image_path} inline: {e}")
+                        if filter_results is None:
+                            filter_results = self.filter_factory.apply_filter_chain(
+                                image_path, filters, filter_params, fused=True, output_path=staging_path
+                            )
+                        
+                        # Collect results (serialize-safe, no PIL Images)
+                        serializable_filter_results = self._make_serializable(filter_results)
+                        
+                        # Only cache results where every stage succeeded
+                        if any('error' in r for r in serializable_filter_results.get('filter_results', [])):
+                            self.result_cache.discard(staging_path)
+                        else:
+                            entry = self.result_cache.put(cache_key, staging_path, entry_metadata(
+                                image_path, filters, filter_params, serializable_filter_results,
+                                file_size=image_size
+                            ))
+                            serializable_filter_results = entry['filter_results']
+                        self._update_filter_ewma(serializable_filter_results.get('filter_results', []))
                     
                     image_results = {
                         'image_path': image_path,
                         'filters_applied': filters,
                         'filter_results': serializable_filter_results,
+                        'cache_hit': bool(cached),
                         'worker_id': self.worker_id,
                         'processing_time': time.time() - start_time
                     }
@@ -277,21 +491,17 @@ class DistributedImageWorker:
             # If ALL images failed, mark task as failed
             if len(failed_images) == len(images):
                 error_msg = f"All {len(images)} images failed. Errors: {[r['error'] for r in failed_images]}"
-                self.task_queue.fail_task(task_id, error_msg)
+                self.task_queue.fail_task(task_id, error_msg, self.worker_id)
                 
-                # Update stats
-                self.stats['tasks_failed'] += 1
+                self._record_result(success=False)
                 
                 logger.error(f"❌ Task {task_id} FAILED - all images failed in {processing_time:.2f}s")
                 
             else:
                 # Mark task as completed (at least some images succeeded)
-                self.task_queue.complete_task(task_id, result_data)
+                self.task_queue.complete_task(task_id, result_data, self.worker_id)
                 
-                # Update stats
-                self.stats['tasks_completed'] += 1
-                self.stats['total_processing_time'] += processing_time
-                self.stats['last_task_at'] = time.time()
+                self._record_result(success=True, processing_time=processing_time)
                 
                 if failed_images:
                     logger.warning(f"⚠️ Task {task_id} completed with {len(failed_images)}/{len(images)} failures in {processing_time:.2f}s")
@@ -300,13 +510,23 @@ class DistributedImageWorker:
             
         except Exception as e:
             # Mark task as failed
-            self.task_queue.fail_task(task_id, str(e))
+            self.task_queue.fail_task(task_id, str(e), self.worker_id)
             
-            # Update stats
-            self.stats['tasks_failed'] += 1
+            self._record_result(success=False)
             
             logger.error(f"❌ Task {task_id} failed: {e}")
     
+    def _record_result(self, success: bool, processing_time: float = 0.0):
+        """Update local stats (slots run concurrently) and queue the heartbeat counters."""
+        with self._stats_lock:
+            if success:
+                self.stats['tasks_completed'] += 1
+                self.stats['total_processing_time'] += processing_time
+                self.stats['last_task_at'] = time.time()
+            else:
+                self.stats['tasks_failed'] += 1
+        self.heartbeat_manager.record_task(success=success, processing_time=processing_time)
+    
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals."""
         logger.info(f"📡 Received signal {signum}, initiating graceful shutdown...")
@@ -316,8 +536,39 @@ class DistributedImageWorker:
         """Graceful shutdown process."""
         logger.info(f"🛑 Shutting down worker {self.worker_id}")
         
-        # Stop heartbeat
+        # Let running tasks finish; prefetched ones go back to the queue now
+        # instead of waiting for their visibility timeout
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            # Cancelled before starting: still in active_tasks, returned without a retry
+            with self._active_lock:
+                prefetched = list(self.active_tasks)
+            try:
+                returned = self.task_queue.release_tasks(self.worker_id, prefetched)
+                if returned:
+                    logger.info(f"↩️ Returned {returned} prefetched tasks to the queue")
+            except Exception as e:
+                logger.error(f"❌ Could not return prefetched tasks: {e}")
+            # Anything else we still own did start: requeued with a retry
+            try:
+                requeued = self.task_queue.requeue_worker_tasks(self.worker_id)
+                if requeued['requeued'] or requeued['failed']:
+                    logger.warning(f"↩️ Requeued {requeued['requeued']} unfinished tasks "
+                                   f"({requeued['failed']} over their retry limit)")
+            except Exception as e:
+                logger.error(f"❌ Could not requeue unfinished tasks: {e}")
+        
+        # Tasks the API dispatched to us and we never claimed
+        try:
+            released = self.task_queue.release_dispatched_tasks(self.worker_id)
+            if released:
+                logger.info(f"↩️ Released {released} dispatched tasks to the shared queues")
+        except Exception as e:
+            logger.error(f"❌ Could not release dispatched tasks: {e}")
+        
+        # Stop heartbeat and queue maintenance
         self.heartbeat_manager.stop()
+        self._stop_event.set()
         
         # Unregister worker
         self.registry.unregister_worker(self.worker_id)
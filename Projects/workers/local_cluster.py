@@ -0,0 +1,255 @@
+"""
+Local Cluster - in-process queue engine (TASK_QUEUE_ENGINE=local)
+
+Runs the distributed pipeline on one node without Redis: the API process
+owns a QueueManager (task table + multiprocessing queues) and a
+LocalWorkerRegistry, and starts LOCAL_WORKERS DistributedImageWorker
+processes that talk to both over IPC. A supervisor thread restarts dead
+workers after re-enqueueing the tasks they held.
+
+The task table lives in the API process, so the API must run as a single
+process (runserver, or one gunicorn worker with threads). Local workers
+all handle every filter: capabilities are not used for routing.
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import multiprocessing as mp
+from queue import Empty
+from typing import Dict, List, Optional
+
+from distributed.worker_registry import WorkerRegistry
+from .queue_manager import QueueManager
+
+logger = logging.getLogger(__name__)
+
+# Set in local worker processes: they get their queue from the cluster, never start one
+_IN_LOCAL_WORKER = False
+
+
+class LocalWorkerRegistry(WorkerRegistry):
+    """
+    WorkerRegistry kept in the API process.
+
+    Worker processes send register/heartbeat/unregister over a
+    multiprocessing queue and the cluster applies them to the table; worker
+    fields are stored as strings, like the Redis hashes, and parsed the same
+    way. A worker process only sees its own entry.
+    """
+
+    def __init__(self, context=None):
+        context = context or mp.get_context()
+        self.heartbeat_interval = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', 5))  # seconds
+        self.worker_timeout = float(os.getenv('WORKER_TIMEOUT', 15))  # seconds (3 missed heartbeats)
+        self.worker_retention = 300  # seconds a dead worker stays visible for debugging
+        self._updates = context.Queue()
+        self._owner_pid = os.getpid()
+        self._workers: Dict[str, Dict[str, str]] = {}
+        self._heartbeats: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {key: self.__dict__[key]
+                for key in ('heartbeat_interval', 'worker_timeout', 'worker_retention', '_updates', '_owner_pid')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _workers={}, _heartbeats={}, _lock=threading.Lock())
+
+    def ping(self) -> bool:
+        return True
+
+    def _send(self, op: str, worker_id: str, payload: Dict) -> bool:
+        """Apply an update here and, from a worker process, send it to the API process."""
+        now = time.time()
+        applied = self._apply(op, worker_id, payload, now)
+        if os.getpid() != self._owner_pid:
+            self._updates.put((op, worker_id, payload, now))
+        return applied
+
+    def _apply(self, op: str, worker_id: str, payload: Dict, now: float) -> bool:
+        with self._lock:
+            if op == 'register':
+                self._workers[worker_id] = {k: str(v) for k, v in payload.items()}
+                self._heartbeats[worker_id] = now
+                return True
+            if op == 'unregister':
+                self._heartbeats.pop(worker_id, None)
+                return self._workers.pop(worker_id, None) is not None
+            worker = self._workers.get(worker_id)
+            if worker is None:
+                return False
+            worker.update(last_heartbeat=str(now), status='active')
+            worker.update({k: str(v) for k, v in payload['stats'].items()})
+            for field, value in payload['increments'].items():
+                worker[field] = str(float(worker.get(field) or 0) + value)
+            self._heartbeats[worker_id] = now
+            return True
+
+    def apply_updates(self, timeout: float = 1.0) -> int:
+        """Apply the updates sent by worker processes (API process); waits up to `timeout` for the first."""
+        applied = 0
+        try:
+            update = self._updates.get(timeout=timeout)
+            while True:
+                self._apply(*update)
+                applied += 1
+                update = self._updates.get_nowait()
+        except Empty:
+            return applied
+
+    def register_worker(self, worker_id: str, capabilities: List[str],
+                        host: str = 'localhost', port: int = None) -> bool:
+        now = time.time()
+        registered = self._send('register', worker_id, {
+            'id': worker_id,
+            'capabilities': json.dumps(capabilities),
+            'host': host,
+            'port': port or '',
+            'status': 'active',
+            'registered_at': now,
+            'last_heartbeat': now,
+            'tasks_completed': 0,
+            'tasks_failed': 0,
+            'total_processing_time': 0.0
+        })
+        print(f"✅ Worker {worker_id} registered successfully")
+        return registered
+
+    def unregister_worker(self, worker_id: str) -> bool:
+        return self._send('unregister', worker_id, {})
+
+    def heartbeat(self, worker_id: str, stats: Optional[Dict] = None,
+                  increments: Optional[Dict[str, float]] = None) -> bool:
+        return self._send('heartbeat', worker_id, {
+            'stats': {k: v for k, v in (stats or {}).items() if v is not None},
+            'increments': increments or {}
+        })
+
+    def get_worker_info(self, worker_id: str) -> Optional[Dict]:
+        with self._lock:
+            worker_data = dict(self._workers.get(worker_id) or {})
+        return self._parse_worker(worker_data) if worker_data else None
+
+    def get_active_workers(self) -> List[Dict]:
+        current_time = time.time()
+        with self._lock:
+            workers = [(dict(self._workers[worker_id]), last_heartbeat)
+                       for worker_id, last_heartbeat in self._heartbeats.items()
+                       if last_heartbeat >= current_time - self.worker_timeout]
+        active_workers = []
+        for worker_data, last_heartbeat in workers:
+            worker_data = self._parse_worker(worker_data)
+            worker_data['is_active'] = True
+            worker_data['time_since_heartbeat'] = current_time - last_heartbeat
+            active_workers.append(worker_data)
+        return active_workers
+
+    def get_active_worker_ids(self) -> List[str]:
+        cutoff = time.time() - self.worker_timeout
+        with self._lock:
+            return [worker_id for worker_id, last_heartbeat in self._heartbeats.items() if last_heartbeat >= cutoff]
+
+    def cleanup_inactive_workers(self) -> int:
+        cutoff = time.time() - self.worker_retention
+        with self._lock:
+            stale = [worker_id for worker_id, last_heartbeat in self._heartbeats.items() if last_heartbeat < cutoff]
+            for worker_id in stale:
+                del self._heartbeats[worker_id]
+                self._workers.pop(worker_id, None)
+        return len(stale)
+
+    def count_workers(self) -> int:
+        with self._lock:
+            return len(self._workers)
+
+
+def run_local_worker(task_queue: QueueManager, registry: LocalWorkerRegistry, worker_id: str):
+    """Entry point of a local worker process."""
+    global _IN_LOCAL_WORKER
+    _IN_LOCAL_WORKER = True
+    os.environ['WORKER_ID'] = worker_id
+    os.environ.setdefault('WORKER_NAME', f'Local worker {worker_id}')
+
+    from workers.distributed_worker import DistributedImageWorker
+    DistributedImageWorker(task_queue=task_queue, registry=registry).start()
+
+
+class LocalCluster:
+    """The local engine's queue, registry and worker processes (API process side)."""
+
+    def __init__(self, workers: int = None):
+        # spawn: workers start clean instead of inheriting the API's threads and pools
+        self.context = mp.get_context('spawn')
+        self.size = workers or int(os.getenv('LOCAL_WORKERS', 2))
+        self.queue = QueueManager(maxsize=0, context=self.context)
+        self.registry = LocalWorkerRegistry(self.context)
+        self.processes: Dict[str, mp.process.BaseProcess] = {}
+        self._stop_event = threading.Event()
+        self._supervisor = None
+
+    def start(self):
+        """Start the queue, the worker processes and the supervisor."""
+        self.queue.start()
+        self.queue.serve_tasks()
+        for index in range(self.size):
+            self._spawn(f'local-{index}')
+        self._supervisor = threading.Thread(target=self._supervise, name='LocalClusterSupervisor', daemon=True)
+        self._supervisor.start()
+        atexit.register(self.stop)
+        logger.info(f"🏠 Local cluster started with {self.size} workers")
+
+    def _spawn(self, worker_id: str):
+        # Not daemonic: workers start their own process pool
+        process = self.context.Process(target=run_local_worker, args=(self.queue, self.registry, worker_id),
+                                       name=worker_id)
+        process.start()
+        self.processes[worker_id] = process
+
+    def _supervise(self):
+        """Apply registry updates and restart workers that died."""
+        last_check = time.time()
+        while not self._stop_event.is_set():
+            self.registry.apply_updates(timeout=1.0)
+            if time.time() - last_check < self.registry.heartbeat_interval:
+                continue
+            last_check = time.time()
+            for worker_id, process in list(self.processes.items()):
+                if process.is_alive() or self._stop_event.is_set():
+                    continue
+                recovered = self.queue.requeue_worker_tasks(worker_id)
+                self.registry.unregister_worker(worker_id)
+                logger.warning(f"♻️ Local worker {worker_id} exited ({process.exitcode}), "
+                               f"restarting; recovered {recovered}")
+                self._spawn(worker_id)
+
+    def stop(self):
+        """Stop the workers (graceful SIGTERM) and the queue."""
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=10)
+        self.queue.stop()
+
+
+_cluster: Optional[LocalCluster] = None
+_cluster_lock = threading.Lock()
+
+
+def get_local_cluster() -> LocalCluster:
+    """Local cluster of this process, started on first use."""
+    global _cluster
+    if _IN_LOCAL_WORKER:
+        raise RuntimeError("Local workers get their queue from the cluster that started them")
+    with _cluster_lock:
+        if _cluster is None:
+            _cluster = LocalCluster()
+            _cluster.start()
+        return _cluster
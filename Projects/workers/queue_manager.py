@@ -2,18 +2,27 @@
 🔗 Queue Manager - DÍA 2: IPC Communication
 
 Gestión de comunicación entre procesos usando multiprocessing.Queue
+
+También implementa TaskQueueBackend (distributed/backend.py): el motor de
+cola en proceso (TASK_QUEUE_ENGINE=local) con la misma semántica de tasks,
+jobs y estados que la cola de Redis, sin red (ver workers/local_cluster.py).
 """
 
+import os
 import time
 import uuid
 import threading
 import multiprocessing as mp
-from typing import Dict, Any, Optional, List, Callable
+from typing import Dict, Any, Optional, List, Callable, Union
 from dataclasses import dataclass, asdict
 from queue import Empty, Full
 import logging
 import json
 
+from distributed.backend import TaskQueueBackend
+from distributed.redis_queue import (FINISHED_STATUSES, PRIORITY_LANES, dedupe_stats, priority_lane, route_key,
+                                     task_fingerprint)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,6 +38,7 @@ class TaskMessage:
     timestamp: float
     priority: int = 1
     max_retries: int = 3
+    retries: int = 0
     
     def to_dict(self) -> Dict[str, Any]:
         """Convertir a diccionario para serialización"""
@@ -47,9 +57,10 @@ class ResultMessage:
     result: Any = None
     error: Optional[str] = None
     processing_time: float = 0.0
-    worker_id: Optional[int] = None
+    worker_id: Optional[Union[int, str]] = None
     process_id: Optional[int] = None
     timestamp: float = 0.0
+    status: Optional[str] = None  # 'processing' = aviso de claim/keep-alive, 'returned' = devuelto sin empezar, None = resultado final
     
     def to_dict(self) -> Dict[str, Any]:
         """Convertir a diccionario"""
@@ -60,29 +71,63 @@ class ResultMessage:
         """Crear desde diccionario"""
         return cls(**data)
 
-class QueueManager:
+# Prioridad numérica de cada carril (1 = high, 2 = normal, 3 = low)
+LANE_PRIORITY = {lane: priority for priority, lane in PRIORITY_LANES.items()}
+
+# Estado que viaja a los procesos worker (colas y configuración): la tabla de
+# tasks, los threads y los locks se quedan en el proceso dueño
+SHARED_STATE = ('maxsize', 'task_queue', 'result_queue', 'high_priority_queue', 'low_priority_queue',
+                'visibility_timeout', 'max_retries', 'result_ttl', '_ready', '_owner_pid')
+
+class QueueManager(TaskQueueBackend):
     """
     🎯 Gestor de colas para comunicación IPC
     
     Maneja task distribution y result collection usando multiprocessing.Queue
+    
+    Como TaskQueueBackend, el proceso que lo crea (dueño) guarda la tabla de
+    tasks; los workers reciben los ids por las colas de prioridad y mandan
+    claims y resultados por result_queue, que serve_tasks() aplica. No mezclar
+    con send_task/get_result sobre el mismo manager: ambos usan result_queue.
     """
     
-    def __init__(self, maxsize: int = 100):
+    def __init__(self, maxsize: int = 100, context=None):
         """
         Inicializar manager de colas
         
         Args:
-            maxsize: Tamaño máximo de colas
+            maxsize: Tamaño máximo de colas (0 = sin límite)
+            context: Contexto de multiprocessing (por defecto el de la plataforma)
         """
         self.maxsize = maxsize
+        context = context or mp.get_context()
         
         # Colas principales
-        self.task_queue = mp.Queue(maxsize=maxsize)
-        self.result_queue = mp.Queue(maxsize=maxsize)
+        self.task_queue = context.Queue(maxsize=maxsize)
+        self.result_queue = context.Queue(maxsize=maxsize)
         
         # Colas especializadas por prioridad
-        self.high_priority_queue = mp.Queue(maxsize=maxsize // 4)
-        self.low_priority_queue = mp.Queue(maxsize=maxsize // 2)
+        self.high_priority_queue = context.Queue(maxsize=maxsize // 4)
+        self.low_priority_queue = context.Queue(maxsize=maxsize // 2)
+        
+        # TaskQueueBackend: mismos ajustes que la cola de Redis
+        self.visibility_timeout = float(os.getenv('TASK_VISIBILITY_TIMEOUT', 300))
+        self.max_retries = int(os.getenv('TASK_MAX_RETRIES', 3))
+        self.result_ttl = int(os.getenv('TASK_RESULT_TTL', 86400))
+        self._ready = context.Semaphore(0)  # un token por task encolado
+        self._owner_pid = os.getpid()
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._job_results: Dict[str, List[str]] = {}
+        self._inflight: Dict[str, float] = {}  # task id -> deadline de visibilidad
+        self._counters = dict.fromkeys(('pending', 'processing', 'completed', 'failed', 'total'), 0)
+        # Single-flight: fingerprint -> task que lo calcula, y tasks idénticos ligados a él
+        self.single_flight = os.getenv('TASK_SINGLE_FLIGHT', '1') == '1'
+        self._flights: Dict[str, str] = {}
+        self._followers: Dict[str, List[str]] = {}
+        self._dedupe = {'checked': 0, 'hits': 0}
+        self._changed = threading.Condition()
+        self._serve_thread: Optional[threading.Thread] = None
+        self._stop_serving = threading.Event()
         
         # Estado del manager
         self.is_running = False
@@ -116,6 +161,10 @@ class QueueManager:
         """🛑 Detener el manager"""
         self.is_running = False
         self._stop_monitoring.set()
+        self._stop_serving.set()
+        
+        if self._serve_thread and self._serve_thread.is_alive():
+            self._serve_thread.join(timeout=2.0)
         
         if self._monitor_thread and self._monitor_thread.is_alive():
             self._monitor_thread.join(timeout=2.0)
@@ -399,10 +448,29 @@ class QueueManager:
                 pass
     
     def get_queue_stats(self) -> Dict[str, Any]:
-        """📊 Obtener estadísticas de colas"""
+        """📊 Obtener estadísticas de colas (también las de TaskQueueBackend)"""
         uptime = time.time() - (self.start_time or time.time()) if self.is_running else 0
+        lanes = {
+            'high': self.high_priority_queue.qsize(),
+            'normal': self.task_queue.qsize(),
+            'low': self.low_priority_queue.qsize()
+        }
+        with self._changed:
+            counters = dict(self._counters)
+            in_flight = len(self._inflight)
+            dedupe = dedupe_stats(self._dedupe['checked'], self._dedupe['hits'])
         
         return {
+            "engine": "local",
+            "queue_length": sum(lanes.values()),
+            "lanes": lanes,
+            "queues": {},
+            "dispatched": {},
+            "in_flight": in_flight,
+            "total_tasks": counters['total'],
+            "status_breakdown": {status: counters[status]
+                                 for status in ('pending', 'processing', 'completed', 'failed')},
+            "dedupe": dedupe,
             "is_running": self.is_running,
             "uptime": uptime,
             "task_queue_size": self.task_queue.qsize(),
@@ -418,6 +486,381 @@ class QueueManager:
             "success_rate": (self.tasks_completed / max(1, self.tasks_sent)) * 100
         }
 
+    # =================================================================
+    # 🔌 TaskQueueBackend: motor de cola en proceso (TASK_QUEUE_ENGINE=local)
+    # =================================================================
+    
+    def __getstate__(self):
+        """A los procesos worker sólo viajan las colas y la configuración"""
+        return {key: self.__dict__[key] for key in SHARED_STATE}
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+    
+    def _is_owner(self) -> bool:
+        return os.getpid() == self._owner_pid
+    
+    def _require_owner(self):
+        if not self._is_owner():
+            raise RuntimeError("Task table lives in the process that created the QueueManager")
+    
+    def ping(self) -> bool:
+        return True
+    
+    def serve_tasks(self):
+        """🛎️ Aplicar claims/resultados de los workers y reencolar tasks vencidos (proceso dueño)"""
+        self._require_owner()
+        if self._serve_thread and self._serve_thread.is_alive():
+            return
+        self._stop_serving.clear()
+        self._serve_thread = threading.Thread(target=self._serve_loop, name="TaskQueueServe", daemon=True)
+        self._serve_thread.start()
+    
+    def _serve_loop(self):
+        maintenance_interval = min(15.0, self.visibility_timeout / 3)
+        last_maintenance = time.time()
+        while not self._stop_serving.is_set():
+            try:
+                message = self.result_queue.get(timeout=1.0)
+                with self._changed:
+                    self._apply(message)
+            except Empty:
+                pass
+            except Exception as e:
+                logger.error(f"❌ Error applying worker message: {e}")
+            
+            if time.time() - last_maintenance >= maintenance_interval:
+                last_maintenance = time.time()
+                reaped = self.requeue_expired_tasks()
+                if reaped['requeued'] or reaped['failed']:
+                    logger.warning(f"♻️ Reaper: {reaped}")
+                if self.result_ttl:
+                    self.clear_completed_tasks(self.result_ttl)
+    
+    def _notify(self, message: ResultMessage):
+        """Claim o resultado de un worker: directo en el dueño, por result_queue desde otro proceso"""
+        if self._is_owner():
+            with self._changed:
+                self._apply(message)
+        else:
+            self.result_queue.put(message)
+    
+    def _apply(self, message: ResultMessage):
+        """Transición de estado de un task (con self._changed tomado)"""
+        if message.status == 'released':
+            self._requeue_where(lambda task: task['worker_id'] == message.worker_id)
+            return
+        if message.status == 'returned':
+            self._requeue_where(lambda task: task['id'] == message.task_id and task['worker_id'] == message.worker_id,
+                                count_retry=False)
+            return
+        task = self._tasks.get(message.task_id)
+        if task is None or task['status'] in FINISHED_STATUSES:
+            return
+        
+        if message.status == 'processing':
+            if task['status'] == 'pending':
+                self._move(task, 'processing', worker_id=message.worker_id, started_at=message.timestamp)
+                parent = self._tasks.get(task.get('parent_id'))
+                if parent and parent['status'] == 'pending':
+                    parent.update(status='processing', started_at=message.timestamp)
+            self._inflight[task['id']] = time.time() + self.visibility_timeout
+            return
+        
+        if message.success:
+            self._finish(task, 'completed', message.timestamp, result=message.result)
+        else:
+            self._finish(task, 'failed', message.timestamp, error=message.error)
+    
+    def _move(self, task: Dict[str, Any], status: str, **fields):
+        self._counters[task['status']] -= 1
+        self._counters[status] += 1
+        task.update(status=status, **fields)
+    
+    def _finish(self, task: Dict[str, Any], status: str, now: float, **fields):
+        """Estado final: contadores, job padre y aviso a quien espera en watch_tasks"""
+        self._inflight.pop(task['id'], None)
+        self._move(task, status, completed_at=now, **fields)
+        
+        parent = self._tasks.get(task.get('parent_id'))
+        if parent:
+            self._job_results.setdefault(parent['id'], []).append(task['id'])
+            parent['done' if status == 'completed' else 'failed'] += 1
+            if parent['done'] + parent['failed'] >= parent['total']:
+                parent.update(status='completed' if parent['done'] else 'failed', completed_at=now)
+        
+        # Single-flight: los tasks ligados terminan con el mismo resultado o error
+        if self._flights.get(task.get('fingerprint')) == task['id']:
+            del self._flights[task['fingerprint']]
+        for follower_id in self._followers.pop(task['id'], []):
+            follower = self._tasks.get(follower_id)
+            if follower and follower['status'] == 'pending':
+                self._finish(follower, status, now, **fields)
+        self._changed.notify_all()
+    
+    def _new_task(self, task_data: Dict, lane: str, **fields) -> Dict[str, Any]:
+        task = {
+            'id': str(uuid.uuid4()),
+            'data': task_data,
+            'status': 'pending',
+            'created_at': time.time(),
+            'worker_id': None,
+            'started_at': None,
+            'completed_at': None,
+            'retries': 0,
+            'priority': lane,
+            **fields
+        }
+        self._tasks[task['id']] = task
+        return task
+    
+    def _stage(self, task_data: Dict, lane: str, **fields) -> Dict[str, Any]:
+        """
+        Crear un task pendiente (con self._changed tomado)
+        
+        Con single-flight, si hay uno idéntico en vuelo el task queda ligado
+        a él ('follows'), no se encola y termina con su resultado.
+        """
+        self._counters['pending'] += 1
+        self._counters['total'] += 1
+        if not self.single_flight:
+            return self._new_task(task_data, lane, **fields)
+        
+        fingerprint = task_fingerprint(task_data)
+        task = self._new_task(task_data, lane, fingerprint=fingerprint, **fields)
+        self._dedupe['checked'] += 1
+        leader = self._tasks.get(self._flights.get(fingerprint))
+        if leader and leader['status'] in ('pending', 'processing'):
+            task['follows'] = leader['id']
+            self._followers.setdefault(leader['id'], []).append(task['id'])
+            self._dedupe['hits'] += 1
+            return task
+        self._flights[fingerprint] = task['id']
+        return task
+    
+    def _queue_task(self, task: Dict[str, Any]):
+        """Encolar el id en el carril del task y dejar un token para get_task"""
+        message = TaskMessage(
+            task_id=task['id'],
+            task_type="distributed",
+            filter_name=task['queue'],
+            image_data=task['data'].get('images'),
+            parameters=task['data'],
+            timestamp=time.time(),
+            priority=LANE_PRIORITY[task['priority']],
+            max_retries=self.max_retries,
+            retries=task['retries']
+        )
+        self._select_queue_by_priority(message.priority).put(message)
+        self._ready.release()
+    
+    def enqueue_many(self, tasks: List[Dict], priority=2) -> List[str]:
+        """📤 Encolar tasks (TaskQueueBackend); devuelve sus ids en el mismo orden"""
+        self._require_owner()
+        lane = priority_lane(priority)
+        with self._changed:
+            staged = [self._stage(task_data, lane, queue=route_key(task_data.get('filters', [])))
+                      for task_data in tasks]
+        for task in staged:
+            if 'follows' not in task:
+                self._queue_task(task)
+        return [task['id'] for task in staged]
+    
+    def enqueue_jobs(self, jobs: List[Dict]) -> List[str]:
+        """📦 Encolar jobs: una subtarea por imagen bajo un job padre ('workers' se ignora)"""
+        self._require_owner()
+        for job in jobs:
+            if not job['images']:
+                raise ValueError("A job needs at least one image")
+        
+        job_ids, staged = [], []
+        with self._changed:
+            for job in jobs:
+                lane = priority_lane(job.get('priority', 2))
+                task_data = job['task_data']
+                parent = self._new_task(task_data, lane, kind='job', total=len(job['images']), done=0, failed=0)
+                for image_path in job['images']:
+                    subtask_data = {**task_data, 'images': [image_path]}
+                    staged.append(self._stage(subtask_data, lane, parent_id=parent['id'],
+                                              queue=route_key(task_data.get('filters', []))))
+                job_ids.append(parent['id'])
+        for task in staged:
+            if 'follows' not in task:
+                self._queue_task(task)
+        return job_ids
+    
+    def get_task(self, worker_id: str, timeout: int = 5, capabilities: List[str] = None) -> Optional[Dict]:
+        """
+        📥 Reclamar el siguiente task (desde cualquier proceso)
+        
+        Carriles por prioridad (high -> normal -> low; un mensaje recién
+        encolado tarda un instante en verse en su mp.Queue). Todos los
+        workers locales son iguales: `capabilities` no se usa para rutear.
+        """
+        if not self._ready.acquire(timeout=max(0, timeout)):
+            return None
+        
+        # Hay token: el mensaje está encolado o a punto (mp.Queue lo envía desde un thread)
+        message = None
+        while message is None:
+            for queue in (self.high_priority_queue, self.task_queue, self.low_priority_queue):
+                try:
+                    message = queue.get_nowait()
+                    break
+                except Empty:
+                    continue
+            else:
+                time.sleep(0.001)
+        
+        started_at = time.time()
+        self._notify(ResultMessage(task_id=message.task_id, success=False, worker_id=worker_id,
+                                   process_id=os.getpid(), timestamp=started_at, status='processing'))
+        return {
+            'id': message.task_id,
+            'data': message.parameters,
+            'status': 'processing',
+            'worker_id': worker_id,
+            'started_at': started_at,
+            'retries': message.retries
+        }
+    
+    def complete_task(self, task_id: str, result: Dict, worker_id: str = None):
+        """✅ Marcar task como completado con su resultado"""
+        self._notify(ResultMessage(task_id=task_id, success=True, result=result, worker_id=worker_id,
+                                   process_id=os.getpid(), timestamp=time.time()))
+    
+    def fail_task(self, task_id: str, error: str, worker_id: str = None):
+        """❌ Marcar task como fallido"""
+        self._notify(ResultMessage(task_id=task_id, success=False, error=error, worker_id=worker_id,
+                                   process_id=os.getpid(), timestamp=time.time()))
+    
+    def touch_task(self, task_id: str) -> bool:
+        """⏱️ Extender la visibilidad de un task en proceso"""
+        self._notify(ResultMessage(task_id=task_id, success=False, process_id=os.getpid(),
+                                   timestamp=time.time(), status='processing'))
+        return True
+    
+    def _requeue_where(self, predicate: Callable[[Dict[str, Any]], bool],
+                       count_retry: bool = True) -> Dict[str, int]:
+        """Reencolar los tasks en proceso que cumplen `predicate` (con self._changed tomado)"""
+        counts = {'requeued': 0, 'failed': 0}
+        now = time.time()
+        for task_id in list(self._inflight):
+            task = self._tasks.get(task_id)
+            if task is None or task['status'] != 'processing':
+                self._inflight.pop(task_id, None)
+                continue
+            if not predicate(task):
+                continue
+            self._inflight.pop(task_id)
+            if count_retry:
+                task['retries'] += 1
+            if task['retries'] > self.max_retries:
+                error = f"Task lost by its worker {task['retries']} times (visibility timeout expired)"
+                self._finish(task, 'failed', now, error=error)
+                counts['failed'] += 1
+            else:
+                self._move(task, 'pending', worker_id=None, started_at=None)
+                self._queue_task(task)
+                counts['requeued'] += 1
+        return counts
+    
+    def requeue_expired_tasks(self, limit: int = 100) -> Dict[str, int]:
+        """♻️ Reencolar tasks cuyo timeout de visibilidad venció (lo hace el proceso dueño)"""
+        if not self._is_owner():
+            return {'requeued': 0, 'failed': 0}
+        now = time.time()
+        with self._changed:
+            expired = [task_id for task_id, deadline in self._inflight.items() if deadline <= now][:limit]
+            return self._requeue_where(lambda task: task['id'] in expired)
+    
+    def requeue_worker_tasks(self, worker_id: str) -> Dict[str, int]:
+        """
+        ↩️ Reencolar los tasks que un worker reclamó y no terminó
+        
+        Desde un proceso worker se pide al dueño (los contadores no se conocen ahí).
+        """
+        if not self._is_owner():
+            self.result_queue.put(ResultMessage(task_id='', success=False, worker_id=worker_id,
+                                                process_id=os.getpid(), timestamp=time.time(),
+                                                status='released'))
+            return {'requeued': 0, 'failed': 0}
+        with self._changed:
+            return self._requeue_where(lambda task: task['worker_id'] == worker_id)
+    
+    def release_tasks(self, worker_id: str, task_ids: List[str]) -> int:
+        """
+        🔙 Devolver a su cola los tasks que un worker reclamó y nunca empezó
+        
+        Sin contar un reintento: un reinicio ordenado no hace fallar tasks que no corrieron.
+        Desde un proceso worker se pide al dueño, un mensaje por task.
+        """
+        if self._is_owner():
+            returned = set(task_ids)
+            with self._changed:
+                return self._requeue_where(
+                    lambda task: task['id'] in returned and task['worker_id'] == worker_id,
+                    count_retry=False)['requeued']
+        for task_id in task_ids:
+            self._notify(ResultMessage(task_id=task_id, success=False, worker_id=worker_id,
+                                       process_id=os.getpid(), timestamp=time.time(),
+                                       status='returned'))
+        return len(task_ids)
+    
+    def get_task_status(self, task_id: str) -> Optional[Dict]:
+        """📋 Estado de un task o job (copia)"""
+        self._require_owner()
+        with self._changed:
+            task = self._tasks.get(task_id)
+            return dict(task) if task else None
+    
+    def get_job_results(self, job_id: str) -> List[Dict]:
+        """📦 Resultados de las subtareas terminadas de un job, en orden de finalización"""
+        self._require_owner()
+        results = []
+        with self._changed:
+            for task_id in self._job_results.get(job_id, []):
+                task = self._tasks.get(task_id)
+                if task is None:
+                    results.append({'task_id': task_id, 'status': 'expired'})
+                elif task['status'] == 'completed':
+                    results.append({'task_id': task_id, 'status': 'completed', 'result': task.get('result')})
+                else:
+                    results.append({'task_id': task_id, 'status': task['status'], 'error': task.get('error', '')})
+        return results
+    
+    def watch_tasks(self, task_ids: List[str], timeout: float):
+        """⏳ Devolver (task_id, estado) según terminan los tasks, hasta `timeout` segundos"""
+        self._require_owner()
+        deadline = time.time() + timeout
+        pending = list(dict.fromkeys(task_ids))
+        while pending:
+            with self._changed:
+                finished = [task_id for task_id in pending
+                            if task_id not in self._tasks or self._tasks[task_id]['status'] in FINISHED_STATUSES]
+                if not finished:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return
+                    self._changed.wait(remaining)
+                    continue
+            for task_id in finished:
+                pending.remove(task_id)
+                yield task_id, self.get_task_status(task_id)
+    
+    def clear_completed_tasks(self, older_than_seconds: int = 3600, batch_size: int = 500) -> int:
+        """🧹 Borrar tasks terminados hace más de `older_than_seconds` (proceso dueño)"""
+        if not self._is_owner():
+            return 0
+        cutoff = time.time() - older_than_seconds
+        with self._changed:
+            expired = [task_id for task_id, task in self._tasks.items()
+                       if task['status'] in FINISHED_STATUSES and (task['completed_at'] or 0) < cutoff]
+            for task_id in expired:
+                del self._tasks[task_id]
+                self._job_results.pop(task_id, None)
+        return len(expired)
+    
 # =====================================================================
 # 🧪 DEMO Y TESTING
 # =====================================================================